@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+"""
+    Copyright 2015 Will Boyce
+
+    Offline end-to-end benchmarks for ec2hashcat.
+
+    Runs ``put``, ``list``, ``crack``, ``get`` and ``stop`` against moto's S3/EC2 stand-ins with SSH
+    replaced by a fake transport, over synthetic hashlists and wordlists of growing size. For every run
+    the number of AWS API calls (by operation), SSH roundtrips, bytes transferred and the wall-clock time
+    spent in each phase are recorded and emitted as JSON, so that regressions in the number of calls or
+    in the scaling behaviour can be caught without touching real instances::
+
+        % pip install -r bench/requirements.txt
+        % python bench/offline.py --sizes 1000 10000 100000 > bench.json
+"""
+from __future__ import print_function
+
+import argparse
+from collections import defaultdict
+from contextlib import contextmanager
+import hashlib
+import json
+import os
+import random
+import shutil
+import string
+import sys
+import tempfile
+import time
+
+import botocore.client
+import botocore.exceptions
+from moto import mock_ec2, mock_s3
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import ec2hashcat.commands  # pylint: disable=unused-import,wrong-import-position
+from ec2hashcat import aws, utils  # pylint: disable=wrong-import-position
+from ec2hashcat.aws import ec2 as aws_ec2, ssh as aws_ssh  # pylint: disable=wrong-import-position
+from ec2hashcat.commands.base import Handler, Registry  # pylint: disable=wrong-import-position
+
+
+class Recorder(object):
+    """ Accumulates AWS calls, SSH roundtrips, bytes transferred and phase timings """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.aws_calls = defaultdict(int)
+        self.ssh_calls = defaultdict(int)
+        self.bytes = defaultdict(int)
+        self.phases = defaultdict(float)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.phases[name] += time.time() - start
+
+    def as_dict(self):
+        return {
+            'aws_calls': dict(self.aws_calls),
+            'aws_calls_total': sum(self.aws_calls.values()),
+            'ssh_calls': dict(self.ssh_calls),
+            'ssh_calls_total': sum(self.ssh_calls.values()),
+            'bytes': dict(self.bytes),
+            'phases': dict(self.phases),
+        }
+
+
+RECORDER = Recorder()
+
+
+def _body_length(body):
+    if body is None:
+        return 0
+    if isinstance(body, basestring):
+        return len(body)
+    if hasattr(body, '__len__'):
+        return len(body)
+    pos = body.tell()
+    body.seek(0, os.SEEK_END)
+    length = body.tell() - pos
+    body.seek(pos)
+    return length
+
+
+def install_aws_counter():
+    """ Count every botocore API call, and the bytes moved by S3 object transfers """
+    make_api_call = botocore.client.BaseClient._make_api_call  # pylint: disable=protected-access
+
+    def counting_api_call(client, operation_name, api_params):
+        RECORDER.aws_calls[operation_name] += 1
+        if operation_name in ('PutObject', 'UploadPart'):
+            RECORDER.bytes['s3_upload'] += _body_length(api_params.get('Body'))
+        response = make_api_call(client, operation_name, api_params)
+        if operation_name == 'GetObject':
+            RECORDER.bytes['s3_download'] += response.get('ContentLength', 0)
+        return response
+    botocore.client.BaseClient._make_api_call = counting_api_call  # pylint: disable=protected-access
+
+
+def install_fake_transport():
+    """ Replace the SSH transport and fabric's remote operations, and anything else that would leave the machine """
+    def fake_run(command, **kwargs):  # pylint: disable=unused-argument
+        RECORDER.ssh_calls['run'] += 1
+
+    def fake_ssh_run(connection, command, **kwargs):  # pylint: disable=unused-argument
+        RECORDER.ssh_calls['run'] += 1
+        return 0, ''
+
+    def fake_ssh_put(connection, local, remote, mode='0644'):  # pylint: disable=unused-argument
+        RECORDER.ssh_calls['put'] += 1
+        RECORDER.bytes['ssh_put'] += os.path.getsize(local)
+
+    def fake_ssh_connect(connection):
+        RECORDER.ssh_calls['connect'] += 1
+        return object()
+
+    def fake_open_shell(*args, **kwargs):  # pylint: disable=unused-argument
+        RECORDER.ssh_calls['open_shell'] += 1
+
+    aws_ec2.run = fake_run
+    aws_ec2.open_shell = fake_open_shell
+    aws_ec2.sleep = lambda secs: None
+    aws_ssh.SshConnection._connect = fake_ssh_connect  # pylint: disable=protected-access
+    aws_ssh.SshConnection.run = fake_ssh_run
+    aws_ssh.SshConnection.put = fake_ssh_put
+    # commands are loaded by ec2hashcat.commands under their bare module names, so patch whichever modules
+    # the registered command classes actually came from
+    for _, cmd_cls in Registry.get_commands():
+        module = sys.modules[cmd_cls.__module__]
+        if hasattr(module, 'sleep'):
+            module.sleep = lambda secs: None
+    utils.get_external_ip = lambda: '127.0.0.1'
+
+    # moto drops the CidrIp of ingress rules, so the existing mask is never seen and re-adding it fails
+    add_mask = aws.SecurityGroup.add_mask
+
+    def tolerant_add_mask(secgrp, mask):
+        try:
+            add_mask(secgrp, mask)
+        except botocore.exceptions.ClientError as err:
+            if err.response['Error']['Code'] != 'InvalidPermission.Duplicate':
+                raise
+    aws.SecurityGroup.add_mask = tolerant_add_mask
+
+
+def install_phase_timers():
+    """ Time each phase of ``Crack.handle`` """
+    phases = ('_get_batch', '_prep', '_prefilter', '_upload_files', '_index_files', '_schedule',
+              '_check_ledger', '_bootstrap_instance', '_generate_script', '_start_task')
+
+    def timed(name, func):
+        def wrapper(*args, **kwargs):
+            with RECORDER.phase(name.lstrip('_')):
+                return func(*args, **kwargs)
+        return wrapper
+    crack_cls = Registry.get_command('crack')
+    for name in phases:
+        if hasattr(crack_cls, name):
+            setattr(crack_cls, name, timed(name, getattr(crack_cls, name)))
+
+
+def write_hashlist(path, size, rnd):
+    with open(path, 'w') as hashlist_fh:
+        for num in xrange(size):
+            hashlist_fh.write('{}\n'.format(hashlib.md5('{}-{}'.format(num, rnd.random())).hexdigest()))
+
+
+def write_wordlist(path, size, rnd):
+    with open(path, 'w') as wordlist_fh:
+        for _ in xrange(size):
+            wordlist_fh.write('{}\n'.format(''.join(rnd.choice(string.ascii_lowercase)
+                                                    for _ in xrange(rnd.randint(6, 12)))))
+
+
+def write_config(path, ami_id):
+    # moto rejects ephemeral block device mappings, which instance types with an NVMe store do not need
+    with open(path, 'w') as cfg_fh:
+        cfg_fh.write('\n'.join([
+            'aws-key: bench',
+            'aws-secret: bench',
+            'aws-region: us-east-1',
+            's3-bucket: ec2hashcat-bench',
+            'ec2-key-file: {}'.format(os.path.join(os.path.dirname(path), 'bench.pem')),
+            'ec2-no-spot-instance: true',
+            'ec2-instance-type: g4dn.xlarge',
+        ]) + '\n')
+    aws.Ec2.region_ami_map['us-east-1'] = ami_id
+
+
+def run_command(name, args, size):
+    RECORDER.reset()
+    start = time.time()
+    with RECORDER.phase('total'):
+        Handler(args).dispatch()
+    result = {'command': name, 'size': size, 'wall': time.time() - start}
+    result.update(RECORDER.as_dict())
+    return result
+
+
+def run_suite(size, workdir, rnd):
+    hashlist, wordlist = 'bench{}.md5'.format(size), 'bench{}.txt'.format(size)
+    write_hashlist(hashlist, size, rnd)
+    write_wordlist(wordlist, size, rnd)
+    session = 'bench{}'.format(size)
+    results = [
+        run_command('put', ['-y', 'put', '-f', 'wordlists', wordlist], size),
+        run_command('list', ['list', 'files'], size),
+        run_command('crack', ['-q', '-y', 'crack', '--no-attach', '--no-shutdown', '-s', session,
+                              '-a0', '-m0', hashlist, wordlist], size),
+        run_command('get', ['get', '-f', 'wordlists', wordlist], size),
+        run_command('list-sessions', ['list', 'sessions'], size),
+        run_command('stop', ['stop', session], size),
+    ]
+    for name in (hashlist, wordlist):
+        os.unlink(os.path.join(workdir, name))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline end-to-end ec2hashcat benchmarks')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='number of hashes/words in each synthetic hashlist/wordlist')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--outfile', help='write results here instead of stdout')
+    args = parser.parse_args()
+
+    install_aws_counter()
+    install_fake_transport()
+    install_phase_timers()
+    mocks = [mock_s3(), mock_ec2()]
+    for mock in mocks:
+        mock.start()
+    workdir = tempfile.mkdtemp()
+    cwd, home = os.getcwd(), os.environ.get('HOME')
+    os.environ['HOME'] = workdir
+    os.chdir(workdir)
+    try:
+        ec2 = aws.Ec2(argparse.Namespace(aws_key='bench', aws_secret='bench', aws_region='us-east-1'))
+        write_config(os.path.join(workdir, 'ec2hashcat.yml'), list(ec2.ec2.images.all())[0].id)
+        rnd = random.Random(args.seed)
+        results = []
+        stdout = sys.stdout
+        sys.stdout = sys.stderr  # keep command output out of the JSON
+        try:
+            for size in args.sizes:
+                results.extend(run_suite(size, workdir, rnd))
+        finally:
+            sys.stdout = stdout
+    finally:
+        os.chdir(cwd)
+        if home is not None:
+            os.environ['HOME'] = home
+        shutil.rmtree(workdir)
+        for mock in mocks:
+            mock.stop()
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.outfile:
+        with open(args.outfile, 'w') as out_fh:
+            out_fh.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@ from __future__ import print_function
 
 from collections import defaultdict
 from datetime import datetime
+import base64
 import hashlib
 import os
 import tempfile
@@ -10,10 +11,11 @@ from time import sleep
 
 import botocore
 from boto3.session import Session
-from fabric.api import cd, env, hide, open_shell, put, run
-from fabric.contrib.files import append
+from fabric.api import cd, env, hide, open_shell, run
 
-from ec2hashcat import exceptions
+from ec2hashcat import exceptions, profile
+from ec2hashcat.aws.ssh import SshPool
+from ec2hashcat.placement import DataPlacement
 
 
 class Ec2(object):
@@ -34,6 +36,15 @@ class Ec2(object):
             'Name': 'tag:service',
             'Values': ['ec2hashcat']}])
 
+    def get_running_instances(self, identifiers=()):
+        """ Return the running instances with any of the ids or session names ``identifiers``, or all of them """
+        instances = self.get_instances().filter(Filters=[{'Name': 'instance-state-name', 'Values': ['running']}])
+        if not identifiers:
+            return list(instances)
+        return [instance for instance in instances
+                if instance.id in identifiers or
+                any(tag['Key'] == 'ec2hashcat' and tag['Value'] in identifiers for tag in instance.tags or [])]
+
     def find_running_instance(self, identifier):
         attr, values = '', [identifier]
         if identifier.startswith('i-'):
@@ -96,17 +107,26 @@ class Ec2(object):
             return data['SpotInstanceRequests'][0]['SpotPrice']
         return '-'
 
-    def start_instance(self, tag=None):
+    def start_instance(self, tag=None, user_data=None):
         instance = Ec2Instance(self.cfg)
-        instance.start(tag)
+        instance.start(tag, user_data=user_data)
         return instance
 
 
 class Ec2Instance(object):
     """ Utility class for interacting with an EC2 Instance """
+    metadata_url = 'http://169.254.169.254/latest/meta-data'
+    user_data_limit = 16 * 1024
+    watchdog_fn = '/tmp/ec2hashcat-watchdog.sh'
+    idle_state_fn = '/tmp/ec2hashcat.idle'
+    busy_state_fn = '/tmp/ec2hashcat.busy'  # holds the pid of a worker while it holds a claim
+    idle_gpu_utilization = 5  # percent
+    credentials_duration = 36 * 3600  # the longest session token STS issues to an IAM user
+
     def __init__(self, cfg, instance_id=None):
         self.cfg = cfg
         self.instance = None
+        self.spot_request_id = None
         self.secgrp = SecurityGroup(self.cfg)
         aws = Session(aws_access_key_id=self.cfg.aws_key,
                       aws_secret_access_key=self.cfg.aws_secret,
@@ -120,18 +140,27 @@ class Ec2Instance(object):
             env.key_filename = os.path.expanduser(self.cfg.ec2_key_file)
             env.connection_attempts = 5
 
-    def start(self, tag=None):
-        """ Start the instance. """
+    def start(self, tag=None, user_data=None):
+        """ Start the instance.
+
+            When ``user_data`` is given the instance runs it at boot and tags itself, so this returns as soon
+            as the instance has been requested rather than waiting for it to become reachable over SSH.
+        """
         ami_id = Ec2.region_ami_map[self.cfg.aws_region]
         ami_blockdevmap = self.ec2_client.describe_images(ImageIds=[ami_id])['Images'][0]['BlockDeviceMappings']
-        ami_blockdevmap[0]['Ebs']['VolumeSize'] = self.cfg.ec2_volume_size
-        del ami_blockdevmap[0]['Ebs']['Encrypted']
+        ami_blockdevmap[0]['Ebs']['VolumeSize'] = self.cfg.ec2_volume_size or DataPlacement.min_volume_size
+        ami_blockdevmap[0]['Ebs'].pop('Encrypted', None)
+        ami_blockdevmap.extend(DataPlacement.ephemeral_mappings(self.cfg.ec2_instance_type))
         launch_spec = dict(
             ImageId=ami_id,
             KeyName=self.cfg.ec2_key_name,
             SecurityGroups=[self.cfg.ec2_security_group],
             InstanceType=self.cfg.ec2_instance_type,
             BlockDeviceMappings=ami_blockdevmap)
+        if user_data is not None:
+            launch_spec['UserData'] = user_data
+        if self.cfg.ec2_instance_profile is not None:
+            launch_spec['IamInstanceProfile'] = dict(Name=self.cfg.ec2_instance_profile)
         if not self.cfg.ec2_spot_instance:
             print("Launching EC2 Instance with Type '{}' using AMI '{}'"
                   .format(self.cfg.ec2_instance_type, ami_id))
@@ -149,15 +178,22 @@ class Ec2Instance(object):
             price = Ec2(self.cfg).calculate_spot_price()
             print("Requesting Spot Instance of type '{}' at {} USD/hour using AMI '{}'... this will take a while!"
                   .format(self.cfg.ec2_instance_type, price, ami_id))
+            if user_data is not None:  # unlike RunInstances, spot launch specifications are not encoded for us
+                launch_spec['UserData'] = base64.b64encode(user_data)
             request_id = self.ec2_client.request_spot_instances(
                 SpotPrice=price,
                 AvailabilityZoneGroup=zone,
                 ClientToken='ec2hashcat-{}'.format(datetime.now().strftime('%Y%m%d%H%M%S')),
                 InstanceCount=1,
                 LaunchSpecification=launch_spec)['SpotInstanceRequests'][0]['SpotInstanceRequestId']
+            self.spot_request_id = request_id
+            if user_data is not None:
+                print("Requested Spot Instance '{}', it will start its task once fulfilled".format(request_id))
+                return
             try:
                 waiter = self.ec2_client.get_waiter('spot_instance_request_fulfilled')
-                waiter.wait(SpotInstanceRequestIds=[request_id])
+                with profile.phase('spot fulfilment'):
+                    waiter.wait(SpotInstanceRequestIds=[request_id])
             except KeyboardInterrupt:
                 self.ec2_client.cancel_spot_instance_requests(SpotInstanceRequestIds=[request_id])
                 raise
@@ -173,12 +209,17 @@ class Ec2Instance(object):
                 SpotInstanceRequestIds=[request_id])['SpotInstanceRequests'][0]['InstanceId']
             self.instance = self.ec2.Instance(instance_id)
 
-        self.wait_until_ready()
+        if user_data is not None:
+            print("Requested Instance '{}', it will start its task once booted".format(self.instance.id))
+            return
+        with profile.phase('wait until ready'):
+            self.wait_until_ready()
         self.add_tags({'service': 'ec2hashcat'})
         if tag is not None:
             self.set_session_tag(tag)
-        self.setup_fabric()
-        self.setup_awscli()
+        with profile.phase('setup awscli'):
+            self.setup_fabric()
+            self.setup_awscli()
 
     def add_tags(self, tags_dict):
         tags = [dict(Key=key, Value=value) for key, value in tags_dict.iteritems()]
@@ -202,29 +243,175 @@ class Ec2Instance(object):
         if self.instance.public_ip_address is None:
             return self.wait_until_ready(wait_time)
 
+    def connection(self):
+        """ Return the SSH connection to the instance, opened once and shared by everything in this process """
+        return SshPool.shared(os.path.expanduser(self.cfg.ec2_key_file)).connection(self.instance.public_ip_address)
+
     def setup_fabric(self):
-        """ Setup the fabric env """
+        """ Setup the fabric env, which is only used for interactive sessions (see execute_command) """
         print("Configuring Instance '{}' on IP '{}'..."
               .format(self.instance.id, self.instance.public_ip_address))
         env.host_string = 'ubuntu@{}'.format(self.instance.public_ip_address)
         env.key_filename = os.path.expanduser(self.cfg.ec2_key_file)
         env.connection_attempts = 5
 
+    def awscli_config(self, credentials=None):
+        """ Return the lines of the aws cli config for the instance
+
+            Instances launched with an instance profile use its role, otherwise ``credentials`` (as returned by
+            ``temporary_credentials``) or else the configured access key.
+        """
+        config = ['[default]']
+        if self.cfg.ec2_instance_profile is None and credentials is not None:
+            config.extend(['aws_access_key_id = {}'.format(credentials['AccessKeyId']),
+                           'aws_secret_access_key = {}'.format(credentials['SecretAccessKey']),
+                           'aws_session_token = {}'.format(credentials['SessionToken'])])
+        elif self.cfg.ec2_instance_profile is None:
+            config.extend(['aws_access_key_id = {}'.format(self.cfg.aws_key),
+                           'aws_secret_access_key = {}'.format(self.cfg.aws_secret)])
+        config.append('region = {}'.format(self.cfg.aws_region))
+        return config
+
+    def temporary_credentials(self):
+        """ Return short-lived credentials for the instance, for where the access key itself would be exposed """
+        sts = Session(aws_access_key_id=self.cfg.aws_key, aws_secret_access_key=self.cfg.aws_secret,
+                      region_name=self.cfg.aws_region).client('sts')
+        try:
+            return sts.get_session_token(DurationSeconds=self.credentials_duration)['Credentials']
+        except botocore.exceptions.ClientError as err:
+            raise exceptions.EC2InstanceError(
+                "Could not get temporary credentials for the instance ({}), use --ec2-instance-profile".format(
+                    err.response['Error']['Message']))
+
     def setup_awscli(self):
         """ Setup aws cli on the instance """
-        aws_config = ['[default]',
-                      'aws_access_key_id = {}'.format(self.cfg.aws_key),
-                      'aws_secret_access_key = {}'.format(self.cfg.aws_secret),
-                      'region = {}'.format(self.cfg.aws_region)]
         self.execute_command('mkdir -p /home/ubuntu/.aws')
-        self.create_file('/home/ubuntu/.aws/config', aws_config)
+        self.create_file('/home/ubuntu/.aws/config', self.awscli_config())
+
+    @classmethod
+    def pretermination_command(cls, command):
+        """ Return a command starting a screen which runs ``command`` when a termination notice is received """
+        cmd = 'while sleep 5; do curl -s {}/spot/termination-time | grep -q .*T.*Z && {} && break; done'.format(
+            cls.metadata_url, command)
+        return 'screen -dmS termination_handler /bin/bash -c "{}"'.format(cmd)
 
     def set_pretermination_command(self, command):
         """ Sets a command to executed when a spot-instance termination notice is received. """
-        metadata_url = 'http://169.254.169.254/latest/meta-data/spot/termination-time'
-        cmd = 'while sleep 5; do curl -s {} | grep -q .*T.*Z && {} && break; done'.format(metadata_url, command)
-        self.execute_command('screen -dmS termination_handler /bin/bash -c "{}"'
-                             .format(cmd), pty=False)
+        self.execute_command(self.pretermination_command(command), pty=False)
+
+    @classmethod
+    def idle_check_commands(cls):
+        """ Return commands defining ``is_idle``, which succeeds when nothing on the instance is doing work
+
+            Work is a running hashcat, a running S3 transfer, a worker holding a claim (which downloads and merges
+            without either), an attached screen or a busy GPU.
+        """
+        return ['is_idle() {',
+                'pgrep cudaHashcat >/dev/null && return 1',
+                'test -f {} && kill -0 "$(cat {})" 2>/dev/null && return 1'.format(cls.busy_state_fn,
+                                                                                  cls.busy_state_fn),
+                "pgrep -f 'aws s3' >/dev/null && return 1",
+                "screen -ls | grep -q '(Attached)' && return 1",
+                'nvidia-smi --query-gpu=utilization.gpu --format=csv,noheader,nounits 2>/dev/null | '
+                "awk '$1 >= {} {{ busy = 1 }} END {{ exit busy }}'".format(cls.idle_gpu_utilization),
+                '}']
+
+    def flush_commands(self, session, paths):
+        """ Return commands uploading whichever files matching ``paths`` exist to ``reaped/<session>/<instance>/`` """
+        return ['for FN in {}; do test -s "$FN" && aws s3 cp "$FN" "s3://{}/reaped/{}/$INSTANCE_ID/${{FN//\\//_}}" '
+                '>/dev/null; done'.format(' '.join(paths), self.cfg.s3_bucket, session)]
+
+    def watchdog_commands(self, session, idle_seconds, paths):
+        """ Return commands starting a screen which, once the instance has been idle for ``idle_seconds``,
+            flushes ``paths`` to S3 and terminates the instance
+        """
+        script = ['INSTANCE_ID="$(wget -q -O - {}/instance-id)"'.format(self.metadata_url)]
+        script.extend(self.idle_check_commands())
+        script.extend([
+            'rm -f {}'.format(self.idle_state_fn),
+            'while sleep 60; do',
+            'if is_idle; then',
+            'test -f {} || date +%s > {}'.format(self.idle_state_fn, self.idle_state_fn),
+            'if [ $(($(date +%s) - $(cat {}))) -ge {} ]; then'.format(self.idle_state_fn, idle_seconds)])
+        script.extend(self.flush_commands(session, paths))
+        script.extend([
+            'aws ec2 terminate-instances --instance-ids "$INSTANCE_ID" >/dev/null || sudo poweroff',
+            'break',
+            'fi',
+            'else',
+            'rm -f {}'.format(self.idle_state_fn),
+            'fi',
+            'done'])
+        commands = self.file_commands(self.watchdog_fn, self.script_contents(script), '0755')
+        commands.append('screen -XS idle_watchdog quit >/dev/null 2>&1; screen -dmS idle_watchdog {}'.format(
+            self.watchdog_fn))
+        return commands
+
+    def set_watchdog(self, session, idle_seconds, paths):
+        """ Start a watchdog terminating the instance once it has been idle for ``idle_seconds`` """
+        for command in self.watchdog_commands(session, idle_seconds, paths):
+            self.execute_command(command, pty=False)
+
+    def headless_commands(self, tag=None):
+        """ Return the commands which configure a headless instance: the aws cli and its own tags
+
+            These end up in the instance's user data, which can be read from the instance metadata and by anyone
+            able to describe the instance, so never hold the access key: the instance uses the role of its instance
+            profile or, without one, temporary credentials.
+        """
+        tags = [('service', 'ec2hashcat')]
+        if tag is not None:
+            tags.append(('ec2hashcat', tag))
+        credentials = None
+        if self.cfg.ec2_instance_profile is None:
+            credentials = self.temporary_credentials()
+        commands = ['mkdir -p /home/ubuntu/.aws']
+        commands.extend(self.file_commands('/home/ubuntu/.aws/config', ''.join(
+            '{}\n'.format(line) for line in self.awscli_config(credentials))))
+        commands.append('chmod 0600 /home/ubuntu/.aws/config')
+        commands.append('INSTANCE_ID="$(wget -q -O - {}/instance-id)"'.format(self.metadata_url))
+        commands.append('aws ec2 create-tags --resources "$INSTANCE_ID" --tags {}'.format(
+            ' '.join("'Key={},Value={}'".format(key, value) for key, value in tags)))
+        return commands
+
+    @classmethod
+    def file_commands(cls, filename, contents, mode=None):
+        """ Return commands which write ``contents`` to ``filename`` on the instance """
+        commands = ["echo '{}' | base64 -d > {}".format(base64.b64encode(contents), filename)]
+        if mode is not None:
+            commands.append('chmod {} {}'.format(mode, filename))
+        return commands
+
+    @classmethod
+    def user_data(cls, commands, screen_name, script_url=None, delete_url=None):
+        """ Return a boot script which runs ``commands`` as ubuntu in a detached screen named ``screen_name``
+
+            If ``script_url`` is given the commands are instead fetched from there, for scripts which
+            exceed the user data size limit, and then deleted by a request to ``delete_url``.
+        """
+        script = cls.script_contents(commands)
+        script_fn = cls.script_name(commands)
+        user_data = ['#!/bin/bash']
+        if script_url is None:
+            user_data.extend(cls.file_commands(script_fn, script, '0755'))
+        else:
+            user_data.append("until curl -sf -o {} '{}'; do sleep 5; done".format(script_fn, script_url))
+            user_data.append('chmod 0755 {}'.format(script_fn))
+            if delete_url is not None:
+                user_data.append("curl -sf -X DELETE '{}' >/dev/null".format(delete_url))
+        user_data.append('chown ubuntu:ubuntu {}'.format(script_fn))
+        user_data.append("su - ubuntu -c 'cd /tmp && screen -dmS {} {}'".format(screen_name, script_fn))
+        return ''.join('{}\n'.format(line) for line in user_data)
+
+    @classmethod
+    def script_name(cls, commands):
+        return os.path.join('/tmp', '{}.sh'.format(hashlib.md5(''.join(commands)).hexdigest()))
+
+    @classmethod
+    def script_contents(cls, commands):
+        if not commands[0].startswith('#!'):
+            commands = ['#!/bin/bash'] + commands
+        return ''.join('{}\n'.format(cmd) for cmd in commands)
 
     def terminate(self, wait=False):
         """ Terminate the instance. """
@@ -236,35 +423,31 @@ class Ec2Instance(object):
 
     def create_file(self, filename, contents, mode=None):
         """ Create a file on the remote host """
-        with hide('commands'):
-            append(filename, contents)
-        if mode is not None:
-            self.execute_command('chmod {} {}'.format(mode, filename))
+        self.execute_command('\n'.join(self.file_commands(
+            filename, ''.join('{}\n'.format(line) for line in contents), mode)), pty=False)
 
     def create_script(self, commands):
         """ Create a script comprising of ``commands`` and return filename. """
-        remote_fn = '{}.sh'.format(hashlib.md5(''.join(commands)).hexdigest())
-        remote_fn = os.path.join('/tmp', remote_fn)
-        if not commands[0].startswith('#!'):
-            commands.insert(0, '#!/bin/bash')
+        remote_fn = self.script_name(commands)
         local_fh = tempfile.NamedTemporaryFile(mode='w')
-        local_fh.writelines('{}\n'.format(cmd) for cmd in commands)
+        local_fh.write(self.script_contents(commands))
         local_fh.flush()
         self.copy_file(local_fh.name, remote_fn, '0755')
         return remote_fn
 
-    @classmethod
-    def copy_file(cls, local, remote, mode='0644'):
+    def copy_file(self, local, remote, mode='0644'):
         """ Copy local file to the instance. """
-        with hide('commands'):
-            put(local_path=local, remote_path=remote, mode=mode)
+        self.connection().put(local, remote, mode)
 
     def get_file(self, name, path='/tmp'):
         """ Grab the specified file from the S3 Bucket. """
         dst = os.path.join(path, os.path.basename(name))
         print('s3://{}/{} -> ec2://{}{}'.format(self.cfg.s3_bucket, name, self.instance.id, dst))
-        cmd = 'aws s3 cp s3://{}/{} {}'.format(self.cfg.s3_bucket, name, dst)
-        self.execute_command(cmd, path='/')
+        self.execute_command(self.get_file_command(name, path), path='/')
+
+    def get_file_command(self, name, path='/tmp'):
+        """ Return the command which grabs the specified file from the S3 Bucket. """
+        return 'aws s3 cp s3://{}/{} {}'.format(self.cfg.s3_bucket, name, os.path.join(path, os.path.basename(name)))
 
     def get_hashlist(self, name, path='/tmp'):
         """ Grab a hashlist from the S3 Bucket. """
@@ -282,24 +465,27 @@ class Ec2Instance(object):
         """ Upload a file from the instance to S3 """
         print('ec2://{}{} -> s3://{}/{}'.format(
             self.instance.id, name, self.cfg.s3_bucket, os.path.join(path, os.path.basename(name))))
-        with cd('/') and hide('commands'):
-            run('aws s3 cp {} s3://{}/{}'.format(
-                name, self.cfg.s3_bucket, os.path.join(path, os.path.basename(name))))
-
-    @classmethod
-    def execute_command(cls, command, path='/tmp', pty=True, quiet=True):
-        """ Execute a command on the instance. """
-        with cd(path) and hide('running'):
-            run(command, pty=pty, quiet=quiet, warn_only=not quiet)
-
-    @classmethod
-    def create_screen(cls, name, command, attach=True, path='/tmp'):
+        self.execute_command('aws s3 cp {} s3://{}/{}'.format(
+            name, self.cfg.s3_bucket, os.path.join(path, os.path.basename(name))), path='/')
+
+    def execute_command(self, command, path='/tmp', pty=True, quiet=True):
+        """ Execute a command on the instance, returning its output
+
+            Commands which are not ``quiet`` are interactive (e.g. attaching to a screen), and are run through
+            fabric with the terminal attached. Others use the instance's own connection, so commands can be run
+            on several instances at once.
+        """
+        if not quiet:
+            with cd(path) and hide('running'):
+                return run(command, pty=pty, quiet=quiet, warn_only=not quiet)
+        return self.connection().run(command, path=path, pty=pty)[1]
+
+    def create_screen(self, name, command, attach=True, path='/tmp'):
         cmd = 'screen -{}S {} {}'.format('dm' if not attach else '', name, command)
-        cls.execute_command(cmd, path=path, pty=attach, quiet=not attach)
+        self.execute_command(cmd, path=path, pty=attach, quiet=not attach)
 
-    @classmethod
-    def attach_screen(cls, name):
-        cls.execute_command('screen -r {}'.format(name), quiet=False)
+    def attach_screen(self, name):
+        self.execute_command('screen -r {}'.format(name), quiet=False)
 
     @classmethod
     def open_shell(cls, path='/tmp'):
@@ -1,16 +1,24 @@
 """ Copyright 2015 Will Boyce """
 from __future__ import print_function
 
+from multiprocessing.pool import ThreadPool
+import hashlib
 import os
 import re
+import time
 
+import botocore
+from boto3.s3.transfer import TransferConfig
 from boto3.session import Session
 
-from ec2hashcat import exceptions
+from ec2hashcat import exceptions, utils
+from ec2hashcat.cache import FileCache
 
 
 class S3Bucket(object):
     types = ('hashlists', 'dumps', 'wordlists', 'rules')
+    delete_batch_size = 1000  # the most keys a single DeleteObjects request accepts
+    _checked_buckets = set()
 
     def __init__(self, cfg):
         self.cfg = cfg
@@ -18,7 +26,30 @@ class S3Bucket(object):
                       aws_secret_access_key=self.cfg.aws_secret,
                       region_name=self.cfg.aws_region)
         self.s3_client = aws.client('s3')
-        self.bucket = aws.resource('s3').create_bucket(Bucket=self.cfg.s3_bucket)
+        self.bucket = aws.resource('s3').Bucket(self.cfg.s3_bucket)
+        self._check_bucket()
+        chunk_size = getattr(self.cfg, 's3_chunk_size', 8) * 1024 * 1024
+        self.transfer_config = TransferConfig(multipart_threshold=chunk_size,
+                                              multipart_chunksize=chunk_size,
+                                              max_concurrency=getattr(self.cfg, 's3_max_concurrency', 10))
+        cache_size = getattr(self.cfg, 's3_cache_size', 0) * 1024 * 1024
+        self.cache = FileCache(self.cfg.s3_bucket, cache_size) if cache_size else None
+
+    def _check_bucket(self):
+        """ Create the bucket if it does not exist, checking only once per bucket """
+        if self.cfg.s3_bucket in S3Bucket._checked_buckets:
+            return
+        try:
+            self.s3_client.head_bucket(Bucket=self.cfg.s3_bucket)
+        except botocore.exceptions.ClientError as err:
+            if err.response['Error']['Code'] not in ('404', 'NoSuchBucket'):
+                raise
+            print("Creating S3 Bucket '{}'".format(self.cfg.s3_bucket))
+            create_args = dict(Bucket=self.cfg.s3_bucket)
+            if self.cfg.aws_region != 'us-east-1':
+                create_args['CreateBucketConfiguration'] = dict(LocationConstraint=self.cfg.aws_region)
+            self.s3_client.create_bucket(**create_args)
+        S3Bucket._checked_buckets.add(self.cfg.s3_bucket)
 
     def __getattr__(self, name):
         types = [t.rstrip('s') for t in self.types]
@@ -58,8 +89,8 @@ class S3Bucket(object):
         return sorted(funcs)
 
     def _delete_object(self, object_type):
-        """ Handler for 'download_<type>' """
-        return lambda name: self.download_object(object_type, name)
+        """ Handler for 'delete_<type>' """
+        return lambda name: self.delete_object(object_type, name)
 
     def _download_object(self, object_type):
         """ Handler for 'download_<type>' """
@@ -92,18 +123,68 @@ class S3Bucket(object):
         print("rm s3://{}/{}".format(self.cfg.s3_bucket, name))
         self.s3_client.delete_object(Bucket=self.cfg.s3_bucket, Key=name)
 
-    def download_object(self, object_type, remote, local=None, quiet=False):
-        if not self.object_exists(object_type, remote):
-            raise exceptions.S3FileNotFoundError(object_type, remote, self.cfg.s3_bucket)
+    def delete_objects(self, keys, jobs=4):
+        """ Delete ``keys`` with multi-object deletes of up to 1000 keys, ``jobs`` requests at a time
+
+            Returns the keys which could not be deleted.
+        """
+        batches = [keys[pos:pos + self.delete_batch_size] for pos in xrange(0, len(keys), self.delete_batch_size)]
+
+        def delete_batch(batch):
+            response = self.s3_client.delete_objects(Bucket=self.cfg.s3_bucket, Delete=dict(
+                Objects=[dict(Key=key) for key in batch], Quiet=True))
+            return response.get('Errors', [])
+
+        pool = ThreadPool(min(jobs, len(batches) or 1))
+        try:
+            errors = [error for batch_errors in pool.map(delete_batch, batches) for error in batch_errors]
+        finally:
+            pool.close()
+        failed = set(error['Key'] for error in errors)
+        for key in keys:
+            if key not in failed:
+                print("rm s3://{}/{}".format(self.cfg.s3_bucket, key))
+        for error in errors:
+            print("Failed to delete s3://{}/{}: {}".format(self.cfg.s3_bucket, error['Key'], error['Message']))
+        return sorted(failed)
+
+    def download_object(self, object_type, remote, local=None, quiet=False, cached=False, link=False):
+        """ Download the specified file from S3, using parallel ranged GETs for large files
+
+            When ``cached``, the file is served from (or added to) the local cache if it is enabled, with
+            ``local`` hardlinked to the cached copy if ``link`` is also given (so it must not be modified).
+        """
         if local is None:
             local = os.path.basename(remote)
         remote = os.path.join('{}'.format(object_type), remote)
+        try:
+            head = self.s3_client.head_object(Bucket=self.cfg.s3_bucket, Key=remote)
+        except botocore.exceptions.ClientError as err:
+            if err.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+                raise
+            raise exceptions.S3FileNotFoundError(object_type, remote.split('/', 1)[1], self.cfg.s3_bucket)
+        size = head['ContentLength']
+        start = time.time()
+        if cached and self.cache is not None and \
+                self.cache.fetch(remote, head['ETag'], size, local, link):
+            if not quiet:
+                print("s3://{}/{} -> {} (cached)".format(self.cfg.s3_bucket, remote, local))
+            return size
+
+        def download(filename):
+            self.s3_client.download_file(
+                Bucket=self.cfg.s3_bucket,
+                Key=remote,
+                Filename=filename,
+                Config=self.transfer_config)
+        # the entry may have been evicted by a concurrent download before it could be fetched, see FileCache.fetch
+        if not (cached and self.cache is not None and self.cache.store(remote, head['ETag'], size, download) and
+                self.cache.fetch(remote, head['ETag'], size, local, link)):
+            download(local)
         if not quiet:
-            print("s3://{}/{} -> {}".format(self.cfg.s3_bucket, remote, local))
-        self.s3_client.download_file(
-            Bucket=self.cfg.s3_bucket,
-            Key=remote,
-            Filename=local)
+            print("s3://{}/{} -> {} ({})".format(
+                self.cfg.s3_bucket, remote, local, utils.format_throughput(size, time.time() - start)))
+        return size
 
     def get_object(self, object_type, name):
         """ Get an object representing the specified file on S3 """
@@ -118,6 +199,12 @@ class S3Bucket(object):
         return [obj for obj in self.bucket.objects.filter(Prefix='{}/'.format(object_type))
                 if obj.key != '{}/'.format(object_type)]
 
+    def iter_object_pages(self, object_type):
+        """ Yield pages of ``{'Key', 'Size', 'LastModified', ...}`` dicts for the files of a given type """
+        paginator = self.s3_client.get_paginator('list_objects')
+        for page in paginator.paginate(Bucket=self.cfg.s3_bucket, Prefix='{}/'.format(object_type)):
+            yield [obj for obj in page.get('Contents', []) if obj['Key'] != '{}/'.format(object_type)]
+
     def get_object_list(self, object_type):
         """ List all filenames of a given type in S3 """
         return [o.key.split('/', 1)[1] for o in self.get_objects(object_type)]
@@ -126,7 +213,7 @@ class S3Bucket(object):
         """ Check if a file exists in S3 """
         return name in self.get_object_list(object_type)
 
-    def put_object(self, object_type, local, remote=None):
+    def put_object(self, object_type, local, remote=None, metadata=None):
         """ Upload the specified file to S3 """
         if not os.path.isfile(local):
             raise exceptions.FileNotFoundError(local)
@@ -134,4 +221,16 @@ class S3Bucket(object):
             remote = local
         remote = os.path.join('{}'.format(object_type), os.path.basename(remote))
         print("{} -> s3://{}/{}".format(local, self.cfg.s3_bucket, remote))
-        return self.s3_client.upload_file(Filename=local, Bucket=self.cfg.s3_bucket, Key=remote)
+        extra_args = dict(Metadata=metadata) if metadata else None
+        return self.s3_client.upload_file(Filename=local, Bucket=self.cfg.s3_bucket, Key=remote,
+                                          Config=self.transfer_config, ExtraArgs=extra_args)
+
+    def put_script(self, contents, expires=7 * 24 * 3600):
+        """ Upload a boot script to S3 and return presigned URLs an instance can fetch it from and then delete it
+            with, so that it is only kept until the instance has booted
+        """
+        key = 'scripts/{}.sh'.format(hashlib.md5(contents).hexdigest())
+        self.s3_client.put_object(Bucket=self.cfg.s3_bucket, Key=key, Body=contents)
+        return tuple(self.s3_client.generate_presigned_url(method, ExpiresIn=expires,
+                                                           Params=dict(Bucket=self.cfg.s3_bucket, Key=key))
+                     for method in ('get_object', 'delete_object'))
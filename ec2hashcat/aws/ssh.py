@@ -0,0 +1,127 @@
+""" Copyright 2015 Will Boyce """
+from __future__ import print_function
+
+from multiprocessing.pool import ThreadPool
+import socket
+import threading
+from time import sleep
+
+import paramiko
+
+from ec2hashcat import exceptions
+
+
+class SshConnection(object):
+    """ A persistent SSH connection to a single instance
+
+        Commands and transfers each open a channel of their own, so several threads may use the same
+        connection at once.
+    """
+    user = 'ubuntu'
+    attempts = 5
+    retry_wait = 5  # seconds
+    timeout = 10  # seconds
+    # raised by operations on an unreachable (or vanishing) instance
+    errors = (exceptions.EC2InstanceError, paramiko.SSHException, socket.error, EOFError)
+
+    def __init__(self, host, key_filename):
+        self.host = host
+        self.key_filename = key_filename
+        self.client = None
+        self.lock = threading.Lock()
+
+    def open(self):
+        """ Connect, unless already connected, retrying while the instance is still starting its SSH server """
+        with self.lock:
+            if self.client is None:
+                self.client = self._connect()
+
+    def _connect(self):
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        for attempt in range(1, self.attempts + 1):
+            try:
+                client.connect(self.host, username=self.user, key_filename=self.key_filename, timeout=self.timeout)
+                break
+            except (paramiko.SSHException, socket.error) as err:
+                if attempt == self.attempts:
+                    raise exceptions.EC2InstanceError("Could not connect to '{}': {}".format(self.host, err))
+                sleep(self.retry_wait)
+        return client
+
+    def run(self, command, path='/tmp', pty=False):
+        """ Run ``command`` in ``path``, returning its exit status and its (combined) output """
+        channel = self.client.get_transport().open_session()
+        try:
+            if pty:
+                channel.get_pty()
+            channel.set_combine_stderr(True)
+            channel.exec_command('cd {} && {}'.format(path, command))
+            output = ''.join(iter(lambda: channel.recv(32768), ''))
+            return channel.recv_exit_status(), output
+        finally:
+            channel.close()
+
+    def put(self, local, remote, mode='0644'):
+        """ Copy local file ``local`` to ``remote`` on the instance """
+        sftp = self.client.open_sftp()
+        try:
+            sftp.put(local, remote)
+            sftp.chmod(remote, int(mode, 8))
+        finally:
+            sftp.close()
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+
+class SshPool(object):
+    """ SSH connections to many instances, each opened once and reused by every operation on the instance
+
+        ``map`` runs an operation against many instances at once, at most ``jobs`` at a time.
+    """
+    _shared = {}
+
+    def __init__(self, key_filename):
+        self.key_filename = key_filename
+        self.connections = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, key_filename):
+        """ Return the pool shared by everything using ``key_filename`` in this process """
+        if key_filename not in cls._shared:
+            cls._shared[key_filename] = cls(key_filename)
+        return cls._shared[key_filename]
+
+    @classmethod
+    def close_all(cls):
+        for pool in cls._shared.values():
+            pool.close()
+        cls._shared.clear()
+
+    def connection(self, host):
+        """ Return the connection to ``host``, connecting if this is the first use of it """
+        with self.lock:
+            if host not in self.connections:
+                self.connections[host] = SshConnection(host, self.key_filename)
+            connection = self.connections[host]
+        connection.open()
+        return connection
+
+    @classmethod
+    def map(cls, func, items, jobs=8):
+        """ Return ``[func(item) for item in items]``, calling ``func`` for up to ``jobs`` items at once """
+        pool = ThreadPool(min(jobs, len(items) or 1))
+        try:
+            return pool.map(func, items)
+        finally:
+            pool.close()
+
+    def close(self):
+        with self.lock:
+            for connection in self.connections.values():
+                connection.close()
+            self.connections.clear()
@@ -0,0 +1,89 @@
+""" Copyright 2015 Will Boyce """
+from __future__ import print_function
+
+import copy
+import itertools
+import re
+import shlex
+
+from ec2hashcat import argparse, exceptions
+
+
+class _LineParser(argparse.ArgumentParser):
+    """ Parser for single batch lines, raising errors instead of exiting """
+
+    def error(self, message, show_usage=True):
+        raise exceptions.Ec2HashcatInvalidArguments(message)
+
+
+class BatchCompiler(object):
+    """ Compile the lines of a batch file into a list of attacks
+
+        Each line is parsed once, starting from ``defaults`` (the options the batch was run with, config file
+        values included) rather than re-reading config files. ``NAME = value ...`` lines define lists, and
+        lines are expanded once for every combination of the lists (``{NAME}``) and alternatives
+        (``{a,b,c}``) they reference. Repeated lines are collapsed.
+    """
+    command = 'crack'
+    definition_rx = re.compile(r'^(\w+)\s*=(.*)$')
+    template_rx = re.compile(r'\{(\w+|[^{},]*(?:,[^{},]*)+)\}')
+
+    def __init__(self, setup_parser, defaults):
+        self.parser = _LineParser(prog=self.command, default_config_files=[], args_for_setting_config_path=[],
+                                  add_config_file_help=False)
+        setup_parser(self.parser, final=True)
+        self.defaults = defaults
+        self.lists = {}
+        self.lines = 0
+        self.duplicates = 0
+
+    def compile(self, lines):
+        """ Return an attack per unique expanded line, each with the ``lineno`` it was expanded from """
+        batch, seen, errors = [], set(), []
+        for lineno, line in enumerate(lines, start=1):
+            if not line or line.startswith('#'):
+                continue
+            try:
+                for args in self.expand_line(line):
+                    if args in seen:
+                        self.duplicates += 1
+                        continue
+                    seen.add(args)
+                    cfg = self.parser.parse_args(list(args), namespace=copy.copy(self.defaults))
+                    cfg.lineno = lineno
+                    batch.append(cfg)
+            except exceptions.Ec2HashcatInvalidArguments as err:
+                errors.append('line {}: {}'.format(lineno, err.message))
+        if errors:
+            raise exceptions.BatchFileError(errors)
+        return batch
+
+    def expand_line(self, line):
+        """ Return the argument tuples ``line`` expands to, recording it instead if it defines a list """
+        try:
+            definition = self.definition_rx.match(line)
+            if definition is not None:
+                self.lists[definition.group(1)] = [value for token in shlex.split(definition.group(2))
+                                                   for value in self.expand(token)]
+                return []
+            tokens = shlex.split(line)
+        except ValueError as err:
+            raise exceptions.Ec2HashcatInvalidArguments(str(err))
+        if tokens[0] != self.command:
+            raise exceptions.Ec2HashcatInvalidArguments("expected a '{}' command".format(self.command))
+        self.lines += 1
+        return list(itertools.product(*[self.expand(token) for token in tokens[1:]]))
+
+    def expand(self, token):
+        """ Return every expansion of the templates in ``token``, braces naming no list are left as they are """
+        for match in self.template_rx.finditer(token):
+            name = match.group(1)
+            if ',' in name:
+                values = name.split(',')
+            elif name in self.lists:
+                values = self.lists[name]
+            else:
+                continue
+            head, tail = token[:match.start()], token[match.end():]
+            return [head + value + rest for value in values for rest in self.expand(tail)]
+        return [token]
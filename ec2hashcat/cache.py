@@ -0,0 +1,84 @@
+""" Copyright 2015 Will Boyce """
+from __future__ import print_function
+
+import hashlib
+import os
+import shutil
+import threading
+
+from ec2hashcat import utils
+
+
+class FileCache(object):
+    """ Least recently used cache of S3 objects under ``~/.ec2hashcat/cache/<bucket>``
+
+        Entries are named after the object's key and ETag, so a replaced object is never served from the
+        cache, and use their modification time as the time they were last used. Once the cache holds more
+        than ``max_size`` bytes the least recently used entries are removed.
+    """
+
+    def __init__(self, bucket, max_size):
+        self.path = utils.get_state_dir('cache', bucket)
+        self.max_size = max_size
+        self.lock = threading.Lock()
+
+    def _entry(self, key, etag):
+        return os.path.join(self.path, '{}-{}'.format(hashlib.md5(key).hexdigest(), etag.strip('"')))
+
+    def fetch(self, key, etag, size, local, link=False):
+        """ Copy (or hardlink) the cached copy of ``key`` to ``local``, returning whether it was cached """
+        entry = self._entry(key, etag)
+        # the entry is linked or opened while it cannot be evicted, after which removing it cannot affect the copy
+        with self.lock:
+            if not os.path.isfile(entry) or os.path.getsize(entry) != size:
+                return False
+            os.utime(entry, None)
+            # rather than overwritten, as ``local`` may be a link to another entry
+            if os.path.exists(local):
+                os.unlink(local)
+            if link:
+                try:
+                    os.link(entry, local)
+                    return True
+                except OSError:  # e.g. on another filesystem
+                    pass
+            entry_fh = open(entry, 'rb')
+        with entry_fh, open(local, 'wb') as local_fh:
+            shutil.copyfileobj(entry_fh, local_fh, 1024 * 1024)
+        return True
+
+    def store(self, key, etag, size, download):
+        """ Add ``key`` to the cache, calling ``download(filename)`` to fetch it, unless it could never fit """
+        if size > self.max_size:
+            return False
+        entry = self._entry(key, etag)
+        part_fn = '{}.{}.part'.format(entry, threading.current_thread().ident)
+        try:
+            download(part_fn)
+            os.rename(part_fn, entry)
+        finally:
+            if os.path.exists(part_fn):
+                os.unlink(part_fn)
+        prefix = '{}-'.format(hashlib.md5(key).hexdigest())
+        with self.lock:
+            for name in os.listdir(self.path):  # earlier versions of the object
+                if name.startswith(prefix) and not name.endswith('.part') and name != os.path.basename(entry):
+                    os.unlink(os.path.join(self.path, name))
+        self.evict()
+        return True
+
+    def evict(self):
+        """ Remove the least recently used entries until the cache fits in ``max_size`` """
+        with self.lock:
+            entries = []
+            for name in os.listdir(self.path):
+                if name.endswith('.part'):
+                    continue
+                stat = os.stat(os.path.join(self.path, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_size:
+                    break
+                os.unlink(os.path.join(self.path, name))
+                total -= size
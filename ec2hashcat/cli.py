@@ -6,6 +6,7 @@ def main():
     """ Main entry point for the `ec2hashcat` command """
     from fabric.state import connections
 
+    from ec2hashcat.aws.ssh import SshPool
     from ec2hashcat.commands.base import Handler
 
     try:
@@ -15,3 +16,4 @@ def main():
         for key in connections.keys():
             connections[key].close()
             del connections[key]
+        SshPool.close_all()
@@ -5,7 +5,7 @@ import abc
 import sys
 
 import ec2hashcat
-from ec2hashcat import argparse, exceptions
+from ec2hashcat import argparse, exceptions, profile
 from ec2hashcat.aws import Ec2
 
 
@@ -32,6 +32,10 @@ class Handler(object):
         global_args.add_argument('-D', '--debug', action='store_true')
         global_args.add_argument('-q', '--quiet', action='store_true', help='Accept default answers to all questions')
         global_args.add_argument('-y', '--yes', action='store_true', help='Assume "yes" to all questions asked')
+        global_args.add_argument('--profile', action='store_true',
+                                 help='Print a tree of time spent in each phase, AWS call and SSH operation')
+        global_args.add_argument('--profile-trace', metavar='FILE', default=None,
+                                 help='Also write the profile as a Chrome trace to FILE (implies --profile)')
 
         # AWS arguments
         aws_args = parser.add_argument_group('aws arguments')
@@ -40,6 +44,13 @@ class Handler(object):
         aws_args.add_argument('--aws-region', default='us-east-1', choices=Ec2.region_ami_map.keys(),
                               help='AWS Region')
         aws_args.add_argument('--s3-bucket', required=True, help='S3 Bucket Name')
+        aws_args.add_argument('--s3-max-concurrency', action='store_num', type=int, default=10, min=1,
+                              help='Maximum number of concurrent requests per S3 transfer')
+        aws_args.add_argument('--s3-chunk-size', action='store_num', type=int, default=8, min=5,
+                              help='Size (MB) above which S3 transfers are split into parallel ranged requests')
+        aws_args.add_argument('--s3-cache-size', action='store_num', type=int, default=4096, min=0,
+                              help='Size (MB) of the cache of files downloaded by `get` and `cat` in '
+                                   '~/.ec2hashcat/cache (0 to disable it)')
 
         # subcommands
         for cmd, cmd_cls in Registry.get_commands():
@@ -51,6 +62,9 @@ class Handler(object):
     def dispatch(self):
         """ Dispatch a command to the appropriate class """
         cmd_cls = Registry.get_command(self.cfg.command)
+        profiler = None
+        if self.cfg.profile or self.cfg.profile_trace:
+            profiler = profile.enable()
         try:
             return cmd_cls(self.args, self.parser, self.cfg).handle()
         except exceptions.EC2HashcatException, err:
@@ -58,6 +72,11 @@ class Handler(object):
         except KeyboardInterrupt:
             print("\n^C caught, cancelling request...")
             self.error(exceptions.Cancelled())
+        finally:
+            if profiler is not None:
+                profiler.report()
+                if self.cfg.profile_trace:
+                    profiler.write_trace(self.cfg.profile_trace)
 
     def error(self, error):
         """ Propogate an error to the best available subparser """
@@ -1,20 +1,60 @@
 """ Copyright 2015 Will Boyce """
 from __future__ import print_function
 
+from collections import OrderedDict, defaultdict
+import base64
+import copy
+import hashlib
+import json
 import os
-import shlex
+import pipes
+import re
+import shutil
+import tempfile
 
-from ec2hashcat import aws, exceptions
+from fabric.api import hide, local
+
+from ec2hashcat import aws, exceptions, hashtypes, profile
+from ec2hashcat.batch import BatchCompiler
 from ec2hashcat.commands.runscript import BaseEc2InstanceSessionCommand
+from ec2hashcat.index import CrackedIndex, DumpIndex
+from ec2hashcat.jobs import JobQueue
+from ec2hashcat.ledger import Ledger
+from ec2hashcat.placement import DataPlacement
+from ec2hashcat.prep import HashlistPrep
+from ec2hashcat.rules import RuleSet
+from ec2hashcat.scheduler import Scheduler
+from ec2hashcat.stats import WordlistStats
+from ec2hashcat.telemetry import Telemetry
 
 
 class Crack(BaseEc2InstanceSessionCommand):
     """ Launch an EC2 Instance and crack the specified file(s) """
     hashcat_home = '/opt/cudaHashcat-1.37'
+    sample_bytes = 1024 * 1024  # of hashlists which are only in S3, when identifying their hash type
+    output_paths = (os.path.join(hashcat_home, '*.pot'), '/tmp/*.pot',
+                    os.path.join(DataPlacement.root_dir, 'cracked.out'),
+                    os.path.join(DataPlacement.mount_dir, 'cracked.out'))
+
+    def __init__(self, *args, **kwargs):
+        super(Crack, self).__init__(*args, **kwargs)
+        self.s3bucket = aws.S3Bucket(self.cfg)
+        self.ledger = Ledger(self.s3bucket)
+        self.rule_counts = {}
+        self.wordlist_stats = {}
+        self.s3objects = {}
+        self.modified = set()
+        self.placement = None
+        self.tmpdir = None
 
     @classmethod
     def setup_parser(cls, parser, final=False):
         super(Crack, cls).setup_parser(parser)
+        cls.setup_attack_parser(parser, final)
+
+    @classmethod
+    def setup_attack_parser(cls, parser, final=False):
+        """ Add the arguments which can also be given on each line of a batch """
         crack_args = parser.add_argument_group('crack arguments')
         crack_args.add_argument('--no-write-hashlists', action='store_false', dest='update_hashlist', default=True,
                                 help='Do not remove cracked hashes from the hashlist')
@@ -24,13 +64,51 @@ class Crack(BaseEc2InstanceSessionCommand):
                                 help='Do not generate/update a wordlist from cracked passwords from list hashlist')
         crack_args.add_argument('-b', '--batchfile', default=None,
                                 help='Execute a batch of `crack` tasks')
+        crack_args.add_argument('--no-schedule', action='store_false', dest='schedule', default=True,
+                                help='Run batch lines in file order instead of cheapest attacks first')
+        crack_args.add_argument('--no-combine', action='store_false', dest='combine', default=True,
+                                help='Do not run the same attack against several hashlists as a single attack')
+        crack_args.add_argument('--time-budget', action='store_num', type=int, min=1, default=None,
+                                help='Abort the attack after this many seconds')
+        crack_args.add_argument('-f', '--force', action='store_true',
+                                help='Run attacks even if the ledger shows they have already been exhausted')
+        crack_args.add_argument('--no-prep', action='store_false', dest='prep', default=True,
+                                help='Do not normalise and deduplicate local hashlists before upload')
+        crack_args.add_argument('--no-prefilter', action='store_false', dest='prefilter', default=True,
+                                help='Do not strip hashes found in existing dumps from hashlists before upload')
+        crack_args.add_argument('--wordlist-stats', action='store_true',
+                                help='Collect the line count, lengths and character sets of uploaded wordlists')
+        crack_args.add_argument('--no-stream', action='store_false', dest='stream', default=True,
+                                help='Do not upload cracked hashes to S3 while the attack is running')
+        crack_args.add_argument('--stream-interval', action='store_num', type=int, min=1, default=60,
+                                help='Upload newly cracked hashes at least every this many seconds')
+        crack_args.add_argument('--stream-count', action='store_num', type=int, min=1, default=1000,
+                                help='Upload newly cracked hashes as soon as this many are pending')
+        crack_args.add_argument('--no-telemetry', action='store_false', dest='telemetry', default=True,
+                                help='Do not record GPU utilisation and hashcat speed during each attack')
+        crack_args.add_argument('--telemetry-interval', action='store_num', type=int, min=5, default=30,
+                                help='Seconds between telemetry samples')
+        crack_args.add_argument('--ec2-data-placement', choices=DataPlacement.choices, default='auto',
+                                help='Where to store attack data on the instance (default=instance store, then '
+                                     'tmpfs, then the root volume, whichever fits first)')
+        crack_args.add_argument('--hash-check', choices=('warn', 'refuse', 'off'), default='warn',
+                                help='What to do when a sample of the hashlist does not look like the hash type '
+                                     '(default=warn)')
+        crack_args.add_argument('--enqueue', action='store_true',
+                                help='Queue the attack for worker instances (see `ec2hashcat workers`) instead of '
+                                     'starting an instance for it')
+        crack_args.add_argument('--queue-chunks', action='store_num', type=int, min=1, default=8,
+                                help='Number of chunks each keyspace range of a queued attack is split into')
 
         hc_args = parser.add_argument_group('hashcat arguments')
         hc_args.add_argument('-a', '--attack-mode', required=final,
                              help='Hashcat attack mode')
         hc_args.add_argument('-m', '--hash-type', required=final,
-                             help='Hash type')
-        hc_args.add_argument('-r', '--rules', help='Rules files to use')
+                             help='Hash type (auto to identify it from a sample of the hashlist)')
+        hc_args.add_argument('-r', '--rules', action='append',
+                             help='Rules file to use (may be repeated to chain rules files)')
+        hc_args.add_argument('--merge-rules', action='store_true',
+                             help='Merge repeated rules files into a single deduplicated set instead of chaining them')
         hc_args.add_argument('-A', '--hashcat-args', default='',
                              help='Additional hashcat arguments')
         hc_args.add_argument('target', metavar='HASHLIST', nargs=1 if final else '?',
@@ -39,31 +117,304 @@ class Crack(BaseEc2InstanceSessionCommand):
                              help='wordlists or masks to use in attack (default=all wordlists)')
 
     def handle(self):
-        batch = self._get_batch()
-        self._upload_files(batch)
+        self.tmpdir = tempfile.mkdtemp()
+        try:
+            self._handle()
+        finally:
+            shutil.rmtree(self.tmpdir)
+
+    def _handle(self):
+        with profile.phase('parse batch'):
+            batch = self._get_batch()
+        with profile.phase('validate'):
+            self._index_files()
+            self._validate(batch)
+        with profile.phase('identify'):
+            self._identify(batch)
+        if self.cfg.prep:
+            with profile.phase('prep'):
+                self._prep(batch)
+        if self.cfg.prefilter:
+            with profile.phase('prefilter'):
+                batch = self._prefilter(batch)
+            if not batch:
+                print('All hashes have already been cracked.')
+                return
+        with profile.phase('upload'):
+            self._upload_files(batch)
+        with profile.phase('placement'):
+            if self.cfg.enqueue:
+                # workers choose where to keep data themselves and run each job in a directory of its own
+                self._rewrite_paths(batch, '$DATA')
+            else:
+                self._place_data(batch)
+        with profile.phase('plan'):
+            batch = self._schedule(batch)
+            batch = self._check_ledger(batch)
+        if not batch:
+            print('All attacks have already been exhausted, use --force to run them again.')
+            return
         if self.cfg.session_name is None:
             self.cfg.session_name = '+'.join(set(os.path.basename(cfg.target) for cfg in batch))
-        instance = self._bootstrap_instance(batch)
-        script = self._generate_script(batch)
-        self._start_task(instance, script)
+        if self.cfg.combine and not self.cfg.enqueue:
+            batch = self._combine(batch)
+        if self.cfg.enqueue:
+            with profile.phase('enqueue'):
+                self._enqueue(batch)
+            return
+        if self._check_headless():
+            with profile.phase('start headless task'):
+                self._start_headless_task(batch)
+            return
+        with profile.phase('bootstrap'):
+            instance = self._bootstrap_instance(batch)
+        with profile.phase('start task'):
+            script = self._generate_script(batch)
+            self._start_task(instance, script)
 
     def _get_batch(self):
-        # bit of a hack here to let us override the subparser and rerun it over the batches
-        subparser = self.parser.add_command(self.cfg.command)
-        self.setup_parser(subparser, final=True)
         if self.cfg.batchfile is None:
-            return [self.parser.parse_args(self.args)]
+            # bit of a hack here to let us override the subparser and rerun it over the command line
+            subparser = self.parser.add_command(self.cfg.command)
+            self.setup_parser(subparser, final=True)
+            batch = [self.parser.parse_args(self.args)]
         else:
             if self.cfg.batchfile == '-':
                 self.cfg.attach = False
                 self.cfg.quiet = True
-            return [self.parser.parse_args(shlex.split(line))
-                    for line in self._read_file(self.cfg.batchfile, prompt='batch>')]
+            compiler = BatchCompiler(self.setup_attack_parser, self.cfg)
+            batch = compiler.compile(self._read_file(self.cfg.batchfile, prompt='batch>', comments=True))
+            print('Compiled {} batch line(s) into {} attack(s){}'.format(
+                compiler.lines, len(batch),
+                ', collapsing {} duplicate(s)'.format(compiler.duplicates) if compiler.duplicates else ''))
+        for cfg in batch:
+            cfg.target = cfg.target[0] if isinstance(cfg.target, list) else cfg.target
+            cfg.rules = cfg.rules or []
+            cfg.rule_sources = None
+            cfg.members = None
+        return batch
+
+    def _identify(self, batch):
+        """ Check the hash type of each attack against a sample of its hashlist, filling in ``-m auto`` """
+        candidates, warned = {}, set()
+        for cfg in batch:
+            if cfg.hash_check == 'off' and cfg.hash_type != 'auto':
+                continue
+            name = os.path.basename(cfg.target)
+            if cfg.target not in candidates:
+                candidates[cfg.target] = hashtypes.identify(self._sample_target(cfg.target))
+            modes = candidates[cfg.target]
+            if cfg.hash_type == 'auto':
+                if not modes:
+                    raise exceptions.Ec2HashcatInvalidArguments(
+                        "cannot identify the hash type of '{}', use -m".format(name))
+                cfg.hash_type = str(modes[0][0])
+                print("Identified '{}' as {} ({:.0%} confidence)".format(
+                    name, hashtypes.describe(cfg.hash_type), modes[0][1]))
+            elif modes and str(cfg.hash_type) not in [str(mode) for mode, _ in modes]:
+                message = "'{}' looks like {} rather than {}".format(
+                    name, ' or '.join('{} {:.0%}'.format(hashtypes.describe(mode), confidence)
+                                      for mode, confidence in modes[:3]), hashtypes.describe(cfg.hash_type))
+                if cfg.hash_check == 'refuse':
+                    raise exceptions.Ec2HashcatInvalidArguments(
+                        '{}, use --hash-check=warn to run it anyway'.format(message))
+                if (cfg.target, cfg.hash_type) not in warned:
+                    print('Warning: {}'.format(message))
+                    warned.add((cfg.target, cfg.hash_type))
+
+    def _sample_target(self, target):
+        """ Return a sample of the hashes in ``target``, taken from the start of it when it is only in S3 """
+        if os.path.isfile(target):
+            return hashtypes.sample_file(target)
+        name = os.path.basename(target)
+        if not self.s3objects['hashlists'][name].size:
+            return []
+        data = self.s3bucket.s3_client.get_object(Bucket=self.cfg.s3_bucket, Key='hashlists/{}'.format(name),
+                                                  Range='bytes=0-{}'.format(self.sample_bytes - 1))['Body'].read()
+        lines = data.splitlines()
+        if len(data) == self.sample_bytes:
+            lines = lines[:-1]  # which may have been cut short
+        return list(hashtypes.sample(lines))
+
+    def _prep(self, batch):
+        """ Normalise and deduplicate any local targets, keeping their names """
+        prep_dir = os.path.join(self.tmpdir, 'prep')
+        os.mkdir(prep_dir)
+        targets = {}
+        for target in set(cfg.target for cfg in batch):
+            if not os.path.isfile(target):
+                targets[target] = target
+                continue
+            name = os.path.basename(target)
+            prep = HashlistPrep()
+            with open(target) as hashlist_fh:
+                results = prep.process(hashlist_fh, lambda sig: os.path.join(
+                    prep_dir, '{}.{}'.format(name, hashtypes.slug(sig))))
+            print('Prepared {}'.format(prep.summary(name)))
+            if len(results) > 1:
+                print("Warning: '{}' contains {} hash formats, consider splitting it with `ec2hashcat prep`"
+                      .format(name, len(results)))
+            targets[target] = os.path.join(prep_dir, name)
+            with open(targets[target], 'w') as prepped_fh:
+                for _, prepped_fn in sorted(results.items()):
+                    with open(prepped_fn) as part_fh:
+                        shutil.copyfileobj(part_fh, prepped_fh)
+        for cfg in batch:
+            cfg.target = targets[cfg.target]
+
+    def _prefilter(self, batch):
+        """ Strip hashes which have already been cracked from each target before it is uploaded """
+        index = CrackedIndex(self.cfg)
+        index.update(self.s3bucket)
+        if not len(index):
+            return batch
+        hash_types, attacks = defaultdict(set), defaultdict(list)
+        for cfg in batch:
+            hash_types[cfg.target].add(str(cfg.hash_type))
+            attacks[cfg.target].append(cfg)
+        try:
+            # a hashlist attacked as several hash types is left alone, as no one filtered copy suits every attack
+            targets = dict((target, self._prefilter_target(index, target, types.pop(), attacks[target])
+                            if len(types) == 1 else target) for target, types in hash_types.items())
+        finally:
+            index.close()
+        remaining = []
+        for cfg in batch:
+            if targets[cfg.target] is not None:
+                cfg.target = targets[cfg.target]
+                remaining.append(cfg)
+        return remaining
+
+    def _prefilter_target(self, index, target, hash_type, attacks):
+        """ Return the path of ``target`` without any known hashes, or ``None`` if none remain """
+        name = os.path.basename(target)
+        local_fn = target
+        # dumps and S3 hashlists are only written if every attack against the target would write them
+        dump_cracked = all(cfg.dump_cracked for cfg in attacks)
+        if not os.path.isfile(target):
+            if name not in self.s3objects['hashlists'] or not all(cfg.update_hashlist for cfg in attacks):
+                return target
+            local_fn = os.path.join(self.tmpdir, '{}.s3'.format(name))
+            self.s3bucket.download_object('hashlists', name, local_fn, quiet=True)
+        filtered_fn = os.path.join(self.tmpdir, name)
+        known, remaining = [], 0
+        with open(local_fn) as in_fh, open(filtered_fn, 'w') as out_fh:
+            for line in in_fh:
+                hash_ = line.strip()
+                if not hash_:
+                    continue
+                dump_line = index.lookup(hash_type, hash_)
+                if dump_line is None:
+                    out_fh.write('{}\n'.format(hash_))
+                    remaining += 1
+                else:
+                    known.append(dump_line)
+        if not known:
+            return target
+        print("{} hash(es) in '{}' have already been cracked, {} remaining".format(len(known), name, remaining))
+        if dump_cracked:
+            self._merge_dump(name, known, hash_type)
+        if not os.path.isfile(target):  # the target only exists in S3, so replace (or remove) it there
+            if remaining:
+                self.s3bucket.put_object('hashlists', filtered_fn)
+                # the remaining hashes are a subset of the original, so completed ranges carry over
+                self.ledger.copy_ranges(self._get_etag('hashlists', name), self.s3bucket.s3_client.head_object(
+                    Bucket=self.cfg.s3_bucket, Key='hashlists/{}'.format(name))['ETag'].strip('"'))
+            else:
+                self.s3bucket.delete_object('hashlists', name)
+            self.modified.add('hashlists')
+            return name if remaining else None
+        return filtered_fn if remaining else None
+
+    def _merge_dump(self, name, lines, hash_type):
+        """ Merge already cracked ``lines`` into the dump for hashlist ``name`` (of ``hash_type``) """
+        dump_name = '{}.dmp'.format(name.rsplit('.', 1)[0])
+        dump_fn = os.path.join(self.tmpdir, dump_name)
+        with open('{}1'.format(dump_fn), 'w') as dump_fh:
+            dump_fh.writelines('{}\n'.format(line) for line in lines)
+        if self.s3bucket.object_exists('dumps', dump_name):
+            self.s3bucket.download_object('dumps', dump_name, '{}2'.format(dump_fn), quiet=True)
+        with hide('commands'):
+            local('LC_ALL=C sort -u {}? > {}'.format(dump_fn, dump_fn))
+        self.s3bucket.put_object('dumps', dump_fn, metadata={'hash-type': hash_type})
+        with open(dump_fn) as dump_fh:
+            self.s3bucket.s3_client.put_object(Bucket=self.cfg.s3_bucket, Key=DumpIndex.sidecar_key(dump_name),
+                                               Body=DumpIndex.build(dump_fh, os.path.getsize(dump_fn)))
+
+    def _schedule(self, batch):
+        for name in set(os.path.basename(src) for cfg in batch for src in cfg.src if '?' not in src):
+            obj = self.s3objects['wordlists'].get(name)
+            if name not in self.wordlist_stats and obj is not None:
+                self.wordlist_stats[name] = WordlistStats.load(self.s3bucket, name, obj.size)
+        wordlist_lines = dict((name, stats.lines) for name, stats in self.wordlist_stats.items() if stats is not None)
+        scheduler = Scheduler(dict((name, obj.size) for name, obj in self.s3objects['wordlists'].items()),
+                              self.rule_counts, wordlist_lines)
+        if not self.cfg.schedule:
+            return scheduler.dedupe(batch)
+        return scheduler.schedule(batch)
+
+    def _index_files(self, filetypes=('hashlists', 'wordlists', 'rules')):
+        """ Take a single listing of each file type referenced by the batch """
+        for filetype in filetypes:
+            self.s3objects[filetype] = dict((obj.key.split('/', 1)[1], obj)
+                                            for obj in self.s3bucket.get_objects(filetype))
+
+    def _get_etag(self, filetype, name):
+        obj = self.s3objects[filetype].get(os.path.basename(name))
+        return obj.e_tag.strip('"') if obj is not None else name
+
+    def _validate(self, batch):
+        """ Check every file the batch references is local, in S3 or a wordlist generated by the batch """
+        generated = set(Scheduler.generated_wordlist(cfg) for cfg in batch)
+        missing = []
+        for cfg in batch:
+            names = [('hashlists', cfg.target)]
+            names.extend(('wordlists', src) for src in cfg.src if '?' not in src)
+            names.extend(('rules', rule) for rule in cfg.rules if not rule.startswith('builtin:'))
+            for filetype, name in names:
+                basename = os.path.basename(name)
+                if os.path.isfile(name) or basename in self.s3objects[filetype]:
+                    continue
+                if filetype != 'wordlists' or basename not in generated:
+                    missing.append((getattr(cfg, 'lineno', None), name))
+        if missing and self.cfg.batchfile is None:
+            raise exceptions.FileNotFoundError(missing[0][1])
+        if missing:
+            raise exceptions.BatchFileError(["line {}: no such file locally or in S3: '{}'".format(lineno, name)
+                                             for lineno, name in missing])
+
+    def _check_ledger(self, batch):
+        """ Drop exhausted attacks and restrict the others to the keyspace not yet covered """
+        remaining = []
+        for cfg in batch:
+            rules = [rule if rule.startswith(self.hashcat_home) else self._get_etag('rules', rule)
+                     for rule in cfg.rule_sources or cfg.rules]
+            if cfg.rule_sources:
+                rules.insert(0, 'merge')
+            sources = [src if '?' in src else self._get_etag('wordlists', src) for src in cfg.src]
+            cfg.hashlist_digest = self._get_etag('hashlists', cfg.target)
+            cfg.attack_digest = Ledger.attack_digest(cfg.attack_mode, cfg.hash_type, rules, sources, cfg.hashcat_args)
+            start, end = Ledger.requested_range(cfg.hashcat_args)
+            cfg.hashcat_args = Ledger.strip_range_args(cfg.hashcat_args)
+            if self.cfg.force:
+                cfg.ranges = [(start, end)]
+            else:
+                cfg.ranges = self.ledger.uncovered(cfg.hashlist_digest, cfg.attack_digest, start, end)
+            if not cfg.ranges:
+                print("Skipping exhausted attack -a{} -m{} against '{}'".format(
+                    cfg.attack_mode, cfg.hash_type, os.path.basename(cfg.target)))
+                continue
+            if cfg.ranges != [(start, end)]:
+                print("Resuming attack -a{} -m{} against '{}' over keyspace {}".format(
+                    cfg.attack_mode, cfg.hash_type, os.path.basename(cfg.target),
+                    ', '.join(Ledger.format_range(*rng) for rng in cfg.ranges)))
+            remaining.append(cfg)
+        return remaining
 
-    def _handle_file(self, s3bucket, filetype, local_fn, error=True):
+    def _handle_file(self, s3bucket, filetype, local_fn):
         exists_local = os.path.isfile(local_fn)
         remote_fn = os.path.basename(local_fn)
-        exists_remote = s3bucket.object_exists(filetype, remote_fn)
+        exists_remote = remote_fn in self.s3objects[filetype]
         if exists_local:
             upload = True
             if exists_remote:
@@ -71,151 +422,518 @@ class Crack(BaseEc2InstanceSessionCommand):
                     filetype, remote_fn, local_fn)
                 upload = self.prompt(prompt_txt, default=self.cfg.yes, skip=self.cfg.quiet)
             if upload:
-                s3bucket.put_object(filetype, local_fn)
-        elif not exists_remote and error:
-            raise exceptions.FileNotFoundError(local_fn)
+                if filetype == 'wordlists' and self.cfg.wordlist_stats:
+                    self.wordlist_stats[remote_fn] = WordlistStats.put(s3bucket, local_fn)
+                else:
+                    s3bucket.put_object(filetype, local_fn)
+                self.modified.add(filetype)
 
     def _upload_files(self, batch):
         print("Uploading files to S3...")
-        s3bucket = aws.S3Bucket(self.cfg)
+        s3bucket = self.s3bucket
         uploaded_targets, uploaded_sources, uploaded_rules = set(), set(), set()
         for cfg in batch:
             # upload targets
-            cfg.target = cfg.target[0] if isinstance(cfg.target, list) else cfg.target
             if cfg.target not in uploaded_targets:
                 self._handle_file(s3bucket, 'hashlists', cfg.target)
                 uploaded_targets.add(cfg.target)
-            cfg.target = os.path.join('/tmp', os.path.basename(cfg.target))
+            cfg.target = os.path.basename(cfg.target)
 
             # upload sources
             sources = []
+            for src in cfg.src:
+                if '?' not in src:  # a '?' in a source indicates a mask
+                    if src not in uploaded_sources:
+                        self._handle_file(s3bucket, 'wordlists', src)
+                        uploaded_sources.add(src)
+                    sources.append(os.path.basename(src))
+                else:
+                    sources.append(src)
+            cfg.src = sources
+
+            # upload rules
+            rules = []
+            for rule in cfg.rules:
+                if rule.startswith('builtin:'):
+                    rules.append(rule.replace('builtin:', os.path.join(self.hashcat_home, 'rules/')))
+                    continue
+                if rule not in uploaded_rules:
+                    self._handle_file(s3bucket, 'rules', self._optimize_rules(rule))
+                    uploaded_rules.add(rule)
+                rules.append(os.path.basename(rule))
+            cfg.rules = rules
+            if cfg.merge_rules and len(cfg.rules) > 1:
+                self._merge_rules(cfg)
+        # list the types which changed again, for the etags of the uploaded files
+        self._index_files(sorted(self.modified))
+        for cfg in batch:
             if not cfg.src:  # if no source specified, use all wordlists
-                cfg.src = s3bucket.get_wordlists()
+                cfg.src = sorted(self.s3objects['wordlists'])
+
+    def _optimize_rules(self, rules_fn):
+        """ Write a normalised copy of local rules file ``rules_fn`` without duplicate rules, returning its path """
+        if not os.path.isfile(rules_fn):
+            return rules_fn
+        name = os.path.basename(rules_fn)
+        optimized_fn = os.path.join(self.tmpdir, name)
+        rule_set = RuleSet()
+        with open(rules_fn) as rules_fh, open(optimized_fn, 'w') as optimized_fh:
+            optimized_fh.writelines('{}\n'.format(rule) for rule in rule_set.add(rules_fh))
+        if rule_set.duplicates:
+            print("Removed {} duplicate rule(s) from '{}', {} remaining".format(
+                rule_set.duplicates, name, len(rule_set)))
+        self.rule_counts[name] = len(rule_set)
+        return optimized_fn
+
+    def _merge_rules(self, cfg):
+        """ Replace the rules files of ``cfg`` with their union, which the instance builds before the attack """
+        cfg.rule_sources = cfg.rules
+        name = '{}.rule'.format(hashlib.md5('\0'.join(cfg.rules)).hexdigest()[:12])
+        local_rules = [os.path.join(self.tmpdir, rule) for rule in cfg.rules
+                       if not rule.startswith(self.hashcat_home)]
+        if all(os.path.isfile(rules_fn) for rules_fn in local_rules) and len(local_rules) == len(cfg.rules):
+            rule_set = RuleSet()
+            for rules_fn in local_rules:
+                with open(rules_fn) as rules_fh:
+                    for _ in rule_set.add(rules_fh):
+                        pass
+            self.rule_counts[name] = len(rule_set)
+        else:  # the union is no larger than the sum of its parts
+            scheduler = Scheduler(rule_counts=self.rule_counts)
+            self.rule_counts[name] = sum(scheduler.rules_length([rule]) for rule in cfg.rules)
+        cfg.rules = [name]
+
+    def _combine(self, batch):
+        """ Merge attacks which differ only in their hashlist into one attack against all of the hashlists
+
+            The combined hashlist is built on the instance and the results are split back into each hashlist
+            afterwards, see _generate_script. Unsalted hashes are tested against every hash at once, so an attack
+            against several hashlists takes little longer than one against a single hashlist. Salted hashes are
+            each attacked separately regardless, so attacks on them are never combined.
+        """
+        groups = OrderedDict()
+        for num, cfg in enumerate(batch):
+            if hashtypes.is_unsalted(cfg.hash_type):
+                key = (cfg.attack_digest, tuple(cfg.ranges), cfg.time_budget, cfg.update_hashlist, cfg.dump_cracked,
+                       cfg.make_dict)
             else:
-                for src in cfg.src:
-                    if '?' not in src:  # a '?' in a source indicates a mask
-                        # do not raise errors for missing source files when processing a batch
-                        if src not in uploaded_sources:
-                            self._handle_file(s3bucket, 'wordlists', src, len(batch) == 1)
-                            uploaded_sources.add(src)
-                        sources.append(os.path.join('/tmp', os.path.basename(src)))
-                    else:
-                        sources.append(src)
-                cfg.src = sources
+                key = num
+            groups.setdefault(key, []).append(cfg)
+        combined = []
+        for members in groups.values():
+            if len(members) == 1:
+                combined.append(members[0])
+                continue
+            cfg = copy.copy(members[0])
+            cfg.members = members
+            cfg.target = os.path.join(os.path.dirname(cfg.target), 'combined-{}.hashes'.format(len(combined) + 1))
+            print("Combining attack -a{} -m{} against {} into a single attack".format(
+                cfg.attack_mode, cfg.hash_type, ', '.join("'{}'".format(os.path.basename(member.target))
+                                                          for member in members)))
+            combined.append(cfg)
+        return combined
 
-            # upload rules
-            if cfg.rules is not None:
-                if cfg.rules.startswith('builtin:'):
-                    cfg.rules = cfg.rules.replace('builtin:', os.path.join(self.hashcat_home, 'rules/'))
-                else:
-                    if cfg.rule not in uploaded_rules:
-                        self._handle_file(s3bucket, 'rules', cfg.rules)
-                        uploaded_rules.add(cfg.rules)
-                    cfg.rules = os.path.join('/tmp', os.path.basename(cfg.rules))
+    def _bootstrap_files(self, batch):
+        """ Return the S3 keys of every file the batch needs on the instance """
+        return sorted(set(name for cfg in batch for name in self._line_files(cfg)))
 
-    def _bootstrap_instance(self, batch):
-        instance = self._get_instance()
+    def _line_files(self, cfg):
+        """ Return the S3 keys of the files a single attack needs on the instance """
+        names = [os.path.join('hashlists', os.path.basename(member.target)) for member in cfg.members or [cfg]]
+        names.extend(os.path.join('wordlists', os.path.basename(src)) for src in cfg.src if '?' not in src)
+        names.extend(os.path.join('rules', os.path.basename(rule)) for rule in cfg.rule_sources or cfg.rules
+                     if not rule.startswith(self.hashcat_home))
+        return names
 
-        # bootstrap instance
-        print('Bootstrapping Instance...')
-        targets, sources, rules = set(), set(), set()
+    def _place_data(self, batch):
+        """ Choose where attack data is stored on the instance, sizing the root volume and rewriting paths """
+        required = outputs = 0
+        for name in self._bootstrap_files(batch):
+            filetype, name = name.split('/', 1)
+            obj = self.s3objects[filetype].get(name)
+            size = obj.size if obj is not None else 0
+            required += size
+            if filetype == 'hashlists':
+                # its .orig copy, cracked.out, the .dmp2 and .dic2 written from it and, when attacks are combined,
+                # the combined hashlist and the hashes split back out of it
+                outputs += size * 5
+        # the dumps and wordlists results are merged into are downloaded (.dmp1, .dic1) and rewritten
+        merged = set()
         for cfg in batch:
-            targets.add(cfg.target)
-            sources = sources.union(cfg.src)
-            rules.add(cfg.rules)
-
-        for target in targets:
-            instance.get_hashlist(os.path.basename(target))
-        for src in sources:
-            if '?' not in src:
-                instance.get_wordlist(os.path.basename(src))
-        for rule in rules:
-            if rule and not rule.startswith(self.hashcat_home):
-                instance.get_rules(os.path.basename(rule))
-
-        # detect & upload additional files, rewriting paths
+            base = os.path.basename(cfg.target).rsplit('.', 1)[0]
+            if cfg.dump_cracked:
+                merged.add(('dumps', '{}.dmp'.format(base)))
+            if cfg.make_dict:
+                merged.add(('wordlists', '{}.dic'.format(base)))
+        if any(filetype == 'dumps' for filetype, _ in merged):
+            self._index_files(['dumps'])
+        for filetype, name in merged:
+            obj = self.s3objects[filetype].get(name)
+            outputs += obj.size * 2 if obj is not None else 0
+        choice = self.cfg.ec2_data_placement
+        if self.cfg.use_instance is not None and choice == 'auto':
+            choice = 'root'
+        self.placement = DataPlacement(self.cfg.ec2_instance_type, required, choice, outputs)
+        print(self.placement.describe())
+        if self.cfg.use_instance is None:
+            if self.cfg.ec2_volume_size is None:
+                self.cfg.ec2_volume_size = self.placement.volume_size
+            elif self.cfg.ec2_volume_size < self.placement.volume_size:
+                print('Warning: --ec2-volume-size {} is smaller than the {} GB the attack data needs'.format(
+                    self.cfg.ec2_volume_size, self.placement.volume_size))
+            print('Root volume size: {} GB'.format(self.cfg.ec2_volume_size))
+        self._rewrite_paths(batch, self.placement.data_dir)
+
+    def _rewrite_paths(self, batch, data_dir):
+        for cfg in batch:
+            cfg.target = os.path.join(data_dir, os.path.basename(cfg.target))
+            cfg.src = [src if '?' in src else os.path.join(data_dir, os.path.basename(src)) for src in cfg.src]
+            cfg.rules = [rule if rule.startswith(self.hashcat_home) else os.path.join(data_dir, os.path.basename(rule))
+                         for rule in cfg.rules]
+            if cfg.rule_sources:
+                cfg.rule_sources = [rule if rule.startswith(self.hashcat_home) else
+                                    os.path.join(data_dir, os.path.basename(rule)) for rule in cfg.rule_sources]
+
+    def _extra_files(self, batch, data_dir=None):
+        """ Detect local files referenced by hashcat arguments, rewriting their paths for the instance """
+        data_dir = data_dir or self.placement.data_dir
+        files = {}
         for cfg in batch:
             hashcat_args = cfg.hashcat_args
             for arg in cfg.hashcat_args.split():
                 if '=' in arg:
                     arg = arg.split('=', 1)[1]
                 if os.path.isfile(arg):
-                    remote = os.path.join('/tmp', os.path.basename(arg))
-                    instance.copy_file(arg, remote)
-                    hashcat_args = hashcat_args.replace(arg, remote)
+                    files[arg] = os.path.join(data_dir, os.path.basename(arg))
+                    hashcat_args = hashcat_args.replace(arg, files[arg])
             cfg.hashcat_args = hashcat_args
+        return files
 
+    def _bootstrap_instance(self, batch):
+        with profile.phase('launch instance'):
+            instance = self._get_instance()
+
+        print('Bootstrapping Instance...')
+        for command in self.placement.setup_commands():
+            instance.execute_command(command)
+        # the crack script fetches the files from S3 itself, see _fetch_commands
+        for local_fn, remote_fn in self._extra_files(batch).items():
+            instance.copy_file(local_fn, remote_fn)
         return instance
 
+    def _start_headless_task(self, batch):
+        """ Render the bootstrap and crack script into the user data of a new instance """
+        instance = aws.Ec2Instance(self.cfg)
+        commands = []
+        if self.cfg.ec2_spot_instance:
+            commands.append(instance.pretermination_command('killall cudaHashcat64.bin'))
+        commands.extend(self._watchdog_commands(instance))
+        commands.extend(self.placement.setup_commands())
+        for local_fn, remote_fn in self._extra_files(batch).items():
+            with open(local_fn) as local_fh:
+                commands.extend(instance.file_commands(remote_fn, local_fh.read()))
+        commands.extend(self._generate_script(batch))
+        self._start_headless(instance, commands, 'ec2hashcat')
+
     def _generate_script(self, batch):
         # generate script commands
-        commands = ['INSTANCE_ID="$(wget -q -O - http://169.254.169.254/latest/meta-data/instance-id)"']
+        # dumps are sorted bytewise so that they can be searched with ranged GETs
+        commands = ['INSTANCE_ID="$(wget -q -O - http://169.254.169.254/latest/meta-data/instance-id)"',
+                    'export LC_ALL=C']
         hashcat_bin = os.path.join(self.hashcat_home, 'cudaHashcat64.bin')
+        cracked_fn = os.path.join(self.placement.data_dir, 'cracked.out')
+        if self.cfg.stream:
+            commands.extend(self._stream_commands(cracked_fn))
+        if self.cfg.telemetry:
+            commands.extend(Telemetry.sample_commands())
+        # wordlists which are generated by earlier attacks may not be in S3 yet
+        fetched = []
+        for cfg in batch:
+            fetched.extend(name for name in self._line_files(cfg)
+                           if name not in fetched and name.split('/', 1)[1] in self.s3objects[name.split('/', 1)[0]])
+        commands.extend(self._fetch_commands(fetched))
+        # record what the session runs on and yields, for the report command
+        metadata_url = aws.Ec2Instance.metadata_url
+        commands.append('LAUNCHED=$(($(date +%s) - $(cut -d. -f1 /proc/uptime)))')
+        commands.append(self._record_command(
+            'launch', dict(session=self.cfg.session_name, region=self.cfg.aws_region,
+                           spot=bool(self.cfg.ec2_spot_instance)),
+            numbers=[('launched', '$LAUNCHED')],
+            strings=[('instance_id', '$INSTANCE_ID'),
+                     ('instance_type', '$(wget -q -O - {}/instance-type)'.format(metadata_url)),
+                     ('zone', '$(wget -q -O - {}/placement/availability-zone)'.format(metadata_url))]))
         for i, cfg in enumerate(batch, start=1):
-            target_base = cfg.target.rsplit('.', 1)[0]
+            members = cfg.members or [cfg]
             commands.append('# batch {}'.format(i))
-            commands.append('test -f {}.orig || cp {} {}.orig'.format(cfg.target, cfg.target, cfg.target))
-            commands.append('{} -a{} -m{} --remove {} {} {} {}'.format(
-                hashcat_bin,
-                cfg.attack_mode,
-                cfg.hash_type,
-                '-r {}'.format(cfg.rules) if cfg.rules is not None else '',
-                cfg.hashcat_args,
-                cfg.target,
-                ' '.join(cfg.src)))
-            if cfg.update_hashlist:
-                # update the s3 hashlist with remaining (uncracked) hashes
-                commands.append('echo Uploading updated hashlist to S3...')
-                commands.append('echo "ec2://$INSTANCE_ID{} -> s3://{}/hashlists/{}"'
-                                .format(cfg.target, self.cfg.s3_bucket, os.path.basename(cfg.target)))
-                commands.append('aws s3 cp {} s3://{}/hashlists/{} >/dev/null'
-                                .format(cfg.target, self.cfg.s3_bucket, os.path.basename(cfg.target)))
-            if cfg.dump_cracked:
-                commands.append('echo Merging hashdump...')
-                # download any previous dumps for this hashlist
-                commands.append('aws s3 cp s3://{}/dumps/{}.dmp {}.dmp1 >/dev/null'
-                                .format(cfg.s3_bucket, os.path.basename(target_base), target_base))
-                # merge with dump for this session
-                commands.append('{} --quiet --show --outfile-format=7 --outfile={}.dmp2 {}.orig'
-                                .format(hashcat_bin, target_base, cfg.target))
-                commands.append('sort -u {}.dmp? > {}.dmp'.format(target_base, target_base))
-                # and upload to s3 /dumps/<target>
-                commands.append('echo Uploading updated hashdump to S3...')
-                commands.append('echo "ec2://$INSTANCE_ID{}.dmp -> s3://{}/dumps/{}.dmp"'
-                                .format(target_base, self.cfg.s3_bucket, os.path.basename(target_base)))
-                commands.append('aws s3 cp {}.dmp s3://{}/dumps/{}.dmp >/dev/null'
-                                .format(target_base, self.cfg.s3_bucket, os.path.basename(target_base)))
-            if cfg.make_dict:
-                commands.append('echo Merging wordlist...')
-                # download previous wordlist for this hashlist
-                commands.append('aws s3 cp s3://{}/wordlists/{}.dic {}.dic1 >/dev/null'
-                                .format(cfg.s3_bucket, os.path.basename(target_base), target_base))
-                # merge with wordlist for this session
-                commands.append('{} --quiet --show --outfile-format=2 --outfile={}.dic2 {}.orig'
-                                .format(hashcat_bin, target_base, cfg.target))
-                commands.append("sort {}.dic? | uniq -c | sort -rn | awk '{{print $2}}' > {}.dic"
-                                .format(target_base, target_base))
-                # and upload to s3 /wordlists/<target>
-                commands.append('echo Uploading updated wordlist to S3...')
-                commands.append('echo "ec2://$INSTANCE_ID{}.dic -> s3://{}/wordlists/{}.dic"'
-                                .format(target_base, self.cfg.s3_bucket, os.path.basename(target_base)))
-                commands.append('aws s3 cp {}.dic s3://{}/wordlists/{}.dic >/dev/null'
-                                .format(target_base, self.cfg.s3_bucket, os.path.basename(target_base)))
-        for target in set(cfg.target for cfg in batch):
+            commands.extend('wait_for {}'.format(os.path.basename(name)) for name in self._line_files(cfg)
+                            if name in fetched)
+            if cfg.members:
+                commands.append('cat {} | sort -u > {}'.format(' '.join(member.target for member in members),
+                                                              cfg.target))
+            # skip the remaining attacks against a hashlist once every hash has been cracked
+            commands.append('if test -s {}; then'.format(cfg.target))
+            commands.extend('test -f {}.orig || cp {} {}.orig'.format(member.target, member.target, member.target)
+                            for member in members)
+            commands.append('COMPLETED=""')
+            commands.append('LINE_START=$(date +%s)')
+            commands.append('LINE_HASHES=$(wc -l < {})'.format(cfg.target))
+            if cfg.rule_sources:
+                commands.append(self._rule_merge_command(cfg))
+            telemetry_fn = os.path.join(self.placement.data_dir, 'telemetry-{}'.format(i))
+            if self.cfg.telemetry:
+                commands.extend(Telemetry.start_commands('{}.csv'.format(telemetry_fn), '{}.log'.format(telemetry_fn),
+                                                         self.cfg.telemetry_interval))
+            for start, end in cfg.ranges:
+                keyspace_range = Ledger.format_range(start, end)
+                hashcat_command = self._hashcat_command(cfg, self._outfile_args(cfg, cracked_fn),
+                                                        self._range_args(start, end), self._status_args(cfg))
+                if self.cfg.telemetry:
+                    # hashcat's status output is kept for its speed
+                    commands.append('{} | tee -a {}.log'.format(hashcat_command, telemetry_fn))
+                    commands.append('RC=${PIPESTATUS[0]}')
+                else:
+                    commands.append(hashcat_command)
+                    commands.append('RC=$?')
+                # hashcat exits with 0 once all hashes are cracked and 1 once the keyspace is exhausted
+                commands.append('if [ $RC -eq 0 -o $RC -eq 1 ]; then')
+                commands.extend(self.ledger.record_command(member.hashlist_digest, cfg.attack_digest, keyspace_range)
+                                for member in members)
+                commands.append('COMPLETED="$COMPLETED {}"'.format(keyspace_range))
+                commands.append('fi')
+            if self.cfg.telemetry:
+                commands.extend(Telemetry.stop_commands(
+                    '{}.csv'.format(telemetry_fn), '{}.log'.format(telemetry_fn),
+                    's3://{}/sessions/{}/$INSTANCE_ID/telemetry-{}.csv'.format(
+                        self.cfg.s3_bucket, self.cfg.session_name, i)))
+            commands.append(self._record_command(
+                'line-{}'.format(i), dict(line=i, attack_mode=cfg.attack_mode, hash_type=cfg.hash_type,
+                                          target='+'.join(os.path.basename(member.target) for member in members),
+                                          sources=[os.path.basename(src) for src in cfg.src],
+                                          rules=[os.path.basename(rule) for rule in cfg.rules]),
+                numbers=[('hashes', '$LINE_HASHES'), ('started', '$LINE_START'), ('finished', '$(date +%s)'),
+                         ('cracked', '$((LINE_HASHES - $(wc -l < {})))'.format(cfg.target))]))
+            for member in members:
+                if cfg.members:
+                    # the hashes cracked by the combined attack are in the potfile, leave the rest in the hashlist
+                    commands.append('{} --quiet -m{} --left --outfile={}.left {} && touch {}.left && mv {}.left {}'
+                                    .format(hashcat_bin, cfg.hash_type, member.target, member.target,
+                                            member.target, member.target, member.target))
+                commands.extend(self._result_commands(member, hashcat_bin, fetched))
+            commands.append('else')
+            commands.append('echo All hashes in {} cracked, skipping batch {}'.format(
+                ', '.join(os.path.basename(member.target) for member in members), i))
+            commands.append('fi')
+        for target in set(member.target for cfg in batch for member in cfg.members or [cfg]):
             # delete any cracked hashlists from S3
             commands.append('echo Deleting {} from S3...'.format(os.path.basename(target)))
             commands.append('test -f {} && test -s {} || aws s3 rm s3://{}/hashlists/{} >/dev/null'
                             .format(target, target, self.cfg.s3_bucket, os.path.basename(target)))
+        commands.append('kill $FETCH_PID 2>/dev/null')
+        if self.cfg.stream:
+            commands.append('kill $STREAM_PID; wait $STREAM_PID 2>/dev/null; stream_cracked flush')
+        commands.append(self._record_command('end', {}, numbers=[('finished', '$(date +%s)')]))
         if self.cfg.shell:
             commands.append('bash')
         if self.cfg.shutdown:
             commands.append('sudo poweroff')
         return commands
 
+    def _result_commands(self, cfg, hashcat_bin, fetched):
+        """ Return commands uploading what remains of the hashlist of ``cfg`` and merging its cracked hashes """
+        commands = []
+        target_base = cfg.target.rsplit('.', 1)[0]
+        if cfg.update_hashlist:
+            # update the s3 hashlist with remaining (uncracked) hashes
+            commands.append('echo Uploading updated hashlist to S3...')
+            commands.append('echo "ec2://$INSTANCE_ID{} -> s3://{}/hashlists/{}"'
+                            .format(cfg.target, self.cfg.s3_bucket, os.path.basename(cfg.target)))
+            commands.append('aws s3 cp {} s3://{}/hashlists/{} >/dev/null'
+                            .format(cfg.target, self.cfg.s3_bucket, os.path.basename(cfg.target)))
+            # the remaining hashes are a subset of the original, so completed ranges carry over
+            commands.append('ETAG="$(aws s3api head-object --bucket {} --key hashlists/{} '
+                            '--query ETag --output text | tr -d \'"\')"'
+                            .format(self.cfg.s3_bucket, os.path.basename(cfg.target)))
+            commands.append('for RANGE in $COMPLETED; do {}; done'.format(
+                self.ledger.record_command('$ETAG', cfg.attack_digest, '$RANGE')))
+        if cfg.dump_cracked:
+            commands.append('echo Merging hashdump...')
+            # download any previous dumps for this hashlist
+            commands.append('aws s3 cp s3://{}/dumps/{}.dmp {}.dmp1 >/dev/null'
+                            .format(cfg.s3_bucket, os.path.basename(target_base), target_base))
+            # merge with dump for this session
+            commands.append('{} --quiet --show --outfile-format=7 --outfile={}.dmp2 {}.orig'
+                            .format(hashcat_bin, target_base, cfg.target))
+            commands.append('sort -u {}.dmp? > {}.dmp'.format(target_base, target_base))
+            # and upload to s3 /dumps/<target>
+            commands.append('echo Uploading updated hashdump to S3...')
+            commands.append('echo "ec2://$INSTANCE_ID{}.dmp -> s3://{}/dumps/{}.dmp"'
+                            .format(target_base, self.cfg.s3_bucket, os.path.basename(target_base)))
+            commands.append('aws s3 cp {}.dmp s3://{}/dumps/{}.dmp --metadata hash-type={} >/dev/null'
+                            .format(target_base, self.cfg.s3_bucket, os.path.basename(target_base), cfg.hash_type))
+            commands.extend(DumpIndex.build_commands('{}.dmp'.format(target_base), self.cfg.s3_bucket))
+        if cfg.make_dict:
+            commands.append('echo Merging wordlist...')
+            if os.path.join('wordlists', '{}.dic'.format(os.path.basename(target_base))) in fetched:
+                # a later attack uses the wordlist, which must not be fetched over the merged one
+                commands.append('wait_for {}.dic'.format(os.path.basename(target_base)))
+            # download previous wordlist for this hashlist
+            commands.append('aws s3 cp s3://{}/wordlists/{}.dic {}.dic1 >/dev/null'
+                            .format(cfg.s3_bucket, os.path.basename(target_base), target_base))
+            # merge with wordlist for this session
+            commands.append('{} --quiet --show --outfile-format=2 --outfile={}.dic2 {}.orig'
+                            .format(hashcat_bin, target_base, cfg.target))
+            commands.append("sort {}.dic? | uniq -c | sort -rn | awk '{{print $2}}' > {}.dic"
+                            .format(target_base, target_base))
+            # and upload to s3 /wordlists/<target>
+            commands.append('echo Uploading updated wordlist to S3...')
+            commands.append('echo "ec2://$INSTANCE_ID{}.dic -> s3://{}/wordlists/{}.dic"'
+                            .format(target_base, self.cfg.s3_bucket, os.path.basename(target_base)))
+            commands.append('aws s3 cp {}.dic s3://{}/wordlists/{}.dic >/dev/null'
+                            .format(target_base, self.cfg.s3_bucket, os.path.basename(target_base)))
+        return commands
+
+    def _fetch_commands(self, names):
+        """ Return commands fetching the S3 keys ``names`` in order in the background, and defining ``wait_for``
+
+            Each file is downloaded alongside its final name and moved into place once complete, and marked as
+            fetched (or failed) in a directory of this run's own, so attacks can start as soon as the files they
+            need have arrived while later attacks' files are still downloading.
+        """
+        return [
+            'FETCHED=$(mktemp -d)',
+            'fetch_files() {',
+            'for KEY in {}; do'.format(' '.join(names)),
+            'FN={}/$(basename $KEY)'.format(self.placement.data_dir),
+            'if aws s3 cp s3://{}/$KEY $FN.part >/dev/null && mv $FN.part $FN; then touch $FETCHED/$(basename $KEY); '
+            'else touch $FETCHED/$(basename $KEY).failed; fi'.format(self.cfg.s3_bucket),
+            'done',
+            '}',
+            'fetch_files &',
+            'FETCH_PID=$!',
+            'wait_for() {',
+            'test -e $FETCHED/$1 -o -e $FETCHED/$1.failed || echo "Waiting for $1..."',
+            'while [ ! -e $FETCHED/$1 -a ! -e $FETCHED/$1.failed ] && kill -0 $FETCH_PID 2>/dev/null; do sleep 1; done',
+            'test -e $FETCHED/$1 || echo "Could not fetch $1 from s3://{}/"'.format(self.cfg.s3_bucket),
+            '}']
+
+    def _hashcat_command(self, cfg, outfile_args='', range_args='', status_args=''):
+        return '{} -a{} -m{} --remove {}{} {} {} {} {} {} {}'.format(
+            os.path.join(self.hashcat_home, 'cudaHashcat64.bin'),
+            cfg.attack_mode,
+            cfg.hash_type,
+            status_args,
+            outfile_args,
+            ' '.join('-r {}'.format(rule) for rule in cfg.rules),
+            '--runtime={}'.format(cfg.time_budget) if cfg.time_budget is not None else '',
+            range_args,
+            cfg.hashcat_args,
+            cfg.target,
+            ' '.join(cfg.src))
+
+    @classmethod
+    def _rule_merge_command(cls, cfg):
+        return "test -f {} || awk 'NF && !/^#/ && !seen[$0]++' {} > {}".format(
+            cfg.rules[0], ' '.join(cfg.rule_sources), cfg.rules[0])
+
+    def _enqueue(self, batch):
+        """ Queue the batch as a job for worker instances, with paths relative to the job's ``$DATA`` """
+        inline = {}
+        for local_fn, remote_fn in self._extra_files(batch, '$DATA').items():
+            with open(local_fn) as local_fh:
+                inline[os.path.basename(remote_fn)] = base64.b64encode(local_fh.read())
+        lines = []
+        for i, cfg in enumerate(batch, start=1):
+            lines.append(dict(
+                line=i,
+                target=os.path.basename(cfg.target),
+                ranges=cfg.ranges,
+                hashlist_digest=cfg.hashlist_digest,
+                attack_digest=cfg.attack_digest,
+                prepare=[self._rule_merge_command(cfg)] if cfg.rule_sources else [],
+                hashcat=self._hashcat_command(cfg),
+                keyspace='{} -a{} {} {} --keyspace {}'.format(
+                    os.path.join(self.hashcat_home, 'cudaHashcat64.bin'), cfg.attack_mode,
+                    ' '.join('-r {}'.format(rule) for rule in cfg.rules), cfg.hashcat_args, ' '.join(cfg.src)),
+                hash_type=str(cfg.hash_type),
+                update_hashlist=cfg.update_hashlist,
+                dump_cracked=cfg.dump_cracked,
+                make_dict=cfg.make_dict,
+                index=DumpIndex.build_commands('{}.dmp'.format(cfg.target.rsplit('.', 1)[0]), self.cfg.s3_bucket)))
+        spec = dict(session=self.cfg.session_name, chunks=self.cfg.queue_chunks, files=self._bootstrap_files(batch),
+                    inline=inline, lines=lines)
+        job = JobQueue(self.s3bucket).enqueue(spec)
+        print("Queued job '{}' with {} attack(s), use `ec2hashcat jobs` to follow its progress".format(job, len(lines)))
+
+    def _record_command(self, name, record, numbers=(), strings=()):
+        """ Return a command writing ``record`` to ``sessions/<session>/<instance>/<name>.json`` on S3
+
+            ``numbers`` and ``strings`` are ``(key, shell expression)`` pairs evaluated on the instance.
+        """
+        fields = [json.dumps(record, sort_keys=True)[1:-1].replace('%', '%%')]
+        fields.extend('"{}": %d'.format(key) for key, _ in numbers)
+        fields.extend('"{}": "%s"'.format(key) for key, _ in strings)
+        values = ' '.join('"{}"'.format(expr) for _, expr in list(numbers) + list(strings))
+        return 'printf {} {} | aws s3 cp - s3://{}/sessions/{}/$INSTANCE_ID/{}.json >/dev/null'.format(
+            pipes.quote('{{{}}}\\n'.format(', '.join(field for field in fields if field))), values,
+            self.cfg.s3_bucket, self.cfg.session_name, name)
+
+    def _outfile_args(self, cfg, cracked_fn):
+        if not self.cfg.stream or re.search(r'(^|\s)(-o|--outfile(?!-))', cfg.hashcat_args):
+            return ''
+        return '--outfile={} --outfile-format=7'.format(cracked_fn)
+
+    def _stream_commands(self, cracked_fn):
+        """ Return commands starting a background uploader which ships new lines of ``cracked_fn`` to S3
+
+            Chunks are written to ``cracked/<session>/<epoch>-<instance>-<seq>.txt`` once ``--stream-count``
+            cracks are pending or ``--stream-interval`` seconds have passed, and once more when the task ends.
+        """
+        state_fn = '{}.state'.format(cracked_fn)
+        chunk_url = 's3://{}/cracked/{}/$(printf %010d-%s-%06d $NOW $INSTANCE_ID $SEQ).txt'.format(
+            self.cfg.s3_bucket, self.cfg.session_name)
+        return [
+            'touch {}'.format(cracked_fn),
+            'test -f {} || echo "0 0" > {}'.format(state_fn, state_fn),
+            'stream_cracked() {',
+            'LAST=$(date +%s)',
+            'while :; do',
+            'read SENT SEQ < {}'.format(state_fn),
+            'TOTAL=$(wc -l < {})'.format(cracked_fn),
+            'NOW=$(date +%s)',
+            'if [ $TOTAL -gt $SENT ] && [ "$1" = flush -o $((TOTAL - SENT)) -ge {} -o $((NOW - LAST)) -ge {} ]; then'
+            .format(self.cfg.stream_count, self.cfg.stream_interval),
+            'SEQ=$((SEQ + 1))',
+            'tail -n +$((SENT + 1)) {} | head -n $((TOTAL - SENT)) | aws s3 cp - "{}" >/dev/null && '
+            'echo "$TOTAL $SEQ" > {}'.format(cracked_fn, chunk_url, state_fn),
+            'LAST=$NOW',
+            'fi',
+            'test "$1" = flush && break',
+            'sleep 1',
+            'done',
+            '}',
+            'stream_cracked &',
+            'STREAM_PID=$!']
+
+    def _status_args(self, cfg):
+        """ Return the arguments making hashcat print its status (and speed) for telemetry """
+        if not self.cfg.telemetry or '--status' in cfg.hashcat_args.split():
+            return ''
+        return '--status --status-timer={} '.format(self.cfg.telemetry_interval)
+
+    @classmethod
+    def _range_args(cls, start, end):
+        args = []
+        if start:
+            args.append('--skip={}'.format(start))
+        if end is not None:
+            args.append('--limit={}'.format(end - start))
+        return ' '.join(args)
+
     def _start_task(self, instance, commands):
         # set pre-termination hook so we don't lose work
         if self.cfg.ec2_spot_instance:
             instance.set_pretermination_command('killall cudaHashcat64.bin')
+        self._set_watchdog(instance)
         # upload scrip to instance
         script_fn = instance.create_script(commands)
         # run script
@@ -4,7 +4,8 @@ from __future__ import print_function
 import os
 from time import sleep
 
-from ec2hashcat import aws, utils
+from ec2hashcat import aws, exceptions, utils
+from ec2hashcat.aws.ssh import SshConnection, SshPool
 from ec2hashcat.commands.base import BaseCommand
 
 
@@ -113,17 +114,61 @@ class Stop(BaseEc2Accessor):
         super(Stop, cls).setup_parser(parser)
         terminate_args = parser.add_argument_group('terminate arguments')
         terminate_args.add_argument('-f', '--force', action='store_true')
+        terminate_args.add_argument('-j', '--jobs', action='store_num', type=int, default=8, min=1,
+                                    help='Number of instances to shut down concurrently')
         terminate_args.add_argument('instances', metavar='INSTANCE_ID|INSTANCE_TAG', nargs='+')
 
     def handle(self):
         ec2 = aws.Ec2(self.cfg)
-        for instance in self.cfg.instances:
-            instance = ec2.find_running_instance(instance)
-            if not self.cfg.force:
-                print("Gracefully shutting down Instance '{}'".format(instance.instance.id))
-                # unhook the termination handler
-                instance.execute_command('screen -XS termination_handler quit')
-                # kill and current running hashcat sessions (causing an upload)
-                instance.execute_command('killall cudaHashcat64.bin')
-                sleep(30)
+        instances = [ec2.find_running_instance(instance) for instance in self.cfg.instances]
+        if not self.cfg.force:
+            SshPool.map(self._shutdown, instances, self.cfg.jobs)
+            sleep(30)
+        for instance in instances:
             instance.terminate()
+
+    @classmethod
+    def _shutdown(cls, instance):
+        """ Stop the instance's attack so that it uploads its results, unless it cannot be reached """
+        print("Gracefully shutting down Instance '{}'".format(instance.instance.id))
+        try:
+            # unhook the termination handler
+            instance.execute_command('screen -XS termination_handler quit')
+            # kill and current running hashcat sessions (causing an upload)
+            instance.execute_command('killall cudaHashcat64.bin')
+        except SshConnection.errors as err:
+            print("Could not shut down Instance '{}' gracefully, terminating it regardless: {}".format(
+                instance.instance.id, err))
+
+
+class Exec(BaseEc2Accessor):
+    """ Run a command on running instances, several at once """
+
+    @classmethod
+    def setup_parser(cls, parser):
+        super(Exec, cls).setup_parser(parser)
+        exec_args = parser.add_argument_group('exec arguments')
+        exec_args.add_argument('-j', '--jobs', action='store_num', type=int, default=8, min=1,
+                               help='Number of instances to run the command on concurrently')
+        exec_args.add_argument('command', help='shell command to run')
+        exec_args.add_argument('instances', metavar='INSTANCE_ID|SESSION_NAME', nargs='*',
+                               help='Instances to run the command on (default=all running instances)')
+
+    def handle(self):
+        aws.SecurityGroup(self.cfg).add_ip(utils.get_external_ip())
+        instances = [aws.Ec2Instance(self.cfg, instance_id=instance.id)
+                     for instance in aws.Ec2(self.cfg).get_running_instances(self.cfg.instances)]
+        if not instances:
+            raise exceptions.EC2InstanceError('No running instances found')
+        for instance, (status, output) in zip(instances, SshPool.map(self._execute, instances, self.cfg.jobs)):
+            print('==> {} ({}) <=='.format(instance.instance.id, 'exit {}'.format(status) if status is not None
+                                             else 'unreachable'))
+            if output.strip():
+                print(output.rstrip('\n'))
+
+    def _execute(self, instance):
+        """ Return the exit status (``None`` if the instance is unreachable) and output of the command """
+        try:
+            return instance.connection().run(self.cfg.command, pty=False)
+        except SshConnection.errors as err:
+            return None, str(err) or err.__class__.__name__
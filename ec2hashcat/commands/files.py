@@ -1,14 +1,32 @@
 """ Copyright 2015 Will Boyce """
 from __future__ import print_function
 
+from multiprocessing.pool import ThreadPool
+import fnmatch
 import os
 import subprocess
 import tempfile
+import time
 
 from fabric.api import hide, local
 
-from ec2hashcat import aws, exceptions
+from ec2hashcat import aws, exceptions, utils
 from ec2hashcat.commands.base import BaseCommand
+from ec2hashcat.index import DumpIndex
+from ec2hashcat.stats import WordlistStats
+
+
+def select(names, patterns, object_type, bucket):
+    """ Return the ``names`` matching any of ``patterns`` (names or globs), or all of them if there are none """
+    if not patterns:
+        return names
+    selected = set()
+    for pattern in patterns:
+        matches = fnmatch.filter(names, pattern)
+        if not matches and not any(char in pattern for char in '*?['):
+            raise exceptions.S3FileNotFoundError(object_type, pattern, bucket)
+        selected.update(matches)
+    return sorted(selected)
 
 
 class Cat(BaseCommand):
@@ -24,7 +42,7 @@ class Cat(BaseCommand):
     def handle(self):
         _, local_name = tempfile.mkstemp()
         s3bucket = aws.S3Bucket(self.cfg)
-        s3bucket.download_object(self.cfg.type, self.cfg.filename, local_name, quiet=True)
+        s3bucket.download_object(self.cfg.type, self.cfg.filename, local_name, quiet=True, cached=True, link=True)
         subprocess.call(['cat', local_name])
         os.unlink(local_name)
 
@@ -40,19 +58,32 @@ class Delete(BaseCommand):
         del_mutex_args = del_args.add_mutually_exclusive_group()
         del_mutex_args.add_argument('-f', '--force', action='store_true')
         del_mutex_args.add_argument('-i', '--interactive', action='store_true')
-        del_args.add_argument('files', metavar='name', nargs='*')
+        del_args.add_argument('-n', '--dry-run', action='store_true',
+                              help='Show the files which would be deleted without deleting them')
+        del_args.add_argument('-j', '--jobs', action='store_num', type=int, default=4, min=1,
+                              help='Number of delete requests (of up to 1000 files each) to run concurrently')
+        del_args.add_argument('files', metavar='name', nargs='*',
+                              help='names or glob patterns (e.g. "rockyou*") of files to delete')
 
     def handle(self):
-        if not self.cfg.files and not self.cfg.force:
+        if not self.cfg.files and not self.cfg.force and not self.cfg.dry_run:
             if not self.prompt("Really delete all files of type '{}'?".format(self.cfg.type), default=False):
                 raise exceptions.Cancelled()
         s3bucket = aws.S3Bucket(self.cfg)
-        if not self.cfg.files:
-            self.cfg.files = s3bucket.get_object_list(self.cfg.type)
-        for name in self.cfg.files:
-            if self.cfg.interactive and not self.prompt('Delete {}/{}?'.format(self.cfg.type, name)):
-                continue
-            s3bucket.delete_object(self.cfg.type, name)
+        names = select(s3bucket.get_object_list(self.cfg.type), self.cfg.files, self.cfg.type, self.cfg.s3_bucket)
+        if self.cfg.interactive:
+            names = [name for name in names if self.prompt('Delete {}/{}?'.format(self.cfg.type, name))]
+        keys = [os.path.join(self.cfg.type, name) for name in names]
+        sidecars = {'dumps': DumpIndex, 'wordlists': WordlistStats}.get(self.cfg.type)
+        if sidecars is not None and names:
+            # only those which exist, as not every file has one
+            existing = set(obj.key for obj in s3bucket.get_objects(sidecars.prefix))
+            keys.extend(key for key in (sidecars.sidecar_key(name) for name in names) if key in existing)
+        if self.cfg.dry_run:
+            for key in keys:
+                print('Would delete s3://{}/{}'.format(self.cfg.s3_bucket, key))
+            return
+        s3bucket.delete_objects(keys, jobs=self.cfg.jobs)
 
 
 class Get(BaseCommand):
@@ -78,6 +109,8 @@ class Get(BaseCommand):
         get_args.add_argument('-m', '--merge', action='store_true')
         get_args.add_argument('-s', '--merge-strategy', choices=cls.merge_strategies.keys())
         get_args.add_argument('-o', '--outfile', action='store')
+        get_args.add_argument('-j', '--jobs', action='store_num', type=int, default=4, min=1,
+                              help='Number of files to download concurrently')
         get_args.add_argument('type', choices=aws.S3Bucket.types)
         get_args.add_argument('files', metavar='name', nargs='*')
 
@@ -96,7 +129,7 @@ class Get(BaseCommand):
                 'cannot specify outfile when not merging and requesting more than one file')
 
     def _get_files(self):
-        local_names = []
+        downloads = []
         for remote in self.cfg.files:
             local_name = self.cfg.outfile or os.path.basename(remote)
             if self.cfg.merge:
@@ -107,9 +140,19 @@ class Get(BaseCommand):
                     prompt_txt = prompt_txt.format(local_name, self.cfg.s3_bucket, self.cfg.type, remote)
                     if not self.prompt(prompt_txt, default=self.cfg.force, skip=self.cfg.force):
                         continue
-            self.s3bucket.download_object(self.cfg.type, remote, local_name)
-            local_names.append(local_name)
-        return local_names
+            downloads.append((remote, local_name))
+        start = time.time()
+        pool = ThreadPool(min(self.cfg.jobs, len(downloads) or 1))
+        try:
+            # files which are only merged, and then deleted, can share the cached copy
+            sizes = pool.map(lambda download: self.s3bucket.download_object(
+                self.cfg.type, *download, cached=True, link=self.cfg.merge), downloads)
+        finally:
+            pool.close()
+        if len(downloads) > 1:
+            print('Downloaded {} files ({})'.format(len(downloads), utils.format_throughput(
+                sum(sizes), time.time() - start)))
+        return [local_name for _, local_name in downloads]
 
     def _merge(self, files):
         if self.cfg.merge:
@@ -141,11 +184,17 @@ class Put(BaseCommand):
         super(Put, cls).setup_parser(parser)
         put_args = parser.add_argument_group('put arguments')
         put_args.add_argument('-f', '--force', action='store_true')
+        put_args.add_argument('--no-stats', action='store_false', dest='stats', default=True,
+                              help='Do not collect the line count, lengths and character sets of wordlists')
+        put_args.add_argument('-m', '--hash-type', default=None,
+                              help='Hash type (-m) of dumps, which they are only matched against once set')
         put_args.add_argument('type', choices=aws.S3Bucket.types)
         put_args.add_argument('files', metavar='filename', nargs='+',
                               help='file(s) to upload')
 
     def handle(self):
+        if self.cfg.hash_type is not None and self.cfg.type != 'dumps':
+            raise exceptions.Ec2HashcatInvalidArguments('only dumps have a hash type')
         s3bucket = aws.S3Bucket(self.cfg)
         for name in self.cfg.files:
             if s3bucket.object_exists(self.cfg.type, os.path.basename(name)):
@@ -153,4 +202,32 @@ class Put(BaseCommand):
                     self.cfg.type, os.path.basename(name), name)
                 if not self.prompt(prompt_txt, default=self.cfg.force, skip=self.cfg.force):
                     continue
-            s3bucket.put_object(self.cfg.type, name)
+            if self.cfg.type == 'wordlists' and self.cfg.stats:
+                WordlistStats.put(s3bucket, name)
+            elif self.cfg.hash_type is not None:
+                s3bucket.put_object(self.cfg.type, name, metadata={'hash-type': self.cfg.hash_type})
+            else:
+                s3bucket.put_object(self.cfg.type, name)
+
+
+class Tag(BaseCommand):
+    """ Set the hash type of dumps already in S3, e.g. those uploaded without `put -m` """
+
+    @classmethod
+    def setup_parser(cls, parser):
+        super(Tag, cls).setup_parser(parser)
+        tag_args = parser.add_argument_group('tag arguments')
+        tag_args.add_argument('-m', '--hash-type', required=True)
+        tag_args.add_argument('files', metavar='name', nargs='+',
+                              help='names or glob patterns (e.g. "rockyou*") of dumps to tag')
+
+    def handle(self):
+        s3bucket = aws.S3Bucket(self.cfg)
+        for name in select(s3bucket.get_object_list('dumps'), self.cfg.files, 'dumps', self.cfg.s3_bucket):
+            key = 'dumps/{}'.format(name)
+            print('s3://{}/{} -> hash type {}'.format(self.cfg.s3_bucket, key, self.cfg.hash_type))
+            # a managed copy onto itself, as dumps may be too large for a single CopyObject
+            s3bucket.s3_client.copy(CopySource=dict(Bucket=self.cfg.s3_bucket, Key=key), Bucket=self.cfg.s3_bucket,
+                                    Key=key, Config=s3bucket.transfer_config,
+                                    ExtraArgs=dict(Metadata={'hash-type': self.cfg.hash_type},
+                                                   MetadataDirective='REPLACE'))
@@ -0,0 +1,35 @@
+""" Copyright 2015 Will Boyce """
+from __future__ import print_function
+
+import os
+
+from ec2hashcat import exceptions, hashtypes, utils
+from ec2hashcat.commands.base import BaseCommand
+
+
+class Identify(BaseCommand):
+    """ Suggest hash types (-m) for hashlists from a sample of their hashes """
+
+    @classmethod
+    def setup_parser(cls, parser):
+        super(Identify, cls).setup_parser(parser)
+        identify_args = parser.add_argument_group('identify arguments')
+        identify_args.add_argument('-n', '--top', action='store_num', type=int, min=1, default=3,
+                                   help='Number of hash types to suggest per hashlist')
+        identify_args.add_argument('--sample', action='store_num', type=int, min=1, default=10000,
+                                   help='Number of hashes to sample from each hashlist')
+        identify_args.add_argument('files', metavar='HASHLIST', nargs='+',
+                                   help='hashlist(s) to identify')
+
+    def handle(self):
+        for name in self.cfg.files:
+            if not os.path.isfile(name):
+                raise exceptions.FileNotFoundError(name)
+        table = []
+        for name in self.cfg.files:
+            modes = hashtypes.identify(hashtypes.sample_file(name, self.cfg.sample))
+            if not modes:
+                table.append([name, '-', 'unknown', '-'])
+            for mode, confidence in modes[:self.cfg.top]:
+                table.append([name, mode, hashtypes.NAMES[mode], '{:.0%}'.format(confidence)])
+        utils.print_table(table, ['Hashlist', 'Mode', 'Name', 'Confidence'])
@@ -0,0 +1,88 @@
+""" Copyright 2015 Will Boyce """
+from __future__ import print_function
+
+import inspect
+import os
+import pipes
+
+from ec2hashcat import aws, exceptions, utils, worker
+from ec2hashcat.commands.base import BaseCommand
+from ec2hashcat.commands.runscript import BaseEc2InstanceSessionCommand
+from ec2hashcat.jobs import JobQueue
+from ec2hashcat.placement import DataPlacement
+
+
+class Jobs(BaseCommand):
+    """ Show the progress of queued jobs, or cancel them """
+
+    @classmethod
+    def setup_parser(cls, parser):
+        super(Jobs, cls).setup_parser(parser)
+        jobs_args = parser.add_argument_group('jobs arguments')
+        jobs_args.add_argument('--cancel', action='store_true',
+                               help='Stop workers from starting any more chunks of the given jobs')
+        jobs_args.add_argument('jobs', metavar='JOB_ID', nargs='*', help='Jobs to show (default=all jobs)')
+
+    def handle(self):
+        queue = JobQueue(aws.S3Bucket(self.cfg))
+        if self.cfg.cancel:
+            if not self.cfg.jobs:
+                raise exceptions.Ec2HashcatInvalidArguments('no jobs to cancel')
+            for job in self.cfg.jobs:
+                queue.cancel(job)
+                print("Cancelled job '{}'".format(job))
+            return
+        table = []
+        for job in self.cfg.jobs or queue.get_jobs():
+            status = queue.status(job)
+            table.append([job, status['spec']['session'], len(status['spec']['lines']),
+                          '{}/{}'.format(status['done'], status['chunks']), status['running'], status['failed'],
+                          status['state'], '-' if status['cracked'] is None else status['cracked']])
+        if table:
+            utils.print_table(table, ['Job', 'Session', 'Attacks', 'Chunks', 'Running', 'Failed', 'State',
+                                      'Cracked'])
+
+
+class Workers(BaseEc2InstanceSessionCommand):
+    """ Launch worker instances which run queued jobs until there are none left """
+    worker_fn = '/tmp/ec2hashcat-worker.py'
+    default_volume_size = 100  # GB, for instance types without an instance store
+
+    @classmethod
+    def setup_parser(cls, parser):
+        super(Workers, cls).setup_parser(parser)
+        workers_args = parser.add_argument_group('workers arguments')
+        workers_args.add_argument('-n', '--count', action='store_num', type=int, min=1, default=1,
+                                  help='Number of worker instances to launch')
+        workers_args.add_argument('--idle-exit', metavar='MINUTES', action='store_num', type=int, min=1, default=15,
+                                  help='Stop a worker once it has found no work for MINUTES')
+
+    def handle(self):
+        if self.cfg.use_instance is not None or self.cfg.shell:
+            raise exceptions.Ec2HashcatInvalidArguments('workers always run headless on new instances')
+        if self.cfg.ec2_instance_profile is None:
+            # temporary credentials expire after a day and a half, leaving workers unable to reach S3
+            raise exceptions.Ec2HashcatInvalidArguments('workers need an --ec2-instance-profile to access S3')
+        self.cfg.attach = False
+        placement = DataPlacement(self.cfg.ec2_instance_type, 0, 'root')
+        if placement.store_size:
+            placement = DataPlacement(self.cfg.ec2_instance_type, 0, 'instance-store')
+        elif self.cfg.ec2_volume_size is None:
+            self.cfg.ec2_volume_size = self.default_volume_size
+        session = self.cfg.session_name or 'worker'
+        for num in range(1, self.cfg.count + 1):
+            self.cfg.session_name = session if self.cfg.count == 1 else '{}-{}'.format(session, num)
+            instance = aws.Ec2Instance(self.cfg)
+            commands = []
+            if self.cfg.ec2_spot_instance:
+                # interrupted chunks are stolen by other workers once their claims go stale
+                commands.append(instance.pretermination_command('killall cudaHashcat64.bin'))
+            commands.extend(self._watchdog_commands(instance))
+            commands.extend(placement.setup_commands())
+            commands.extend(instance.file_commands(self.worker_fn, inspect.getsource(worker)))
+            commands.append('python {} --bucket {} --data-dir {} --session {} --idle-exit {} --busy-file {}'.format(
+                self.worker_fn, self.cfg.s3_bucket, os.path.join(placement.data_dir, 'jobs'),
+                pipes.quote(self.cfg.session_name), self.cfg.idle_exit * 60, instance.busy_state_fn))
+            if self.cfg.shutdown:
+                commands.append('sudo poweroff')
+            self._start_headless(instance, commands, 'ec2hashcat')
@@ -3,12 +3,14 @@ from __future__ import print_function
 
 from datetime import datetime, timedelta
 from collections import defaultdict
+from multiprocessing.pool import ThreadPool
 import os
 
 import pytz
 
 from ec2hashcat import aws, utils
 from ec2hashcat.commands.base import BaseCommand
+from ec2hashcat.stats import WordlistStats
 
 
 class List(BaseCommand):
@@ -42,22 +44,58 @@ class List(BaseCommand):
         elif self.cfg.type == 'prices':
             headers = ['Zone', 'Price (USD)']
             table = aws.Ec2(self.cfg).get_spot_prices()
+        elif self.cfg.type == 'wordlists':
+            headers = ['Filename', 'Size', 'Last Modified', 'Lines', 'Duplicates', 'Length', 'Charsets']
+            table = self._list_wordlists()
         else:
             types = [self.cfg.type]
             if self.cfg.type == 'files':
                 types = aws.S3Bucket.types
             headers = ['Filename', 'Size', 'Last Modified']
-            for filetype in types:
-                objects = aws.S3Bucket(self.cfg).get_objects(filetype)
-                for obj in objects:
-                    key = obj.key
-                    if self.cfg.type != 'files':
-                        key = os.path.basename(key)
-                    table.append([key, obj.size, obj.last_modified])
+            table = self._list_files(types)
 
         if headers and table:
             utils.print_table(table, headers)
 
+    def _list_files(self, types):
+        """ List each type concurrently, returning the rows of each type together and in the order given """
+        s3bucket = aws.S3Bucket(self.cfg)
+
+        def list_type(filetype):
+            return [obj for page in s3bucket.iter_object_pages(filetype) for obj in page]
+
+        pool = ThreadPool(len(types))
+        try:
+            listings = pool.map_async(list_type, types).get(24 * 3600)  # a timeout keeps the wait interruptible
+        finally:
+            pool.close()
+        table = []
+        for objects in listings:
+            for obj in objects:
+                key = obj['Key'] if self.cfg.type == 'files' else os.path.basename(obj['Key'])
+                table.append([key, obj['Size'], obj['LastModified']])
+        return table
+
+    def _list_wordlists(self):
+        """ List wordlists with the stats collected when they were uploaded, fetching the stats concurrently """
+        s3bucket = aws.S3Bucket(self.cfg)
+        objects = s3bucket.get_objects('wordlists')
+        pool = ThreadPool(min(8, len(objects) or 1))
+        try:
+            stats = pool.map(lambda obj: WordlistStats.load(s3bucket, obj.key.split('/', 1)[1], obj.size), objects)
+        finally:
+            pool.close()
+        table = []
+        for obj, wordlist_stats in zip(objects, stats):
+            row = [obj.key.split('/', 1)[1], obj.size, obj.last_modified]
+            if wordlist_stats is None:  # uploaded without stats, or replaced by a crack session
+                row.extend(['-', '-', '-', '-'])
+            else:
+                row.extend([wordlist_stats.lines, '~{}'.format(wordlist_stats.duplicates),
+                            wordlist_stats.describe_lengths(), wordlist_stats.describe_charsets()])
+            table.append(row)
+        return table
+
     @classmethod
     def _get_instance_uptime(cls, instance):
         if instance.state.get('Name', '') != 'running':
@@ -73,7 +111,7 @@ class List(BaseCommand):
             if uptime_dict[name] > 0:
                 uptime_str.append('{} {}'.format(uptime_dict[name], name))
         if not uptime_str:
-            uptime_str.append('{} seconds'.format(round(uptime)))
+            uptime_str.append('{} seconds'.format(int(round(uptime.total_seconds()))))
         return ' '.join(uptime_str)
 
     def _get_instance_price(self, instance):
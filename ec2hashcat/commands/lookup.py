@@ -0,0 +1,60 @@
+""" Copyright 2015 Will Boyce """
+from __future__ import print_function
+
+import os
+import sys
+
+from ec2hashcat import aws, exceptions, utils
+from ec2hashcat.commands.base import BaseCommand
+from ec2hashcat.index import DumpIndex
+from ec2hashcat.prep import HashlistPrep
+
+
+class Lookup(BaseCommand):
+    """ Look hashes up in the dumps on S3 without downloading them """
+
+    @classmethod
+    def setup_parser(cls, parser):
+        super(Lookup, cls).setup_parser(parser)
+        lookup_args = parser.add_argument_group('lookup arguments')
+        lookup_args.add_argument('-d', '--dump', action='append', dest='dumps', default=None,
+                                 help='Dump to search (may be repeated, default=all dumps)')
+        lookup_args.add_argument('-f', '--file', default=None,
+                                 help='Read hashes to look up from a file (- for STDIN)')
+        lookup_args.add_argument('hashes', metavar='HASH', nargs='*')
+
+    def handle(self):
+        hashes = set(HashlistPrep.normalize(hash_) for hash_ in self._read_hashes())
+        hashes.discard(None)
+        if not hashes:
+            raise exceptions.Ec2HashcatInvalidArguments('no hashes to look up')
+        s3bucket = aws.S3Bucket(self.cfg)
+        available = s3bucket.get_object_list('dumps')
+        dumps = self.cfg.dumps or [name for name in available if name.endswith('.dmp')]
+        for name in dumps:
+            if name not in available:
+                raise exceptions.S3FileNotFoundError('dumps', name, self.cfg.s3_bucket)
+        found, requests, transferred = {}, 0, 0
+        for name in dumps:
+            index = DumpIndex(s3bucket, name)
+            for hash_, lines in index.lookup(hashes - set(found)).items():
+                found[hash_] = lines
+            requests += index.requests
+            transferred += index.transferred
+            if len(found) == len(hashes):
+                break
+        for hash_ in sorted(found):
+            for line in found[hash_]:
+                print(line)
+        print('Found {} of {} hash(es) ({} in {} request(s))'.format(
+            len(found), len(hashes), utils.format_size(transferred), requests), file=sys.stderr)
+
+    def _read_hashes(self):
+        for hash_ in self.cfg.hashes:
+            yield hash_
+        if self.cfg.file is not None:
+            if self.cfg.file != '-' and not os.path.isfile(self.cfg.file):
+                raise exceptions.FileNotFoundError(self.cfg.file)
+            hashes_fh = sys.stdin if self.cfg.file == '-' else open(self.cfg.file)
+            for line in hashes_fh:
+                yield line
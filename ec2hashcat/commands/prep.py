@@ -0,0 +1,37 @@
+""" Copyright 2015 Will Boyce """
+from __future__ import print_function
+
+import os
+
+from ec2hashcat import exceptions, hashtypes
+from ec2hashcat.commands.base import BaseCommand
+from ec2hashcat.prep import HashlistPrep
+
+
+class Prep(BaseCommand):
+    """ Normalise, deduplicate and split hashlists by hash format """
+
+    @classmethod
+    def setup_parser(cls, parser):
+        super(Prep, cls).setup_parser(parser)
+        prep_args = parser.add_argument_group('prep arguments')
+        prep_args.add_argument('-o', '--outdir', default='.',
+                               help='Directory to write the prepared hashlists to')
+        prep_args.add_argument('files', metavar='HASHLIST', nargs='+',
+                               help='hashlist(s) to prepare')
+
+    def handle(self):
+        for name in self.cfg.files:
+            if not os.path.isfile(name):
+                raise exceptions.FileNotFoundError(name)
+        if not os.path.isdir(self.cfg.outdir):
+            os.makedirs(self.cfg.outdir)
+        for name in self.cfg.files:
+            root, ext = os.path.splitext(os.path.basename(name))
+            prep = HashlistPrep()
+            with open(name) as hashlist_fh:
+                results = prep.process(hashlist_fh, lambda sig: os.path.join(
+                    self.cfg.outdir, '{}-{}{}'.format(root, hashtypes.slug(sig), ext)))
+            print(prep.summary(name))
+            for sig, out_fn in sorted(results.items()):
+                print('  {} ({}) -> {}'.format(sig, prep.counts[sig], out_fn))
@@ -0,0 +1,96 @@
+""" Copyright 2015 Will Boyce """
+from __future__ import print_function
+
+import json
+import os
+
+from ec2hashcat import aws, exceptions, utils
+from ec2hashcat.aws.ssh import SshConnection
+from ec2hashcat.commands.crack import Crack
+from ec2hashcat.commands.ec2 import BaseEc2Accessor
+
+
+class Reap(BaseEc2Accessor):
+    """ Terminate instances which have been left idle, uploading their outputs to S3 first """
+
+    @classmethod
+    def setup_parser(cls, parser):
+        super(Reap, cls).setup_parser(parser)
+        reap_args = parser.add_argument_group('reap arguments')
+        reap_args.add_argument('--idle', metavar='MINUTES', action='store_num', type=int, min=1, default=30,
+                               help='Minutes an instance must have been idle for to be reaped')
+        reap_args.add_argument('-n', '--dry-run', action='store_true',
+                               help='Show which instances would be reaped without reaping them')
+        reap_args.add_argument('instances', metavar='INSTANCE_ID|SESSION_NAME', nargs='*',
+                               help='Instances to consider (default=all running instances)')
+
+    def handle(self):
+        aws.SecurityGroup(self.cfg).add_ip(utils.get_external_ip())
+        state_fn = os.path.join(utils.get_state_dir(), 'idle.json')
+        idle_since = {}
+        if os.path.isfile(state_fn):
+            with open(state_fn) as state_fh:
+                idle_since = json.load(state_fh)
+        table = []
+        try:
+            for instance in self._get_instances():
+                table.append(self._check(instance, idle_since))
+        finally:
+            # saved whatever happens, so that instances are not seen idle afresh on the next run
+            with open(state_fn, 'w') as state_fh:
+                json.dump(idle_since, state_fh)
+        if table:
+            utils.print_table(table, ['ID', 'Session', 'Type', 'Status', 'Idle', 'Action'])
+
+    def _check(self, instance, idle_since):
+        """ Probe ``instance``, reaping it if it has been idle for long enough, and return its row of the table """
+        session = ([tag['Value'] for tag in instance.tags or [] if tag['Key'] == 'ec2hashcat'] or ['-'])[0]
+        ec2_instance = aws.Ec2Instance(self.cfg, instance_id=instance.id)
+        try:
+            status, since, now = self._probe(ec2_instance)
+        except SshConnection.errors:
+            return [instance.id, session, instance.instance_type, 'unreachable', '-', '']
+        idle_for = 0
+        if status == 'busy':
+            idle_since.pop(instance.id, None)
+        else:
+            # instances without a watchdog are only known to be idle since reap first saw them idle
+            since = since or idle_since.setdefault(instance.id, now)
+            idle_for = now - since
+        action = ''
+        if idle_for >= self.cfg.idle * 60:
+            action = 'would reap' if self.cfg.dry_run else 'reaped'
+            if not self.cfg.dry_run:
+                try:
+                    self._reap(ec2_instance, session)
+                except SshConnection.errors as err:
+                    # left running, as its outputs may not have been uploaded
+                    action = 'reap failed: {}'.format(err)
+                else:
+                    idle_since.pop(instance.id, None)
+        return [instance.id, session, instance.instance_type, status,
+                '{}m'.format(idle_for // 60) if status == 'idle' else '-', action]
+
+    def _get_instances(self):
+        return aws.Ec2(self.cfg).get_running_instances(self.cfg.instances)
+
+    @classmethod
+    def _probe(cls, instance):
+        """ Return ``(status, idle since or None, now)`` for ``instance``, using the clock of the instance """
+        probe = instance.idle_check_commands() + [
+            'if is_idle; then echo "idle $(cat {} 2>/dev/null || echo 0) $(date +%s)"; '
+            'else echo "busy 0 $(date +%s)"; fi'.format(instance.idle_state_fn)]
+        output = instance.execute_command('\n'.join(probe), pty=False).strip()
+        fields = output.splitlines()[-1].split() if output else []
+        if len(fields) != 3 or fields[0] not in ('idle', 'busy') or not all(field.isdigit() for field in fields[1:]):
+            raise exceptions.EC2InstanceError('unexpected idle check output: {!r}'.format(output[-200:]))
+        status, since, now = fields
+        return status, int(since) or None, int(now)
+
+    def _reap(self, instance, session):
+        print("Reaping Instance '{}', uploading its outputs to s3://{}/reaped/{}/".format(
+            instance.instance.id, self.cfg.s3_bucket, session))
+        commands = ['INSTANCE_ID={}'.format(instance.instance.id)]
+        commands.extend(instance.flush_commands(session, Crack.output_paths))
+        instance.execute_command('\n'.join(commands), pty=False)
+        instance.terminate()
@@ -0,0 +1,179 @@
+""" Copyright 2015 Will Boyce """
+from __future__ import division, print_function
+
+from collections import defaultdict
+from multiprocessing.pool import ThreadPool
+import json
+import time
+
+from ec2hashcat import aws, utils
+from ec2hashcat.commands.base import BaseCommand
+from ec2hashcat.costs import PriceHistory, SessionCosts
+from ec2hashcat.telemetry import Benchmarks, Telemetry
+
+
+class Report(BaseCommand):
+    """ Report the cost of sessions and what each attack cracked per dollar """
+    prefix = 'sessions'
+    attack_modes = {0: 'Straight', 1: 'Combination', 3: 'Brute-force', 6: 'Hybrid dict + mask',
+                    7: 'Hybrid mask + dict'}
+
+    @classmethod
+    def setup_parser(cls, parser):
+        super(Report, cls).setup_parser(parser)
+        report_args = parser.add_argument_group('report arguments')
+        report_args.add_argument('sessions', metavar='SESSION_NAME', nargs='*',
+                                 help='Sessions to report on (default=all sessions)')
+        report_args.add_argument('-l', '--lines', action='store_true',
+                                 help='Also compare the GPU utilisation and speed of each batch line with the '
+                                      'benchmark')
+        report_args.add_argument('--slow', metavar='RATIO', type=float, default=0.5,
+                                 help='Flag lines which reached less than RATIO of the benchmark speed '
+                                      '(default=0.5)')
+
+    def __init__(self, *args, **kwargs):
+        super(Report, self).__init__(*args, **kwargs)
+        self.s3bucket = aws.S3Bucket(self.cfg)
+        self.telemetry_keys = {}
+
+    def handle(self):
+        costs = self._get_costs()
+        if not costs:
+            print('No session records found')
+            return
+        history = PriceHistory(self.cfg)
+        table = []
+        for cost in costs:
+            cost.price(history)
+            table.append([cost.launch['session'], cost.launch['instance_id'], cost.launch['instance_type'],
+                          cost.launch['zone'], 'yes' if cost.launch['spot'] else 'no',
+                          '{:.2f}'.format(cost.seconds / 3600), self._dollars(cost.cost), cost.cracked,
+                          self._per_crack(cost.cost, cost.cracked)])
+        utils.print_table(table, ['Session', 'Instance', 'Type', 'Zone', 'Spot', 'Hours', 'Cost', 'Cracked',
+                                  '$/Crack'])
+        attacks = defaultdict(lambda: {'lines': 0, 'seconds': 0, 'cost': 0.0, 'cracked': 0, 'priced': True})
+        for cost in costs:
+            for line in cost.lines:
+                attack = attacks[(int(line['attack_mode']), str(line['hash_type']))]
+                attack['lines'] += 1
+                attack['seconds'] += (line['finished'] - line['started']) * cost.gpus
+                attack['cracked'] += line['cracked']
+                line_cost = cost.line_cost(line)
+                if line_cost is None:
+                    attack['priced'] = False
+                else:
+                    attack['cost'] += line_cost
+        table = []
+        for (attack_mode, hash_type), attack in sorted(attacks.items()):
+            attack_cost = attack['cost'] if attack['priced'] else None
+            table.append(['{} ({})'.format(attack_mode, self.attack_modes.get(attack_mode, 'Unknown')), hash_type,
+                          attack['lines'], '{:.2f}'.format(attack['seconds'] / 3600), self._dollars(attack_cost),
+                          attack['cracked'], self._per_crack(attack_cost, attack['cracked'])])
+        utils.print_table(table, ['Attack Mode', 'Hash Type', 'Lines', 'GPU Hours', 'Cost', 'Cracked', '$/Crack'])
+        if self.cfg.lines:
+            self._print_lines(costs)
+
+    def _print_lines(self, costs):
+        """ Print the telemetry of each batch line against the speed its GPUs reach in the benchmark """
+        pool = ThreadPool(8)
+        try:
+            series = dict(pool.imap_unordered(
+                lambda item: (item[0], Telemetry.summarize(self._get_body(item[1]).splitlines())),
+                self.telemetry_keys.items()))
+        finally:
+            pool.close()
+            pool.join()
+        benchmarks = Benchmarks()
+        table = []
+        for cost in costs:
+            for line in cost.lines:
+                summary = series.get((cost.launch['session'], cost.launch['instance_id'], line['line']))
+                if summary is None:
+                    continue
+                expected = benchmarks.expected(line['hash_type'], cost.launch['instance_type'],
+                                               summary['gpus'] or cost.gpus)
+                ratio = summary['speed'] / expected if summary['speed'] is not None and expected else None
+                table.append([cost.launch['session'], line['line'], line['attack_mode'], line['hash_type'],
+                              summary['samples'], self._format(summary['utilization'], '{:.0f}%'),
+                              self._format(summary['sm_clock'], '{:.0f}'),
+                              self._format(summary['memory_used'], '{:.0f}'),
+                              self._format(summary['speed'], self._speed), self._format(expected, self._speed),
+                              self._format(ratio, '{:.0%}'),
+                              'SLOW' if ratio is not None and ratio < self.cfg.slow else ''])
+        if table:
+            utils.print_table(table, ['Session', 'Line', 'Attack Mode', 'Hash Type', 'Samples', 'GPU Util', 'SM MHz',
+                                      'Mem MiB', 'Speed', 'Benchmark', 'Of Benchmark', ''])
+
+    @classmethod
+    def _format(cls, value, fmt):
+        if value is None:
+            return '-'
+        return fmt(value) if callable(fmt) else fmt.format(value)
+
+    @classmethod
+    def _speed(cls, speed):
+        for unit in ('H/s', 'kH/s', 'MH/s', 'GH/s'):
+            if speed < 1000:
+                return '{:.1f} {}'.format(speed, unit)
+            speed /= 1000
+        return '{:.1f} TH/s'.format(speed)
+
+    @classmethod
+    def _dollars(cls, amount):
+        return '-' if amount is None else '${:.4f}'.format(amount)
+
+    @classmethod
+    def _per_crack(cls, amount, cracked):
+        return '-' if amount is None or not cracked else '${:.6f}'.format(amount / cracked)
+
+    def _get_costs(self):
+        """ Load the records written by each instance, returning a ``SessionCosts`` per instance """
+        prefixes = ['{}/{}/'.format(self.prefix, session) for session in self.cfg.sessions] or \
+            ['{}/'.format(self.prefix)]
+        keys = []
+        paginator = self.s3bucket.s3_client.get_paginator('list_objects_v2')
+        for prefix in prefixes:
+            for page in paginator.paginate(Bucket=self.cfg.s3_bucket, Prefix=prefix):
+                for obj in page.get('Contents', []):
+                    if obj['Key'].endswith('.json'):
+                        keys.append(obj['Key'])
+                    elif obj['Key'].endswith('.csv'):
+                        session, instance_id, name = obj['Key'].split('/')[1:]
+                        line = int(name[len('telemetry-'):-len('.csv')])
+                        self.telemetry_keys[(session, instance_id, line)] = obj['Key']
+
+        records = defaultdict(dict)
+        pool = ThreadPool(8)
+        try:
+            for key, record in pool.imap_unordered(lambda key: (key, json.loads(self._get_body(key))), keys):
+                session, instance_id, name = key.split('/')[1:]
+                records[(session, instance_id)][name[:-len('.json')]] = record
+        finally:
+            pool.close()
+            pool.join()
+
+        running = self._running_instances([instance_id for _, instance_id in records])
+        costs = []
+        for (session, instance_id), instance_records in sorted(records.items()):
+            if 'launch' not in instance_records:
+                continue
+            lines = [record for name, record in sorted(instance_records.items()) if name.startswith('line-')]
+            if 'end' in instance_records:
+                finished = instance_records['end']['finished']
+            elif instance_id in running:
+                finished = int(time.time())
+            else:
+                # terminated before the task ended (e.g. a spot interruption), the last line is the best we know
+                finished = max([line['finished'] for line in lines] or [instance_records['launch']['launched']])
+            costs.append(SessionCosts(instance_records['launch'], lines, finished))
+        return costs
+
+    def _get_body(self, key):
+        return self.s3bucket.s3_client.get_object(Bucket=self.cfg.s3_bucket, Key=key)['Body'].read()
+
+    def _running_instances(self, instance_ids):
+        if not instance_ids:
+            return set()
+        instances = aws.Ec2(self.cfg).get_instances().filter(Filters=[
+            {'Name': 'instance-state-name', 'Values': ['running']}])
+        return set(instance.id for instance in instances) & set(instance_ids)
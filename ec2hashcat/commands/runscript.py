@@ -8,23 +8,29 @@ import sys
 import tempfile
 import uuid
 
-from ec2hashcat import aws, utils
+from ec2hashcat import aws, exceptions, profile, utils
 from ec2hashcat.commands.ec2 import BaseEc2Accessor
 
 
 class BaseEc2InstanceSessionCommand(BaseEc2Accessor):
+    # files (globs) uploaded to S3 before an idle instance is terminated
+    output_paths = ()
+
     @classmethod
     def setup_parser(cls, parser):
         super(BaseEc2InstanceSessionCommand, cls).setup_parser(parser)
         ec2_args = parser.add_argument_group('ec2 arguments')
         ec2_args.add_argument('--ec2-key-name', default='ec2hashcat', help='Name of EC2 SSH Key')
         ec2_args.add_argument('--ec2-instance-type', default='g2.8xlarge', help='ec2 instance type')
-        ec2_args.add_argument('--ec2-volume-size', action='store_num', default=15, min=15, type=int,
-                              help='ec2 root volume size (min=15)')
+        ec2_args.add_argument('--ec2-volume-size', action='store_num', default=None, min=15, type=int,
+                              help='ec2 root volume size (min=15, default=sized to fit the task data)')
         ec2_args.add_argument('--ec2-no-spot-instance', action='store_false', default=True, dest='ec2_spot_instance',
                               help='use ec2 spot instance')
         ec2_args.add_argument('-p', '--ec2-spot-price', default='avg',
                               help='bid to place for ec2 spot instance (USD/hour)')
+        ec2_args.add_argument('--ec2-instance-profile', default=None, metavar='NAME',
+                              help='IAM instance profile to launch instances with, whose role the instance then uses '
+                                   'instead of a copy of the AWS credentials')
 
         cmd_args = parser.add_argument_group('{} arguments'.format(cls.__name__.lower()))
         cmd_mutex_args = cmd_args.add_mutually_exclusive_group()
@@ -38,9 +44,15 @@ class BaseEc2InstanceSessionCommand(BaseEc2Accessor):
                               help='Drop into a shell once the task has completed (this will block shutdown!)')
         cmd_args.add_argument('--no-shutdown', action='store_false', dest='shutdown', default=True,
                               help='Do not shutdown the instance once the task has completed')
+        cmd_args.add_argument('--headless', action='store_true',
+                              help='Start the task from the instance user data without connecting to it over SSH '
+                                   '(implies --no-attach)')
+        cmd_args.add_argument('--reap-after', metavar='MINUTES', action='store_num', type=int, min=5, default=None,
+                              help='Upload outputs to S3 and terminate the instance once it has been idle (no '
+                                   'hashcat, S3 transfer, attached screen or GPU use) for MINUTES')
 
     @classmethod
-    def _read_file(cls, name, prompt='>'):
+    def _read_file(cls, name, prompt='>', comments=False):
         file_h = None
         if name == '-':
             file_h = sys.stdin
@@ -50,11 +62,11 @@ class BaseEc2InstanceSessionCommand(BaseEc2Accessor):
                 content = raw_input('{} '.format(prompt.strip()))
                 if not content:
                     break
-                file_h.writelines([content])
+                file_h.writelines(['{}\n'.format(content)])
             file_h.seek(0)
         else:
             file_h = file(name)
-        return [line.strip() for line in file_h.readlines() if not line.startswith('#')]
+        return [line.strip() for line in file_h.readlines() if comments or not line.startswith('#')]
 
     def _get_instance(self):
         # configure security group
@@ -67,6 +79,41 @@ class BaseEc2InstanceSessionCommand(BaseEc2Accessor):
         else:
             return ec2.start_instance(tag=self.cfg.session_name)
 
+    def _check_headless(self):
+        if not self.cfg.headless:
+            return False
+        if self.cfg.use_instance is not None:
+            raise exceptions.Ec2HashcatInvalidArguments('--headless cannot be used with --use-instance')
+        if self.cfg.shell:
+            raise exceptions.Ec2HashcatInvalidArguments('--headless cannot be used with --shell')
+        self.cfg.attach = False
+        return True
+
+    def _watchdog_commands(self, instance):
+        if self.cfg.reap_after is None:
+            return []
+        return instance.watchdog_commands(self.cfg.session_name, self.cfg.reap_after * 60, self.output_paths)
+
+    def _set_watchdog(self, instance):
+        if self.cfg.reap_after is not None:
+            instance.set_watchdog(self.cfg.session_name, self.cfg.reap_after * 60, self.output_paths)
+
+    def _start_headless(self, instance, commands, screen_name):
+        """ Launch ``instance`` running ``commands`` from its user data, without waiting for it to boot """
+        if self.cfg.ec2_instance_profile is None:
+            print('Warning: without --ec2-instance-profile the instance is given temporary credentials, '
+                  'which expire after {} hours'.format(instance.credentials_duration // 3600))
+        commands = instance.headless_commands(self.cfg.session_name) + commands
+        user_data = instance.user_data(commands, screen_name)
+        if len(user_data) > instance.user_data_limit:
+            script_url, delete_url = aws.S3Bucket(self.cfg).put_script(instance.script_contents(commands))
+            user_data = instance.user_data(commands, screen_name, script_url=script_url, delete_url=delete_url)
+        with profile.phase('launch instance'):
+            instance.start(self.cfg.session_name, user_data=user_data)
+        print("Started Headless Session '{}', use `ec2hashcat attach {}` once it is running".format(
+            self.cfg.session_name, self.cfg.session_name))
+        return instance
+
 
 class RunScript(BaseEc2InstanceSessionCommand):
     """ Launch an EC2 Instance and run the specified script """
@@ -82,7 +129,18 @@ class RunScript(BaseEc2InstanceSessionCommand):
         remote_fn = self._resolve_script()
         if self.cfg.session_name is None:
             self.cfg.session_name = os.path.basename(self.cfg.script)
+        if self._check_headless():
+            instance = aws.Ec2Instance(self.cfg)
+            commands = self._watchdog_commands(instance)
+            with open(self.cfg.script) as script_fh:
+                commands.extend(instance.file_commands(remote_fn, script_fh.read(), '0755'))
+            commands.append(remote_fn)
+            if self.cfg.shutdown:
+                commands.append('sudo poweroff')
+            self._start_headless(instance, commands, self.cfg.session_name)
+            return
         instance = self._get_instance()
+        self._set_watchdog(instance)
         instance.copy_file(self.cfg.script, remote_fn, mode='0755')
         commands = [remote_fn]
         if self.cfg.shell:
@@ -0,0 +1,83 @@
+""" Copyright 2015 Will Boyce """
+from __future__ import print_function
+
+from collections import defaultdict
+import sys
+import time
+
+from ec2hashcat import aws
+from ec2hashcat.commands.base import BaseCommand
+
+
+class Watch(BaseCommand):
+    """ Print hashes as they are cracked by running sessions """
+    prefix = 'cracked'
+    # chunks are named after the time their upload started, so one may appear after a later named chunk
+    upload_margin = 300
+
+    def __init__(self, *args, **kwargs):
+        super(Watch, self).__init__(*args, **kwargs)
+        self.s3bucket = aws.S3Bucket(self.cfg)
+        self.seen = defaultdict(dict)
+
+    @classmethod
+    def setup_parser(cls, parser):
+        super(Watch, cls).setup_parser(parser)
+        watch_args = parser.add_argument_group('watch arguments')
+        watch_args.add_argument('-n', '--interval', action='store_num', type=float, min=0.5, default=5,
+                                help='Seconds between checks for new cracks')
+        watch_args.add_argument('-a', '--all', action='store_true',
+                                help='Also print hashes cracked before watch was started')
+        watch_args.add_argument('-l', '--label', action='store_true',
+                                help='Prefix each line with the name of the session which cracked it')
+        watch_args.add_argument('sessions', metavar='SESSION_NAME', nargs='*',
+                                help='Sessions to watch (default=all sessions)')
+
+    def handle(self):
+        if not self.cfg.all:
+            for session in self._get_sessions():
+                for _ in self._new_chunks(session):
+                    pass
+        try:
+            while True:
+                for session in self._get_sessions():
+                    for key in self._new_chunks(session):
+                        self._print_chunk(session, key)
+                sys.stdout.flush()
+                time.sleep(self.cfg.interval)
+        except KeyboardInterrupt:
+            pass
+
+    def _get_sessions(self):
+        if self.cfg.sessions:
+            return self.cfg.sessions
+        sessions = []
+        paginator = self.s3bucket.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.cfg.s3_bucket, Prefix='{}/'.format(self.prefix), Delimiter='/'):
+            sessions.extend(prefix['Prefix'].split('/')[1] for prefix in page.get('CommonPrefixes', []))
+        return sessions
+
+    def _new_chunks(self, session):
+        """ Yield the keys of chunks uploaded for ``session`` since the last call, oldest first """
+        prefix = '{}/{}/'.format(self.prefix, session)
+        list_args = dict(Bucket=self.cfg.s3_bucket, Prefix=prefix)
+        seen = self.seen[session]
+        if seen:
+            # only list chunks named after the newest one seen, less the margin for slow uploads
+            start = max(seen.values()) - self.upload_margin
+            list_args['StartAfter'] = '{}{:010d}'.format(prefix, start)
+            for key, uploaded in seen.items():
+                if uploaded < start:
+                    del seen[key]
+        paginator = self.s3bucket.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(**list_args):
+            for obj in page.get('Contents', []):
+                if obj['Key'] in seen:
+                    continue
+                seen[obj['Key']] = int(obj['Key'][len(prefix):].split('-', 1)[0])
+                yield obj['Key']
+
+    def _print_chunk(self, session, key):
+        body = self.s3bucket.s3_client.get_object(Bucket=self.cfg.s3_bucket, Key=key)['Body'].read()
+        for line in body.splitlines():
+            print('{}: {}'.format(session, line) if self.cfg.label else line)
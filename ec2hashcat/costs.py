@@ -0,0 +1,122 @@
+""" Copyright 2015 Will Boyce """
+from __future__ import division, print_function
+
+import bisect
+import calendar
+from datetime import datetime
+import json
+import os
+
+from ec2hashcat import aws, utils
+
+
+# instance type: (GPUs, on-demand Linux USD/hour in us-east-1)
+INSTANCE_TYPES = {
+    'g2.2xlarge': (1, 0.65),
+    'g2.8xlarge': (4, 2.6),
+    'g3.4xlarge': (1, 1.14),
+    'g3.8xlarge': (2, 2.28),
+    'g3.16xlarge': (4, 4.56),
+    'g4dn.xlarge': (1, 0.526),
+    'g4dn.2xlarge': (1, 0.752),
+    'g4dn.4xlarge': (1, 1.204),
+    'g4dn.8xlarge': (1, 2.176),
+    'g4dn.12xlarge': (4, 3.912),
+    'g4dn.16xlarge': (1, 4.352),
+    'p2.xlarge': (1, 0.9),
+    'p2.8xlarge': (8, 7.2),
+    'p2.16xlarge': (16, 14.4),
+    'p3.2xlarge': (1, 3.06),
+    'p3.8xlarge': (4, 12.24),
+    'p3.16xlarge': (8, 24.48),
+}
+
+
+def to_epoch(value):
+    return calendar.timegm(value.utctimetuple())
+
+
+class PriceHistory(object):
+    """ Spot price history, cached under ``~/.ec2hashcat/prices/<region>`` per instance type and zone
+
+        Each cache file holds the price changes over the span of time it covers; requests outside that
+        span fetch the union of both spans again.
+    """
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.path = utils.get_state_dir('prices', cfg.aws_region)
+        self.ec2_client = aws.Ec2(cfg).aws.client('ec2')
+
+    def prices(self, instance_type, zone, start, end):
+        """ Return the ``[(epoch, price), ...]`` changes in effect between ``start`` and ``end`` """
+        cache_fn = os.path.join(self.path, '{}.{}.json'.format(instance_type, zone))
+        cached = {'start': None, 'end': None, 'prices': []}
+        if os.path.isfile(cache_fn):
+            with open(cache_fn) as cache_fh:
+                cached = json.load(cache_fh)
+        if cached['start'] is None or start < cached['start'] or end > cached['end']:
+            if cached['start'] is not None:
+                start, end = min(start, cached['start']), max(end, cached['end'])
+            cached = {'start': start, 'end': end, 'prices': self._fetch(instance_type, zone, start, end)}
+            with open(cache_fn, 'w') as cache_fh:
+                json.dump(cached, cache_fh)
+        return [tuple(change) for change in cached['prices']]
+
+    def _fetch(self, instance_type, zone, start, end):
+        changes = set()
+        paginator = self.ec2_client.get_paginator('describe_spot_price_history')
+        for page in paginator.paginate(InstanceTypes=[instance_type], AvailabilityZone=zone,
+                                       ProductDescriptions=['Linux/UNIX'],
+                                       StartTime=datetime.utcfromtimestamp(start),
+                                       EndTime=datetime.utcfromtimestamp(end)):
+            for price in page['SpotPriceHistory']:
+                changes.add((to_epoch(price['Timestamp']), float(price['SpotPrice'])))
+        return sorted(changes)
+
+    @classmethod
+    def cost(cls, changes, start, end):
+        """ Integrate the hourly prices ``changes`` over ``start`` to ``end`` (epoch seconds) """
+        if not changes or end <= start:
+            return 0.0
+        times = [change[0] for change in changes]
+        pos = max(0, bisect.bisect_right(times, start) - 1)
+        total, now = 0.0, start
+        while now < end:
+            until = min(end, times[pos + 1]) if pos + 1 < len(times) else end
+            total += changes[pos][1] * max(0, until - now) / 3600
+            now, pos = until, pos + 1
+        return total
+
+
+class SessionCosts(object):
+    """ Cost and yield of a session, from the records its instance writes under ``sessions/`` """
+    def __init__(self, launch, lines, finished):
+        self.launch = launch
+        self.lines = lines
+        self.finished = finished
+        self.gpus, self.on_demand_price = INSTANCE_TYPES.get(launch['instance_type'], (1, None))
+        self.cost = None
+
+    @property
+    def seconds(self):
+        return max(0, self.finished - self.launch['launched'])
+
+    @property
+    def cracked(self):
+        return sum(line['cracked'] for line in self.lines)
+
+    def price(self, history):
+        """ Work out what the session cost, using ``history`` for spot instances """
+        if self.launch['spot']:
+            changes = history.prices(self.launch['instance_type'], self.launch['zone'],
+                                     self.launch['launched'], self.finished)
+            self.cost = history.cost(changes, self.launch['launched'], self.finished)
+        elif self.on_demand_price is not None:
+            self.cost = self.on_demand_price * self.seconds / 3600
+        return self.cost
+
+    def line_cost(self, line):
+        """ Share of the session cost attributed to ``line``, by running time """
+        if self.cost is None or not self.seconds:
+            return None
+        return self.cost * (line['finished'] - line['started']) / self.seconds
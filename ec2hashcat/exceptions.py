@@ -48,3 +48,12 @@ class Cancelled(EC2HashcatException):
     def __init__(self):
         message = "Operation was cancelled."
         super(Cancelled, self).__init__(message)
+
+
+class BatchFileError(EC2HashcatException):
+    """ Raised when lines of a batch file are invalid. """
+    show_usage = False
+
+    def __init__(self, errors):
+        message = "Invalid batch file:\n  {}".format('\n  '.join(errors))
+        super(BatchFileError, self).__init__(message)
@@ -0,0 +1,165 @@
+""" Copyright 2015 Will Boyce """
+from __future__ import division
+
+from collections import Counter
+import os
+import re
+import string
+
+
+HEX_DIGITS = frozenset(string.hexdigits)
+PREFIX_RX = re.compile(r'^(\$[A-Za-z0-9-]+\$|\{[A-Za-z0-9]+\}|(?:sha1|md5|pbkdf2_sha256)\$|0x0[12]00)')
+
+# hashcat modes (cudaHashcat 1.37) by name
+NAMES = {
+    0: 'MD5', 10: 'md5($pass.$salt)', 11: 'Joomla < 2.5.18', 12: 'PostgreSQL', 20: 'md5($salt.$pass)',
+    100: 'SHA1', 101: 'nsldap, SHA-1(Base64)', 110: 'sha1($pass.$salt)', 111: 'nsldaps, SSHA-1(Base64)',
+    120: 'sha1($salt.$pass)', 122: 'OSX v10.4-v10.6', 124: 'Django (SHA-1)', 131: 'MSSQL(2000)',
+    132: 'MSSQL(2005)', 200: 'MySQL323', 300: 'MySQL4.1/MySQL5', 400: 'phpass', 500: 'md5crypt',
+    900: 'MD4', 1000: 'NTLM', 1100: 'Domain Cached Credentials', 1300: 'SHA-224', 1400: 'SHA256',
+    1410: 'sha256($pass.$salt)', 1420: 'sha256($salt.$pass)', 1500: 'descrypt', 1600: 'Apache $apr1$',
+    1700: 'SHA512', 1710: 'sha512($pass.$salt)', 1711: 'SSHA-512(Base64)', 1720: 'sha512($salt.$pass)',
+    1722: 'OSX v10.7', 1731: 'MSSQL(2012)', 1800: 'sha512crypt', 2100: 'Domain Cached Credentials 2',
+    2600: 'md5(md5($pass))', 2611: 'vBulletin < v3.8.5', 2811: 'IPB2+, MyBB1.2+', 3000: 'LM',
+    3100: 'Oracle H', 3200: 'bcrypt', 3300: 'MD5(Sun)', 4500: 'sha1(sha1($pass))', 5000: 'SHA-3(Keccak)',
+    5500: 'NetNTLMv1', 5600: 'NetNTLMv2', 6000: 'RipeMD160', 6100: 'Whirlpool', 6900: 'GOST R 34.11-94',
+    7100: 'OSX v10.8+', 7400: 'sha256crypt', 7500: 'Kerberos 5 AS-REQ Pre-Auth', 7900: 'Drupal7',
+    10000: 'Django (PBKDF2-SHA256)', 10800: 'SHA-384',
+}
+# modes without a salt, for which hashcat tests every candidate against all of the hashes at once
+UNSALTED = frozenset((0, 100, 101, 200, 300, 900, 1000, 1300, 1400, 1700, 2600, 3000, 4500, 5000, 6000, 6100,
+                      6900, 10800))
+# the modes which produce each signature, with their relative likelihood in the wild
+CANDIDATES = {
+    'hex16': ((200, 5), (3000, 4)),
+    'hex16:salt': ((3100, 1),),
+    'hex32': ((0, 60), (1000, 30), (900, 5), (2600, 5)),
+    'hex32:salt': ((10, 30), (20, 25), (1100, 10), (12, 10), (2811, 10), (2611, 10), (11, 5)),
+    'hex40': ((100, 60), (300, 20), (6000, 10), (4500, 10)),
+    'hex40:salt': ((110, 45), (120, 45)),
+    'hex48': ((122, 1),),
+    'hex56': ((1300, 1),),
+    'hex64': ((1400, 80), (6900, 10), (5000, 10)),
+    'hex64:salt': ((1410, 50), (1420, 50)),
+    'hex96': ((10800, 1),),
+    'hex128': ((1700, 70), (6100, 20), (5000, 10)),
+    'hex128:salt': ((1710, 50), (1720, 50)),
+    'hex136': ((1722, 1),),
+    'raw13': ((1500, 1),),
+    '$1$': ((500, 1),),
+    '$apr1$': ((1600, 1),),
+    '$5$': ((7400, 1),),
+    '$6$': ((1800, 1),),
+    '$2a$': ((3200, 1),),
+    '$2x$': ((3200, 1),),
+    '$2y$': ((3200, 1),),
+    '$P$': ((400, 1),),
+    '$H$': ((400, 1),),
+    '$S$': ((7900, 1),),
+    '$md5$': ((3300, 1),),
+    '$ml$': ((7100, 1),),
+    '$DCC2$': ((2100, 1),),
+    '$krb5pa$': ((7500, 1),),
+    '{SHA}': ((101, 1),),
+    '{SSHA}': ((111, 1),),
+    '{SSHA512}': ((1711, 1),),
+    'sha1$': ((124, 1),),
+    'pbkdf2_sha256$': ((10000, 1),),
+    '0x0100': ((131, 50), (132, 50)),
+    '0x0200': ((1731, 1),),
+    'netntlmv1': ((5500, 1),),
+    'netntlmv2': ((5600, 1),),
+}
+
+
+def is_hex(value):
+    return bool(value) and HEX_DIGITS.issuperset(value)
+
+
+def split_hash(line):
+    """ Split a hashlist entry into its hash and (possibly empty) salt """
+    if line.startswith('$'):
+        return line, ''
+    hash_, _, salt = line.partition(':')
+    return hash_, salt
+
+
+def signature(line):
+    """ Return a short description of the format of a (normalised) hashlist entry
+
+        Entries with a known prefix are identified by that prefix (e.g. ``$2a$`` or ``{SSHA}``), NetNTLM
+        responses (``user::domain:...``) by their version, anything else by its charset and length, with a
+        ``:salt`` suffix when the entry is salted (e.g. ``hex32:salt``).
+    """
+    match = PREFIX_RX.match(line)
+    if match:
+        return match.group(1)
+    if '::' in line:
+        fields = line.split(':')
+        return 'netntlmv2' if len(fields) > 3 and len(fields[3]) == 16 else 'netntlmv1'
+    hash_, salt = split_hash(line)
+    sig = '{}{}'.format('hex' if is_hex(hash_) else 'raw', len(hash_))
+    return '{}:salt'.format(sig) if salt else sig
+
+
+def slug(sig):
+    """ Return a filename-safe version of a signature """
+    return re.sub('[^a-z0-9]+', '-', sig.lower()).strip('-')
+
+
+def sample(hashlist_fh, count=10000, size=None):
+    """ Yield up to ``count`` entries spread evenly through ``hashlist_fh``
+
+        Files with a known ``size`` too large to read quickly are sampled by seeking, so the time taken does
+        not depend on their size, small files are read in full and streams of unknown size up to ``count``.
+    """
+    if size is not None and size >= count * 256:
+        for num in range(count):
+            hashlist_fh.seek(num * size // count)
+            if num:
+                hashlist_fh.readline()  # skip the (partial) line the offset falls in
+            line = hashlist_fh.readline().strip()
+            if line:
+                yield line
+        return
+    for num, line in enumerate(hashlist_fh):
+        if size is None and num >= count:
+            break
+        line = line.strip()
+        if line:
+            yield line
+
+
+def sample_file(path, count=10000):
+    """ Sample the hashlist at ``path``, see ``sample`` """
+    with open(path) as hashlist_fh:
+        return list(sample(hashlist_fh, count, os.path.getsize(path)))
+
+
+def identify(lines):
+    """ Return ``[(mode, confidence), ...]`` for the hashcat modes which could produce ``lines``, best first
+
+        The confidence of a mode is the fraction of lines with a signature it produces, weighted by how
+        likely it is to have produced that signature compared to other modes.
+    """
+    signatures = Counter(signature(line) for line in lines)
+    total = sum(signatures.values())
+    scores = Counter()
+    for sig, count in signatures.items():
+        candidates = CANDIDATES.get(sig, ())
+        weights = sum(weight for _, weight in candidates)
+        for mode, weight in candidates:
+            scores[mode] += count / total * weight / weights
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+def is_unsalted(mode):
+    """ Return whether hashcat ``mode`` is known to be unsalted """
+    return str(mode).isdigit() and int(mode) in UNSALTED
+
+
+def describe(mode):
+    """ Return ``mode`` with its name, if known """
+    if str(mode).isdigit() and int(mode) in NAMES:
+        return '-m{} ({})'.format(mode, NAMES[int(mode)])
+    return '-m{}'.format(mode)
@@ -0,0 +1,379 @@
+""" Copyright 2015 Will Boyce """
+from __future__ import print_function
+
+from collections import defaultdict
+import bisect
+import hashlib
+import heapq
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+
+import botocore
+
+from ec2hashcat import utils
+from ec2hashcat.prep import HashlistPrep
+
+
+def parse_dump_line(line):
+    """ Split a dump line (``hash[:salt]:plain:hex_plain``) into ``(hash, plain)`` """
+    head, hex_plain = line.rsplit(':', 1)
+    try:
+        plain = hex_plain.decode('hex')
+    except TypeError:
+        plain = None
+    for plain_field in (plain, '$HEX[{}]'.format(hex_plain)):
+        if plain_field is not None and head.endswith(':{}'.format(plain_field)):
+            return head[:-len(plain_field) - 1], plain
+    head, plain_field = head.rsplit(':', 1)
+    return head, plain if plain is not None else plain_field
+
+
+class CrackedIndex(object):
+    """ Local index of every hash cracked across all dumps in the S3 bucket
+
+        The index consists of three files under ``~/.ec2hashcat/index/<bucket>``:
+
+        * ``plains.dat``: the dump line for every known hash
+        * ``keys.idx``: fixed width ``(key, offset)`` records sorted by key, where ``key`` is the first
+          8 bytes of the MD5 of the hash type and (normalised) hash and ``offset`` the position of its line
+          in ``plains.dat``
+        * ``manifest.json``: the ETag of every dump already merged into the index, and of those skipped
+          for lack of a hash type
+
+        ``keys.idx`` is memory-mapped and binary searched, so lookups never load the index into memory.
+
+        Entries are keyed by hash type as well as hash, as the same string may be a hash of several types
+        (e.g. raw MD5 and NTLM). The type of a dump is its ``hash-type`` metadata, set whenever a dump is
+        written or tagged (see ``ec2hashcat tag``). Dumps without it are skipped until they are tagged.
+    """
+    record = struct.Struct('>QQ')
+    chunk_size = 500000  # new entries sorted in memory at a time while updating
+    format = 3  # indexes written in another format are rebuilt
+
+    def __init__(self, cfg, path=None):
+        self.cfg = cfg
+        self.path = path or utils.get_state_dir('index', cfg.s3_bucket)
+        self.keys_fn = os.path.join(self.path, 'keys.idx')
+        self.plains_fn = os.path.join(self.path, 'plains.dat')
+        self.manifest_fn = os.path.join(self.path, 'manifest.json')
+        self._keys = self._plains = None
+
+    def __len__(self):
+        return os.path.getsize(self.keys_fn) // self.record.size if os.path.isfile(self.keys_fn) else 0
+
+    @classmethod
+    def hash_key(cls, hash_type, hash_):
+        return struct.unpack('>Q', hashlib.md5('{}:{}'.format(hash_type, hash_)).digest()[:8])[0]
+
+    def _open(self):
+        if self._keys is None and len(self):
+            with open(self.keys_fn, 'rb') as keys_fh, open(self.plains_fn, 'rb') as plains_fh:
+                self._keys = mmap.mmap(keys_fh.fileno(), 0, access=mmap.ACCESS_READ)
+                self._plains = mmap.mmap(plains_fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        for mapped in (self._keys, self._plains):
+            if mapped is not None:
+                mapped.close()
+        self._keys = self._plains = None
+
+    def _record(self, pos):
+        return self.record.unpack_from(self._keys, pos * self.record.size)
+
+    def _line(self, offset):
+        end = self._plains.find('\n', offset)
+        return self._plains[offset:end if end != -1 else len(self._plains)]
+
+    def lookup(self, hash_type, hash_):
+        """ Return the dump line for ``hash_`` of type ``hash_type``, or ``None`` if it has not been cracked """
+        self._open()
+        hash_ = HashlistPrep.normalize(hash_)
+        if self._keys is None or hash_ is None:
+            return None
+        key = self.hash_key(hash_type, hash_)
+        low, high = 0, len(self)
+        while low < high:
+            mid = (low + high) // 2
+            if self._record(mid)[0] < key:
+                low = mid + 1
+            else:
+                high = mid
+        while low < len(self):
+            rec_key, offset = self._record(low)
+            if rec_key != key:
+                break
+            line = self._line(offset)
+            if HashlistPrep.normalize(parse_dump_line(line)[0]) == hash_:
+                return line
+            low += 1
+        return None
+
+    def _read_manifest(self):
+        """ Return the ETags of the dumps merged into the index and of those skipped as untyped """
+        if not os.path.isfile(self.manifest_fn):
+            return {}, {}
+        with open(self.manifest_fn) as manifest_fh:
+            manifest = json.load(manifest_fh)
+        if manifest.get('format') != self.format:
+            for index_fn in (self.keys_fn, self.plains_fn):
+                if os.path.isfile(index_fn):
+                    os.unlink(index_fn)
+            return {}, {}
+        return manifest['dumps'], manifest['untyped']
+
+    def update(self, s3bucket):
+        """ Merge any new, changed or newly tagged dumps into the index, returning the number of hashes added """
+        manifest, untyped = self._read_manifest()
+        changed = []
+        for obj in s3bucket.get_objects('dumps'):
+            if manifest.get(obj.key) == obj.e_tag or not obj.key.endswith('.dmp'):
+                continue
+            # tagging a dump need not change its ETag, so those skipped as untyped have their metadata checked again
+            hash_type = s3bucket.s3_client.head_object(Bucket=s3bucket.cfg.s3_bucket,
+                                                       Key=obj.key)['Metadata'].get('hash-type', '')
+            if hash_type:
+                changed.append((obj, hash_type))
+            elif untyped.get(obj.key) != obj.e_tag:
+                print("Warning: skipping '{}', which has no hash type, tag it with `ec2hashcat tag`".format(
+                    obj.key.split('/', 1)[1]))
+                untyped[obj.key] = obj.e_tag
+        added = self._merge_dumps(s3bucket, changed, manifest, untyped) if changed else 0
+        with open(self.manifest_fn, 'w') as manifest_fh:
+            json.dump(dict(format=self.format, dumps=manifest, untyped=untyped), manifest_fh)
+        return added
+
+    def _merge_dumps(self, s3bucket, dumps, manifest, untyped):
+        """ Merge the ``(object, hash type)`` pairs of ``dumps`` into the index, recording them in the manifest """
+        print('Updating cracked hash index from {} dump(s)...'.format(len(dumps)))
+        tmpdir = tempfile.mkdtemp()
+        try:
+            runs = []
+            for obj, hash_type in dumps:
+                local_fn = os.path.join(tmpdir, 'dump')
+                s3bucket.download_object('dumps', obj.key.split('/', 1)[1], local_fn, quiet=True)
+                with open(local_fn) as dump_fh:
+                    runs.extend(self._write_runs(dump_fh, hash_type, tmpdir, len(runs)))
+                os.unlink(local_fn)
+                manifest[obj.key] = obj.e_tag
+                untyped.pop(obj.key, None)
+            return self._merge_runs(runs, tmpdir)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def _write_runs(self, lines, hash_type, tmpdir, run_num):
+        """ Split ``lines`` (of a dump of ``hash_type``) into files of ``<hex key>\\t<line>`` sorted by key """
+        def flush(chunk, num):
+            chunk.sort()
+            run_fn = os.path.join(tmpdir, 'run{}'.format(num))
+            with open(run_fn, 'w') as run_fh:
+                run_fh.writelines('{:016x}\t{}\n'.format(key, line) for key, line in chunk)
+            return run_fn
+
+        runs, chunk = [], []
+        for line in lines:
+            line = line.rstrip('\r\n')
+            if ':' not in line:
+                continue
+            chunk.append((self.hash_key(hash_type, HashlistPrep.normalize(parse_dump_line(line)[0])), line))
+            if len(chunk) >= self.chunk_size:
+                runs.append(flush(chunk, run_num + len(runs)))
+                chunk = []
+        if chunk:
+            runs.append(flush(chunk, run_num + len(runs)))
+        return runs
+
+    def _existing_records(self):
+        for pos in xrange(len(self)):
+            yield self._record(pos)
+
+    def _merge_runs(self, runs, tmpdir):
+        """ Merge sorted runs with the existing records, appending unseen hashes to ``plains.dat`` """
+        self.close()
+        self._open()
+        run_fhs = [open(run_fn) for run_fn in runs]
+        new_keys_fn = os.path.join(tmpdir, 'keys.idx')
+        added = 0
+        try:
+            new_entries = heapq.merge(*run_fhs)
+            existing = self._existing_records()
+            current = next(existing, None)
+            last_key = None
+            with open(self.plains_fn, 'ab') as plains_fh, open(new_keys_fn, 'wb') as keys_fh:
+                offset = os.path.getsize(self.plains_fn)
+                for entry in new_entries:
+                    key, line = entry.rstrip('\n').split('\t', 1)
+                    key = int(key, 16)
+                    while current is not None and current[0] <= key:
+                        keys_fh.write(self.record.pack(*current))
+                        last_key = current[0]
+                        current = next(existing, None)
+                    # 64-bit keys are treated as unique; a collision just loses one plaintext from the index
+                    if key == last_key:
+                        continue
+                    plains_fh.write('{}\n'.format(line))
+                    keys_fh.write(self.record.pack(key, offset))
+                    offset += len(line) + 1
+                    last_key = key
+                    added += 1
+                while current is not None:
+                    keys_fh.write(self.record.pack(*current))
+                    current = next(existing, None)
+        finally:
+            for run_fh in run_fhs:
+                run_fh.close()
+            self.close()
+        shutil.move(new_keys_fn, self.keys_fn)
+        return added
+
+
+class DumpIndex(object):
+    """ Sparse index of a sorted dump in S3, used to look hashes up with ranged GETs
+
+        The sidecar (``index/dumps/<dump>.idx``) holds the offset and contents of the first line of
+        every ``block_size`` bytes of the dump. Dumps are sorted bytewise (``LC_ALL=C sort -u``), so every
+        line for a hash lies between the last block starting before ``<hash>:`` and the next line
+        which sorts after it.
+    """
+    prefix = 'index/dumps'
+    block_size = 128 * 1024
+    max_run_blocks = 64  # blocks fetched by a single ranged GET
+    header = '# ec2hashcat dump index size={} block={}'
+
+    def __init__(self, s3bucket, name):
+        self.s3bucket = s3bucket
+        self.name = name
+        self.dump_key = 'dumps/{}'.format(name)
+        self.offsets = []
+        self.lines = []
+        self.size = None
+        self.requests = 0
+        self.transferred = 0
+
+    @classmethod
+    def sidecar_key(cls, name):
+        return '{}/{}.idx'.format(cls.prefix, name)
+
+    @classmethod
+    def build_commands(cls, dump_fn, bucket):
+        """ Return the shell commands which index ``dump_fn`` (already sorted) and upload its sidecar
+
+            ``length`` only counts bytes in the C locale, which the offsets must be.
+        """
+        idx_fn = '{}.idx'.format(dump_fn)
+        return [
+            "LC_ALL=C awk -v block={} -v size=\"$(stat -c %s {})\" 'BEGIN {{ off = 0; print \"{}\" }} "
+            "NR == 1 || off - last >= block {{ print off \"\\t\" $0; last = off }} {{ off += length($0) + 1 }}' "
+            "{} > {}".format(cls.block_size, dump_fn, cls.header.format('" size "', '" block "'), dump_fn, idx_fn),
+            'aws s3 cp {} s3://{}/{} >/dev/null'.format(idx_fn, bucket, cls.sidecar_key(os.path.basename(dump_fn)))]
+
+    @classmethod
+    def build(cls, lines, size):
+        """ Return the sidecar contents for a sorted dump of ``size`` bytes made up of ``lines`` """
+        entries = [cls.header.format(size, cls.block_size)]
+        offset, last = 0, None
+        for line in lines:
+            if last is None or offset - last >= cls.block_size:
+                entries.append('{}\t{}'.format(offset, line.rstrip('\n')))
+                last = offset
+            offset += len(line.rstrip('\n')) + 1
+        return ''.join('{}\n'.format(entry) for entry in entries)
+
+    def load(self):
+        """ Fetch the sidecar, rebuilding it (a single full read of the dump) if it is missing or stale """
+        client, bucket = self.s3bucket.s3_client, self.s3bucket.cfg.s3_bucket
+        self.size = client.head_object(Bucket=bucket, Key=self.dump_key)['ContentLength']
+        try:
+            sidecar = client.get_object(Bucket=bucket, Key=self.sidecar_key(self.name))['Body'].read()
+        except botocore.exceptions.ClientError as err:
+            if err.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+                raise
+            sidecar = None
+        self.requests += 2
+        if sidecar is None or not sidecar.startswith(self.header.format(self.size, '')):
+            print("Indexing dump '{}'...".format(self.name), file=sys.stderr)
+            body = client.get_object(Bucket=bucket, Key=self.dump_key)['Body']
+            sidecar = self.build(self._iter_lines(body), self.size)
+            client.put_object(Bucket=bucket, Key=self.sidecar_key(self.name), Body=sidecar)
+            self.requests += 2
+            self.transferred += self.size
+        self.transferred += len(sidecar)
+        for entry in sidecar.split('\n')[1:-1]:
+            offset, line = entry.split('\t', 1)
+            self.offsets.append(int(offset))
+            self.lines.append(line)
+
+    def _block(self, target):
+        """ Return the index of the last block starting before ``target`` """
+        return max(0, bisect.bisect_left(self.lines, target) - 1)
+
+    def _runs(self, blocks):
+        """ Group sorted block numbers into ``(first, last)`` runs of adjacent blocks fetched together """
+        runs = []
+        for block in blocks:
+            if runs and block == runs[-1][1] + 1 and block - runs[-1][0] < self.max_run_blocks:
+                runs[-1][1] = block
+            else:
+                runs.append([block, block])
+        return runs
+
+    def _fetch(self, first, last):
+        """ Return the lines of blocks ``first`` to ``last`` (inclusive) with a single ranged GET """
+        start = self.offsets[first]
+        end = self.offsets[last + 1] - 1 if last + 1 < len(self.offsets) else self.size - 1
+        data = self.s3bucket.s3_client.get_object(Bucket=self.s3bucket.cfg.s3_bucket, Key=self.dump_key,
+                                                  Range='bytes={}-{}'.format(start, end))['Body'].read()
+        self.requests += 1
+        self.transferred += len(data)
+        lines = data.split('\n')
+        if not lines[-1]:
+            lines.pop()
+        return lines
+
+    @classmethod
+    def _iter_lines(cls, body, chunk_size=1024 * 1024):
+        """ Yield the newline terminated lines of a streaming body """
+        pending = ''
+        for chunk in iter(lambda: body.read(chunk_size), ''):
+            lines = (pending + chunk).split('\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line
+        if pending:
+            yield pending
+
+    def lookup(self, hashes):
+        """ Return a ``{hash: [dump lines]}`` dict for every hash in ``hashes`` found in the dump
+
+            Hashes falling in the same or adjacent blocks share a single ranged GET.
+        """
+        if not self.offsets:
+            self.load()
+        if not self.offsets:
+            return {}
+        pending = dict((hash_, self._block('{}:'.format(hash_))) for hash_ in set(hashes))
+        found = defaultdict(list)
+        while pending:
+            by_block = defaultdict(list)
+            for hash_, block in pending.items():
+                by_block[block].append(hash_)
+            next_pending = {}
+            for first, last in self._runs(sorted(by_block)):
+                lines = self._fetch(first, last)
+                for block in xrange(first, last + 1):
+                    for hash_ in by_block.get(block, ()):
+                        target = '{}:'.format(hash_)
+                        pos = bisect.bisect_left(lines, target)
+                        while pos < len(lines) and lines[pos].startswith(target):
+                            found[hash_].append(lines[pos])
+                            pos += 1
+                        # the matches may run on into the next block
+                        if (pos == len(lines) and last + 1 < len(self.lines) and
+                                self.lines[last + 1].startswith(target)):
+                            next_pending[hash_] = last + 1
+            pending = next_pending
+        return dict(found)
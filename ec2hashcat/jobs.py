@@ -0,0 +1,74 @@
+""" Copyright 2015 Will Boyce """
+from __future__ import print_function
+
+from collections import Counter
+from datetime import datetime
+import json
+import uuid
+
+from ec2hashcat import exceptions, worker
+
+
+class JobQueue(object):
+    """ Jobs waiting for (or being run by) worker instances, see ``ec2hashcat.worker`` for the layout """
+    prefix = worker.PREFIX
+
+    def __init__(self, s3bucket):
+        self.s3bucket = s3bucket
+        self.client = s3bucket.s3_client
+        self.bucket = s3bucket.cfg.s3_bucket
+
+    def enqueue(self, spec):
+        """ Queue the job ``spec``, returning its ID """
+        job = '{:%Y%m%d%H%M%S}-{}'.format(datetime.utcnow(), uuid.uuid4().hex[:6])
+        self.client.put_object(Bucket=self.bucket, Key='{}/{}/job.json'.format(self.prefix, job),
+                               Body=json.dumps(spec, sort_keys=True))
+        return job
+
+    def get_jobs(self):
+        paginator = self.client.get_paginator('list_objects_v2')
+        jobs = []
+        for page in paginator.paginate(Bucket=self.bucket, Prefix='{}/'.format(self.prefix), Delimiter='/'):
+            jobs.extend(prefix['Prefix'].split('/')[1] for prefix in page.get('CommonPrefixes', []))
+        return sorted(jobs)
+
+    def _get_json(self, job, name):
+        body = self.client.get_object(Bucket=self.bucket, Key='{}/{}/{}'.format(self.prefix, job, name))['Body']
+        return json.loads(body.read())
+
+    def status(self, job):
+        """ Return a summary of the progress of ``job`` """
+        spec = self._get_json(job, 'job.json')
+        keyspaces, done, claims, failed, finished = {}, set(), set(), Counter(), False
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix='{}/{}/'.format(self.prefix, job)):
+            for obj in page.get('Contents', []):
+                parts = obj['Key'].split('/')[2:]
+                if parts[0] == 'keyspace':
+                    keyspaces[parts[1]] = int(parts[2])
+                elif parts[0] == 'done':
+                    done.add(parts[1])
+                elif parts[0] == 'claims' and parts[1] != 'finish':
+                    claims.add(parts[1])
+                elif parts[0] == 'failed':
+                    failed[parts[1]] += 1
+                elif parts[0] == 'status.json':
+                    finished = True
+        chunks = [worker.chunk_id(line['line'], rng, chunk)
+                  for line, rng, chunk, start, end in worker.job_chunks(spec, keyspaces)
+                  if start is None or start != end]
+        failed = sum(1 for name in chunks if failed[name] >= worker.Worker.max_attempts and name not in done)
+        status = {'spec': spec, 'chunks': len(chunks), 'done': len(done), 'running': len(claims - done),
+                  'failed': failed,
+                  'state': 'queued' if not claims else 'running', 'cracked': None}
+        if finished:
+            result = self._get_json(job, 'status.json')
+            status.update(state=result['state'], cracked=result.get('cracked'))
+        return status
+
+    def cancel(self, job):
+        """ Stop workers from claiming further chunks of ``job`` """
+        if job not in self.get_jobs():
+            raise exceptions.S3FileNotFoundError(self.prefix, job, self.bucket)
+        self.client.put_object(Bucket=self.bucket, Key='{}/{}/status.json'.format(self.prefix, job),
+                               Body=json.dumps({'state': 'cancelled'}))
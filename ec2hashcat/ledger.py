@@ -0,0 +1,92 @@
+""" Copyright 2015 Will Boyce """
+from __future__ import print_function
+
+import hashlib
+import json
+import re
+
+
+class Ledger(object):
+    """ Record of keyspace ranges which attacks have been run through against a hashlist
+
+        Each completed range is stored as an empty object in S3 named
+        ``ledger/<hashlist etag>/<attack digest>/<skip>-<end>``, where ``end`` is empty when
+        the attack ran to the end of its keyspace.
+    """
+    prefix = 'ledger'
+    range_args_rx = re.compile(r'(?:^|\s)(-s|--skip|-l|--limit)(?:\s+|=)(\d+)')
+
+    def __init__(self, s3bucket):
+        self.s3bucket = s3bucket
+
+    @classmethod
+    def attack_digest(cls, attack_mode, hash_type, rules_digests, source_digests, hashcat_args):
+        """ Return a digest identifying an attack, independent of the hashlist it is run against """
+        data = json.dumps([str(attack_mode), str(hash_type), list(rules_digests), list(source_digests),
+                           cls.strip_range_args(hashcat_args)])
+        return hashlib.sha1(data).hexdigest()
+
+    @classmethod
+    def strip_range_args(cls, hashcat_args):
+        """ Remove any ``--skip``/``--limit`` arguments from ``hashcat_args`` """
+        return ' '.join(cls.range_args_rx.sub(' ', hashcat_args).split())
+
+    @classmethod
+    def requested_range(cls, hashcat_args):
+        """ Return the ``(start, end)`` keyspace range requested by ``hashcat_args`` """
+        args = dict((opt.lstrip('-')[0], int(val)) for opt, val in cls.range_args_rx.findall(hashcat_args))
+        start = args.get('s', 0)
+        end = start + args['l'] if 'l' in args else None
+        return start, end
+
+    def get_ranges(self, hashlist_digest, attack_digest):
+        """ Return the merged keyspace ranges already covered """
+        prefix = '{}/{}/{}/'.format(self.prefix, hashlist_digest, attack_digest)
+        ranges = []
+        for obj in self.s3bucket.bucket.objects.filter(Prefix=prefix):
+            start, end = obj.key[len(prefix):].split('-', 1)
+            ranges.append((int(start), int(end) if end else None))
+        return self.merge_ranges(ranges)
+
+    @classmethod
+    def merge_ranges(cls, ranges):
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and (merged[-1][1] is None or start <= merged[-1][1]):
+                prev_start, prev_end = merged[-1]
+                if prev_end is not None and (end is None or end > prev_end):
+                    merged[-1] = (prev_start, end)
+            else:
+                merged.append((start, end))
+        return merged
+
+    def uncovered(self, hashlist_digest, attack_digest, start=0, end=None):
+        """ Return the ``(start, end)`` ranges of the requested keyspace which have not been covered """
+        gaps, pos = [], start
+        for cov_start, cov_end in self.get_ranges(hashlist_digest, attack_digest):
+            if end is not None and cov_start >= end:
+                break
+            if cov_start > pos:
+                gaps.append((pos, cov_start))
+            if cov_end is None:
+                return gaps
+            pos = max(pos, cov_end)
+        if end is None or pos < end:
+            gaps.append((pos, end))
+        return gaps
+
+    def copy_ranges(self, from_digest, to_digest):
+        """ Record every range covered against hashlist ``from_digest`` as covered against ``to_digest`` too """
+        from_prefix = '{}/{}/'.format(self.prefix, from_digest)
+        for obj in self.s3bucket.bucket.objects.filter(Prefix=from_prefix):
+            self.s3bucket.s3_client.put_object(Bucket=self.s3bucket.cfg.s3_bucket, Body='', Key='{}/{}/{}'.format(
+                self.prefix, to_digest, obj.key[len(from_prefix):]))
+
+    def record_command(self, hashlist_digest, attack_digest, keyspace_range):
+        """ Return a shell command recording ``keyspace_range`` as covered """
+        return 'echo -n | aws s3 cp - s3://{}/{}/{}/{}/{} >/dev/null'.format(
+            self.s3bucket.cfg.s3_bucket, self.prefix, hashlist_digest, attack_digest, keyspace_range)
+
+    @classmethod
+    def format_range(cls, start, end):
+        return '{}-{}'.format(start, '' if end is None else end)
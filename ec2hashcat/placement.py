@@ -0,0 +1,118 @@
+""" Copyright 2015 Will Boyce """
+from __future__ import print_function
+
+import math
+
+from ec2hashcat import exceptions, utils
+
+
+GB = 1024 ** 3
+
+
+class DataPlacement(object):
+    """ Decide where on an instance attack data is stored, and how large its root volume must be
+
+        Data is placed on the instance store when the instance type has one large enough, otherwise in a
+        tmpfs when it fits comfortably in memory, otherwise on the root volume which is grown to fit.
+        Results, logs and merge scratch files are written alongside the data, so ``outputs`` (their size once
+        the attack has run) and ``output_floor`` (the logs and whatever the estimate misses) must also fit.
+    """
+    # instance type: (memory GiB, usable instance store GB, instance store device, NVMe)
+    instance_types = {
+        'g2.2xlarge': (15, 60, '/dev/xvdb', False),
+        'g2.8xlarge': (60, 120, '/dev/xvdb', False),
+        'g3.4xlarge': (122, 0, None, False),
+        'g3.8xlarge': (244, 0, None, False),
+        'g3.16xlarge': (488, 0, None, False),
+        'g4dn.xlarge': (16, 125, '/dev/nvme1n1', True),
+        'g4dn.2xlarge': (32, 225, '/dev/nvme1n1', True),
+        'g4dn.4xlarge': (64, 225, '/dev/nvme1n1', True),
+        'g4dn.8xlarge': (128, 900, '/dev/nvme1n1', True),
+        'g4dn.12xlarge': (192, 900, '/dev/nvme1n1', True),
+        'g4dn.16xlarge': (256, 900, '/dev/nvme1n1', True),
+        'p2.xlarge': (61, 0, None, False),
+        'p2.8xlarge': (488, 0, None, False),
+        'p2.16xlarge': (732, 0, None, False),
+        'p3.2xlarge': (61, 0, None, False),
+        'p3.8xlarge': (244, 0, None, False),
+        'p3.16xlarge': (488, 0, None, False),
+    }
+    choices = ('auto', 'root', 'instance-store', 'tmpfs')
+    root_dir = '/tmp'
+    mount_dir = '/mnt/ec2hashcat'
+    min_volume_size = 15  # GB, the size of the AMI
+    headroom = 1.1
+    output_floor = 2 * GB
+    tmpfs_memory_share = 0.5  # leave the rest of memory for hashcat and the OS
+
+    def __init__(self, instance_type, required, choice='auto', outputs=0):
+        self.instance_type = instance_type
+        self.outputs = int(outputs * self.headroom) + self.output_floor
+        self.required = int(required * self.headroom) + self.outputs
+        self.memory, self.store_size, self.store_device, self.nvme = self.instance_types.get(
+            instance_type, (0, 0, None, False))
+        self.kind = self._choose(choice)
+
+    def _choose(self, choice):
+        if choice == 'instance-store' and not self.store_size:
+            raise exceptions.Ec2HashcatInvalidArguments(
+                "instance type '{}' has no instance store".format(self.instance_type))
+        if choice == 'tmpfs' and not self.memory:
+            raise exceptions.Ec2HashcatInvalidArguments(
+                "memory of instance type '{}' is unknown, cannot size tmpfs".format(self.instance_type))
+        if choice == 'tmpfs' and not self._fits_memory():
+            print("Warning: attack data needs {}, more than tmpfs can be given on '{}', using the root volume"
+                  .format(utils.format_size(self.required), self.instance_type))
+            return 'root'
+        if choice != 'auto':
+            return choice
+        if self.store_size and self.required <= self.store_size * GB:
+            return 'instance-store'
+        if self._fits_memory():
+            return 'tmpfs'
+        return 'root'
+
+    def _fits_memory(self):
+        return self.memory and self.required <= self.memory * GB * self.tmpfs_memory_share
+
+    @classmethod
+    def ephemeral_mappings(cls, instance_type):
+        """ Return the block device mappings exposing the instance store of ``instance_type`` """
+        store_device, nvme = cls.instance_types.get(instance_type, (0, 0, None, False))[2:]
+        if store_device is None or nvme:  # NVMe instance stores are always attached
+            return []
+        return [{'DeviceName': '/dev/sdb', 'VirtualName': 'ephemeral0'}]
+
+    @property
+    def data_dir(self):
+        return self.root_dir if self.kind == 'root' else self.mount_dir
+
+    @property
+    def volume_size(self):
+        """ Root volume size (GB) required to hold the data """
+        if self.kind != 'root':
+            return self.min_volume_size
+        return self.min_volume_size + int(math.ceil(float(self.required) / GB))
+
+    def setup_commands(self):
+        """ Return the commands which prepare ``data_dir`` on the instance """
+        if self.kind == 'instance-store':
+            # cloud-init mounts non-NVMe instance stores on /mnt, NVMe ones arrive unformatted
+            return ['mountpoint -q /mnt || (sudo mkfs.ext4 -q -F {} && sudo mount {} /mnt)'.format(
+                        self.store_device, self.store_device),
+                    'sudo mkdir -p {}'.format(self.mount_dir),
+                    'sudo chown ubuntu:ubuntu {}'.format(self.mount_dir)]
+        if self.kind == 'tmpfs':
+            return ['sudo mkdir -p {}'.format(self.mount_dir),
+                    'mountpoint -q {} || sudo mount -t tmpfs -o size={}m tmpfs {}'.format(
+                        self.mount_dir, int(math.ceil(float(self.required) / 1024 ** 2)), self.mount_dir),
+                    'sudo chown ubuntu:ubuntu {}'.format(self.mount_dir)]
+        return []
+
+    def describe(self):
+        where = {
+            'instance-store': 'the instance store ({} GB)'.format(self.store_size),
+            'tmpfs': 'tmpfs ({} GiB memory)'.format(self.memory),
+            'root': 'the root volume'}[self.kind]
+        return 'Attack data needs {} ({} of it for results and logs), placing it on {} at {}'.format(
+            utils.format_size(self.required), utils.format_size(self.outputs), where, self.data_dir)
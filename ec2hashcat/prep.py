@@ -0,0 +1,100 @@
+""" Copyright 2015 Will Boyce """
+from __future__ import print_function
+
+from collections import defaultdict
+import heapq
+import os
+import shutil
+import tempfile
+
+from ec2hashcat import hashtypes
+
+
+class HashlistPrep(object):
+    """ Normalise, deduplicate and split a hashlist by format using bounded memory
+
+        Entries are stripped of whitespace and hex hashes lowercased, then buffered per format until
+        ``chunk_size`` entries are held in memory, at which point each buffer is sorted, deduplicated and
+        written out as a run. The runs for each format are finally merged into a single sorted, unique
+        hashlist.
+    """
+    chunk_size = 1000000
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size or self.chunk_size
+        self.lines = 0
+        self.blank = 0
+        self.counts = defaultdict(int)
+        self._tmpdir = None
+        self._runs = defaultdict(list)
+
+    @property
+    def unique(self):
+        return sum(self.counts.values())
+
+    @property
+    def duplicates(self):
+        return self.lines - self.blank - self.unique
+
+    @classmethod
+    def normalize(cls, line):
+        """ Return the normalised form of a hashlist entry, or ``None`` if the line is blank """
+        line = line.strip()
+        if not line:
+            return None
+        hash_, salt = hashtypes.split_hash(line)
+        if hashtypes.is_hex(hash_):
+            line = ':'.join((hash_.lower(), salt)) if salt else hash_.lower()
+        return line
+
+    def process(self, lines, output):
+        """ Process ``lines``, writing one hashlist per format and returning a ``{format: filename}`` dict
+
+            ``output`` is called with each format signature to name its hashlist.
+        """
+        self._tmpdir = tempfile.mkdtemp()
+        try:
+            buffers, buffered = defaultdict(list), 0
+            for line in lines:
+                self.lines += 1
+                line = self.normalize(line)
+                if line is None:
+                    self.blank += 1
+                    continue
+                buffers[hashtypes.signature(line)].append(line)
+                buffered += 1
+                if buffered >= self.chunk_size:
+                    self._flush(buffers)
+                    buffers, buffered = defaultdict(list), 0
+            self._flush(buffers)
+            return dict((sig, self._merge(sig, output(sig))) for sig in self._runs)
+        finally:
+            shutil.rmtree(self._tmpdir)
+
+    def _flush(self, buffers):
+        for sig, entries in buffers.iteritems():
+            run_fn = os.path.join(self._tmpdir, '{}.{}'.format(hashtypes.slug(sig), len(self._runs[sig])))
+            with open(run_fn, 'w') as run_fh:
+                run_fh.writelines('{}\n'.format(entry) for entry in sorted(set(entries)))
+            self._runs[sig].append(run_fn)
+
+    def _merge(self, sig, out_fn):
+        run_fhs = [open(run_fn) for run_fn in self._runs[sig]]
+        try:
+            with open(out_fn, 'w') as out_fh:
+                last = None
+                for entry in heapq.merge(*run_fhs):
+                    if entry != last:
+                        out_fh.write(entry)
+                        self.counts[sig] += 1
+                        last = entry
+        finally:
+            for run_fh in run_fhs:
+                run_fh.close()
+        return out_fn
+
+    def summary(self, name):
+        """ Return a one line report of the counts for hashlist ``name`` """
+        formats = ', '.join('{}: {}'.format(sig, count) for sig, count in sorted(self.counts.items()))
+        return "'{}': {} lines, {} blank, {} duplicates, {} unique ({})".format(
+            name, self.lines, self.blank, self.duplicates, self.unique, formats or 'empty')
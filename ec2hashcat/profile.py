@@ -0,0 +1,141 @@
+""" Copyright 2015 Will Boyce """
+from __future__ import print_function
+
+from collections import OrderedDict
+import json
+import threading
+import time
+
+
+class _Node(object):
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.seconds = 0.0
+        self.children = OrderedDict()
+
+    def child(self, name):
+        if name not in self.children:
+            self.children[name] = _Node(name)
+        return self.children[name]
+
+
+class _Phase(object):
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        self.profiler.push(self.name)
+
+    def __exit__(self, *exc_info):
+        self.profiler.pop(self.start, time.time())
+
+
+class _NullPhase(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class Profiler(object):
+    """ Collects a tree of timings for command phases, AWS API calls and remote (SSH) operations """
+    def __init__(self):
+        self.root = _Node('total')
+        self.started = time.time()
+        self.events = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._main_stack = None
+
+    @property
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            # worker threads (e.g. s3transfer's) attribute their calls to the main thread's current phase
+            self._local.stack = [self._main_stack[-1]] if self._main_stack is not None else [self.root]
+            if threading.current_thread().name == 'MainThread':
+                self._main_stack = self._local.stack
+        return self._local.stack
+
+    def push(self, name):
+        with self._lock:
+            self._stack.append(self._stack[-1].child(name))
+
+    def pop(self, start, end):
+        with self._lock:
+            node = self._stack.pop()
+            node.count += 1
+            node.seconds += end - start
+            self.events.append({
+                'name': node.name, 'ph': 'X', 'pid': 1, 'tid': threading.current_thread().ident,
+                'ts': int((start - self.started) * 1e6), 'dur': int((end - start) * 1e6)})
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def report(self):
+        """ Print the timing tree """
+        self.root.seconds = time.time() - self.started
+        self.root.count = 1
+        print('Profile:')
+        self._report(self.root, 0)
+
+    def _report(self, node, depth):
+        label = '{}{}'.format('  ' * depth, node.name)
+        if node.count > 1:
+            label = '{} x{}'.format(label, node.count)
+        print('  {:<60} {:>9.3f}s'.format(label, node.seconds))
+        for child in node.children.values():
+            self._report(child, depth + 1)
+
+    def write_trace(self, filename):
+        """ Write the recorded events in Chrome's trace event format """
+        with open(filename, 'w') as trace_fh:
+            json.dump({'traceEvents': self.events}, trace_fh)
+
+
+PROFILER = None
+_NULL_PHASE = _NullPhase()
+
+
+def phase(name):
+    """ Return a context manager timing ``name`` under the current phase, a no-op unless profiling """
+    if PROFILER is None:
+        return _NULL_PHASE
+    return PROFILER.phase(name)
+
+
+def _instrument(func, name):
+    def wrapper(*args, **kwargs):
+        with PROFILER.phase(name):
+            return func(*args, **kwargs)
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+def enable():
+    """ Start profiling, instrumenting every boto3 call and the SSH operations used by ``Ec2Instance`` """
+    global PROFILER  # pylint: disable=global-statement
+    if PROFILER is not None:
+        return PROFILER
+    PROFILER = Profiler()
+
+    import botocore.client
+    from ec2hashcat.aws import ec2, ssh
+
+    make_api_call = botocore.client.BaseClient._make_api_call  # pylint: disable=protected-access
+
+    def profiled_api_call(client, operation_name, api_params):
+        with PROFILER.phase('{}.{}'.format(client.meta.service_model.service_name, operation_name)):
+            return make_api_call(client, operation_name, api_params)
+    botocore.client.BaseClient._make_api_call = profiled_api_call  # pylint: disable=protected-access
+    for name in ('open_shell', 'run'):
+        setattr(ec2, name, _instrument(getattr(ec2, name), 'ssh.{}'.format(name)))
+    for name in ('open', 'put', 'run'):
+        setattr(ssh.SshConnection, name, _instrument(getattr(ssh.SshConnection, name), 'ssh.{}'.format(name)))
+    return PROFILER
@@ -0,0 +1,55 @@
+""" Copyright 2015 Will Boyce """
+from __future__ import print_function
+
+
+class RuleSet(object):
+    """ Normalise hashcat rules and drop functional duplicates, optionally across several files
+
+        Rules are split into functions using the number of parameters each takes, so that spacing between
+        functions and no-op (``:``) functions are ignored when comparing rules. Rules using functions which
+        are not known are kept verbatim.
+    """
+    arity = dict([(func, 0) for func in ':lucCtrdf{}[]kKqEM46Q'] +
+                 [(func, 1) for func in 'TpD\'$^zZ@!/()yYLR+-.,<>_e'] +
+                 [(func, 2) for func in 'xOios*=%3'] +
+                 [('X', 3)])
+
+    def __init__(self):
+        self.seen = set()
+        self.total = 0
+        self.duplicates = 0
+
+    def __len__(self):
+        return len(self.seen)
+
+    @classmethod
+    def normalize(cls, rule):
+        """ Return the canonical form of ``rule``, or ``None`` for blank lines and comments """
+        rule = rule.rstrip('\r\n')
+        if not rule.strip() or rule.startswith('#'):
+            return None
+        funcs, pos = [], 0
+        while pos < len(rule):
+            func = rule[pos]
+            if func in ' \t':
+                pos += 1
+                continue
+            if func not in cls.arity or pos + cls.arity[func] >= len(rule):
+                return rule
+            if func != ':':
+                funcs.append(rule[pos:pos + 1 + cls.arity[func]])
+            pos += 1 + cls.arity[func]
+        return ''.join(funcs) or ':'
+
+    def add(self, rules):
+        """ Yield the normalised form of each rule in ``rules`` not seen before """
+        for rule in rules:
+            rule = self.normalize(rule)
+            if rule is None:
+                continue
+            self.total += 1
+            if rule in self.seen:
+                self.duplicates += 1
+                continue
+            self.seen.add(rule)
+            yield rule
@@ -0,0 +1,161 @@
+""" Copyright 2015 Will Boyce """
+from __future__ import division, print_function
+
+import os
+import re
+
+
+class Scheduler(object):
+    """ Order a batch of attacks by estimated cost per expected crack """
+    # rough likelihood of any single candidate cracking a hash, relative to a straight dictionary attack
+    attack_yield = {
+        '0': 1.0,    # straight
+        '1': 0.1,    # combination
+        '6': 0.05,   # hybrid wordlist + mask
+        '7': 0.05,   # hybrid mask + wordlist
+        '3': 0.01,   # brute-force/mask
+    }
+    # number of rules in the cudaHashcat-1.37 builtin rule files, used when the file cannot be inspected
+    builtin_rule_counts = {
+        'best64.rule': 77,
+        'combinator.rule': 59,
+        'd3ad0ne.rule': 34101,
+        'dive.rule': 99092,
+        'generated.rule': 14728,
+        'generated2.rule': 65117,
+        'leetspeak.rule': 17,
+        'oscommerce.rule': 256,
+        'rockyou-30000.rule': 30000,
+        'specific.rule': 211,
+        'T0XlC.rule': 4085,
+        'T0XlCv1.rule': 11069,
+        'toggles1.rule': 15,
+        'toggles2.rule': 120,
+        'toggles3.rule': 575,
+        'toggles4.rule': 1940,
+        'toggles5.rule': 4943,
+    }
+    charset_sizes = {'l': 26, 'u': 26, 'd': 10, 's': 33, 'a': 95, 'b': 256}
+    default_rule_count = 1000
+    avg_word_length = 9  # including the trailing newline
+
+    def __init__(self, wordlist_sizes=None, rule_counts=None, wordlist_lines=None):
+        self.wordlist_sizes = wordlist_sizes or {}
+        self.rule_counts = rule_counts or {}
+        self.wordlist_lines = wordlist_lines or {}
+
+    @classmethod
+    def attack_key(cls, cfg):
+        """ Return a key identifying the attack performed by ``cfg`` """
+        return (cfg.target, cfg.attack_mode, cfg.hash_type, tuple(cfg.rules), cfg.hashcat_args, tuple(cfg.src))
+
+    def dedupe(self, batch):
+        """ Remove repeated attacks from ``batch``, preserving the order of first appearance """
+        seen, unique = set(), []
+        for cfg in batch:
+            key = self.attack_key(cfg)
+            if key not in seen:
+                seen.add(key)
+                unique.append(cfg)
+        return unique
+
+    def schedule(self, batch):
+        """ Return the deduplicated batch, cheapest attacks per expected crack first
+
+            An attack using a wordlist written by an earlier attack (``--make-dict``) is kept after it, as the
+            wordlist may not exist (or may not yet hold that attack's plains) until then.
+        """
+        batch = self.dedupe(batch)
+        depends = []
+        for i, cfg in enumerate(batch):
+            sources = set(os.path.basename(src) for src in cfg.src if '?' not in src)
+            depends.append(set(j for j, other in enumerate(batch[:i]) if self.generated_wordlist(other) in sources))
+        pending = sorted(range(len(batch)), key=lambda i: self.score(batch[i]))
+        scheduled, done = [], set()
+        while pending:
+            i = next(i for i in pending if depends[i] <= done)
+            pending.remove(i)
+            done.add(i)
+            scheduled.append(batch[i])
+        return scheduled
+
+    @classmethod
+    def generated_wordlist(cls, cfg):
+        """ Return the name of the wordlist ``cfg`` writes its plains to, or ``None`` """
+        if cfg.make_dict:
+            return '{}.dic'.format(os.path.basename(cfg.target).rsplit('.', 1)[0])
+        return None
+
+    def score(self, cfg):
+        """ Estimated cost (in candidates) per unit of expected yield """
+        return self.keyspace(cfg) / self.attack_yield.get(str(cfg.attack_mode), 0.01)
+
+    def keyspace(self, cfg):
+        """ Estimate the number of candidates ``cfg`` will generate """
+        masks = [src for src in cfg.src if '?' in src]
+        words = [self.wordlist_length(src) for src in cfg.src if '?' not in src]
+        mode = str(cfg.attack_mode)
+        if mode == '3':
+            keyspace = sum(self.mask_keyspace(mask, cfg.hashcat_args) for mask in masks)
+        elif mode == '1':
+            keyspace = words[0] * words[-1] if words else 0
+        elif mode in ('6', '7'):
+            keyspace = sum(words) * sum(self.mask_keyspace(mask, cfg.hashcat_args) for mask in masks)
+        else:
+            keyspace = sum(words)
+        return keyspace * self.rules_length(cfg.rules)
+
+    def wordlist_length(self, path):
+        """ Number of words in a wordlist, from its stats or else estimated from its size """
+        name = os.path.basename(path)
+        if name in self.wordlist_lines:
+            return max(1, self.wordlist_lines[name])
+        return max(1, self.wordlist_sizes.get(name, 0) // self.avg_word_length)
+
+    def rules_length(self, rules):
+        """ Number of candidates generated per word by the (chained) rules files ``rules`` """
+        length = 1
+        for name in (os.path.basename(rule) for rule in rules):
+            if name in self.rule_counts:
+                length *= self.rule_counts[name]
+            else:
+                length *= self.builtin_rule_counts.get(name, self.default_rule_count)
+        return length
+
+    @classmethod
+    def mask_keyspace(cls, mask, hashcat_args=''):
+        """ Calculate the keyspace of ``mask``, taking custom charsets and ``--increment`` into account """
+        custom = {}
+        for num, charset in re.findall(r'(?:-|--custom-charset)([1-4])[ =]+(\S+)', hashcat_args):
+            custom[num] = cls.charset_length(charset, custom)
+        positions = []
+        tokens = iter(mask)
+        for char in tokens:
+            if char == '?':
+                char = next(tokens, '?')
+                if char in custom:
+                    positions.append(custom[char])
+                else:
+                    positions.append(cls.charset_sizes.get(char, 1))
+            else:
+                positions.append(1)
+        if '--increment' in hashcat_args.split():
+            total, product = 0, 1
+            for size in positions:
+                product *= size
+                total += product
+            return total
+        return reduce(lambda x, y: x * y, positions, 1)
+
+    @classmethod
+    def charset_length(cls, charset, custom=None):
+        """ Return the number of characters described by a (custom) charset definition """
+        custom = custom or {}
+        length, tokens = 0, iter(charset)
+        for char in tokens:
+            if char == '?':
+                char = next(tokens, '?')
+                length += custom.get(char, cls.charset_sizes.get(char, 1))
+            else:
+                length += 1
+        return length
@@ -0,0 +1,171 @@
+""" Copyright 2015 Will Boyce """
+from __future__ import division, print_function
+
+from collections import Counter
+from multiprocessing import Pool
+import hashlib
+import json
+import math
+import os
+import string
+import struct
+
+import botocore
+
+
+class HyperLogLog(object):
+    """ Estimate the number of distinct lines seen in a fixed amount of memory (~0.8% error with 2^14 registers) """
+    precision = 14
+
+    def __init__(self):
+        self.count = 1 << self.precision
+        self.registers = bytearray(self.count)
+
+    def add(self, value):
+        hashed = struct.unpack('>Q', hashlib.md5(value).digest()[:8])[0]
+        register = hashed >> (64 - self.precision)
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    def estimate(self):
+        alpha = 0.7213 / (1 + 1.079 / self.count)
+        estimate = alpha * self.count ** 2 / sum(2.0 ** -rank for rank in self.registers)
+        zeros = sum(1 for rank in self.registers if not rank)
+        if estimate <= 2.5 * self.count and zeros:
+            estimate = self.count * math.log(self.count / zeros)  # linear counting for small sets
+        return int(round(estimate))
+
+
+class WordlistStats(object):
+    """ Line count, length histogram, character classes and estimated duplicates of a wordlist
+
+        Stats are collected by a separate process while the wordlist is uploaded, so that they never slow the
+        upload down, and stored in a sidecar (``index/wordlists/<wordlist>.json``) so that wordlists never have
+        to be downloaded to be sized. Character classes are those of hashcat's masks, e.g. ``?l?d`` for lowercase and digits.
+    """
+    prefix = 'index/wordlists'
+    classes = string.maketrans(
+        ''.join(chr(char) for char in range(256)),
+        ''.join('l' if chr(char) in string.ascii_lowercase else 'u' if chr(char) in string.ascii_uppercase else
+                'd' if chr(char) in string.digits else 's' for char in range(256)))
+
+    def __init__(self):
+        self.size = 0
+        self.lines = 0
+        self.lengths = Counter()
+        self.charsets = Counter()
+        self.distinct = HyperLogLog()
+        self._duplicates = None  # as loaded from a sidecar
+        self._partial = ''
+
+    @classmethod
+    def sidecar_key(cls, name):
+        return '{}/{}.json'.format(cls.prefix, name)
+
+    def feed(self, data):
+        """ Add a chunk of the wordlist, which may end part way through a line """
+        self.size += len(data)
+        lines = (self._partial + data).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            self._add(line)
+
+    def finish(self):
+        if self._partial:
+            self._add(self._partial)
+            self._partial = ''
+        return self
+
+    def _add(self, line):
+        line = line.rstrip('\r')
+        self.lines += 1
+        self.lengths[len(line)] += 1
+        self.charsets[''.join(sorted(set(line.translate(self.classes)), key='luds'.index))] += 1
+        self.distinct.add(line)
+
+    @property
+    def duplicates(self):
+        if self._duplicates is not None:
+            return self._duplicates
+        return max(0, self.lines - self.distinct.estimate())
+
+    def median_length(self):
+        seen = 0
+        for length, count in sorted(self.lengths.items()):
+            seen += count
+            if seen * 2 >= self.lines:
+                return length
+        return 0
+
+    def describe_lengths(self):
+        """ Return the range and median of the line lengths, e.g. ``1-32 (median 8)`` """
+        if not self.lines:
+            return '-'
+        return '{}-{} (median {})'.format(min(self.lengths), max(self.lengths), self.median_length())
+
+    def describe_charsets(self, top=2):
+        """ Return the most common character classes, e.g. ``?l 60%, ?l?d 30%`` """
+        if not self.lines:
+            return '-'
+        return ', '.join('{} {:.0%}'.format(''.join('?{}'.format(cls) for cls in charset) or '(empty)',
+                                            count / self.lines) for charset, count in self.charsets.most_common(top))
+
+    def dumps(self):
+        return json.dumps(dict(size=self.size, lines=self.lines, duplicates=self.duplicates,
+                               lengths=dict((str(length), count) for length, count in self.lengths.items()),
+                               charsets=dict(self.charsets)), sort_keys=True)
+
+    @classmethod
+    def loads(cls, data):
+        record = json.loads(data)
+        stats = cls()
+        stats.size, stats.lines = record['size'], record['lines']
+        stats.lengths = Counter(dict((int(length), count) for length, count in record['lengths'].items()))
+        stats.charsets = Counter(record['charsets'])
+        stats.distinct = None
+        stats._duplicates = record['duplicates']
+        return stats
+
+    @classmethod
+    def collect(cls, local_fn, blocksize=1024 * 1024):
+        stats = cls()
+        with open(local_fn, 'rb') as local_fh:
+            for data in iter(lambda: local_fh.read(blocksize), ''):
+                stats.feed(data)
+        return stats.finish()
+
+    @classmethod
+    def put(cls, s3bucket, local_fn):
+        """ Upload wordlist ``local_fn``, collecting its stats in another process and saving them alongside it """
+        pool = Pool(1)
+        try:
+            pending = pool.apply_async(_collect, (local_fn,))
+            s3bucket.put_object('wordlists', local_fn)
+            stats = pending.get()
+        finally:
+            pool.terminate()
+        stats.save(s3bucket, os.path.basename(local_fn))
+        return stats
+
+    def save(self, s3bucket, name):
+        s3bucket.s3_client.put_object(Bucket=s3bucket.cfg.s3_bucket, Key=self.sidecar_key(name), Body=self.dumps())
+
+    @classmethod
+    def load(cls, s3bucket, name, size=None):
+        """ Return the stats of wordlist ``name``, or ``None`` if they are missing or stale (not ``size`` bytes) """
+        try:
+            body = s3bucket.s3_client.get_object(Bucket=s3bucket.cfg.s3_bucket, Key=cls.sidecar_key(name))['Body']
+        except botocore.exceptions.ClientError as err:
+            if err.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+                raise
+            return None
+        stats = cls.loads(body.read())
+        if size is not None and stats.size != size:
+            return None  # the wordlist has been replaced since, e.g. by a crack session merging into it
+        return stats
+
+
+def _collect(local_fn):
+    return WordlistStats.collect(local_fn)  # a module level function, as pool workers can only call those
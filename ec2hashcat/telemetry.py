@@ -0,0 +1,139 @@
+""" Copyright 2015 Will Boyce """
+from __future__ import division, print_function
+
+from collections import defaultdict
+import os
+import re
+
+
+# the hashcat mode of each hash type in the cudaHashcat 1.37 benchmark
+BENCHMARK_MODES = {
+    'MD4': 900, 'MD5': 0, 'Half MD5': 5100, 'SHA1': 100, 'SHA256': 1400, 'SHA384': 10800, 'SHA512': 1700,
+    'SHA-3(Keccak)': 5000, 'SipHash': 10100, 'RipeMD160': 6000, 'Whirlpool': 6100, 'GOST R 34.11-94': 6900,
+    'GOST R 34.11-2012 (Streebog) 256-bit': 11700, 'GOST R 34.11-2012 (Streebog) 512-bit': 11800,
+    'phpass, MD5(Wordpress), MD5(phpBB3), MD5(Joomla)': 400, 'scrypt': 8900, 'PBKDF2-HMAC-MD5': 11900,
+    'PBKDF2-HMAC-SHA1': 12000, 'PBKDF2-HMAC-SHA256': 10900, 'PBKDF2-HMAC-SHA512': 12100, 'Skype': 23,
+    'WPA/WPA2': 2500, 'IKE-PSK MD5': 5300, 'IKE-PSK SHA1': 5400, 'NetNTLMv1-VANILLA / NetNTLMv1+ESS': 5500,
+    'NetNTLMv2': 5600, 'IPMI2 RAKP HMAC-SHA1': 7300, 'Kerberos 5 AS-REQ Pre-Auth etype 23': 7500,
+    'DNSSEC (NSEC3)': 8300, 'PostgreSQL Challenge-Response Authentication (MD5)': 11100,
+    'MySQL Challenge-Response Authentication (SHA1)': 11200, 'SIP digest authentication (MD5)': 11400,
+    'SMF > v1.1': 121, 'vBulletin < v3.8.5': 2611, 'vBulletin > v3.8.5': 2711, 'IPB2+, MyBB1.2+': 2811,
+    'WBB3, Woltlab Burning Board 3': 8400, 'Joomla < 2.5.18': 11, 'PHPS': 2612, 'Drupal7': 7900,
+    'osCommerce, xt:Commerce': 21, 'PrestaShop': 11000, 'Django (SHA-1)': 124, 'Django (PBKDF2-SHA256)': 10000,
+    'Mediawiki B type': 3711, 'Redmine Project Management Web App': 7600, 'PostgreSQL': 12, 'MSSQL(2000)': 131,
+    'MSSQL(2005)': 132, 'MSSQL(2012)': 1731, 'MySQL323': 200, 'MySQL4.1/MySQL5': 300,
+    'Oracle H: Type (Oracle 7+)': 3100, 'Oracle S: Type (Oracle 11+)': 112, 'Oracle T: Type (Oracle 12+)': 12300,
+    'Sybase ASE': 8000, 'EPiServer 6.x < v4': 141, 'EPiServer 6.x > v4': 1441,
+    'md5apr1, MD5(APR), Apache MD5': 1600, 'ColdFusion 10+': 12600, 'hMailServer': 1421,
+    'SHA-1(Base64), nsldap, Netscape LDAP SHA': 101, 'SSHA-1(Base64), nsldaps, Netscape LDAP SSHA': 111,
+    'SSHA-512(Base64), LDAP {SSHA512}': 1711, 'LM': 3000, 'NTLM': 1000,
+    'Domain Cached Credentials (DCC), MS Cache': 1100, 'Domain Cached Credentials 2 (DCC2), MS Cache 2': 2100,
+    'descrypt, DES(Unix), Traditional DES': 1500, 'BSDiCrypt, Extended DES': 12400,
+    'md5crypt, MD5(Unix), FreeBSD MD5, Cisco-IOS MD5': 500, 'bcrypt, Blowfish(OpenBSD)': 3200,
+    'sha256crypt, SHA256(Unix)': 7400, 'sha512crypt, SHA512(Unix)': 1800, 'OSX v10.4, v10.5, v10.6': 122,
+    'OSX v10.7': 1722, 'OSX v10.8+': 7100, 'AIX {smd5}': 6300, 'AIX {ssha1}': 6700, 'AIX {ssha256}': 6400,
+    'AIX {ssha512}': 6500, 'Cisco-PIX MD5': 2400, 'Cisco-ASA MD5': 2410, 'Cisco-IOS SHA256': 5700,
+    'Cisco $8$': 9200, 'Cisco $9$': 9300, 'Juniper Netscreen/SSG (ScreenOS)': 22, 'Juniper IVE': 501,
+    'Android PIN': 5800, 'Citrix NetScaler': 8100, 'RACF': 8500, 'GRUB 2': 7200, 'Radmin2': 9900,
+    'SAP CODVN B (BCODE)': 7700, 'SAP CODVN F/G (PASSCODE)': 7800, 'SAP CODVN H (PWDSALTEDHASH) iSSHA-1': 10300,
+    'Lotus Notes/Domino 5': 8600, 'Lotus Notes/Domino 6': 8700, 'Lotus Notes/Domino 8': 9100, 'PeopleSoft': 133,
+    '7-Zip': 11600, 'RAR3-hp': 12500, 'TrueCrypt 5.0+ PBKDF2-HMAC-RipeMD160 + AES': 6211,
+    'TrueCrypt 5.0+ PBKDF2-HMAC-SHA512 + AES': 6221, 'TrueCrypt 5.0+ PBKDF2-HMAC-Whirlpool + AES': 6231,
+    'TrueCrypt 5.0+ PBKDF2-HMAC-RipeMD160 + AES + boot-mode': 6241, 'Android FDE <= 4.3': 8800,
+    'eCryptfs': 12200, 'MS Office <= 2003 MD5 + RC4, oldoffice$0, oldoffice$1': 9700,
+    'MS Office <= 2003 MD5 + RC4, collision-mode #1': 9710,
+    'MS Office <= 2003 SHA1 + RC4, oldoffice$3, oldoffice$4': 9800,
+    'MS Office <= 2003 SHA1 + RC4, collision-mode #1': 9810, 'Office 2007': 9400, 'Office 2010': 9500,
+    'Office 2013': 9600, 'PDF 1.1 - 1.3 (Acrobat 2 - 4)': 10400,
+    'PDF 1.1 - 1.3 (Acrobat 2 - 4) + collider-mode #1': 10410, 'PDF 1.4 - 1.6 (Acrobat 5 - 8)': 10500,
+    'PDF 1.7 Level 3 (Acrobat 9)': 10600, 'PDF 1.7 Level 8 (Acrobat 10 - 11)': 10700, 'Password Safe v2': 9000,
+    'Password Safe v3': 5200, 'Lastpass': 6800, '1Password, agilekeychain': 6600,
+    '1Password, cloudkeychain': 8200, 'Bitcoin/Litecoin wallet.dat': 11300,
+}
+SPEED_UNITS = {'H/s': 1, 'kH/s': 1e3, 'MH/s': 1e6, 'GH/s': 1e9, 'TH/s': 1e12}
+
+
+class Benchmarks(object):
+    """ Per-GPU speed of each hash type from the cudaHashcat 1.37 benchmark of a g2.8xlarge (4x GRID K520) """
+    path = os.path.join(os.path.dirname(__file__), 'benchmarks.txt')
+    instance_types = ('g2.2xlarge', 'g2.8xlarge')  # which have the benchmarked GPU
+    speed_rx = re.compile(r'^Speed\.GPU\.#(\d+)\.*:\s+([\d.]+) (\S+)')
+
+    def __init__(self, path=None):
+        self.speeds = {}
+        hashtype, speeds = None, []
+        with open(path or self.path) as benchmarks_fh:
+            for line in benchmarks_fh:
+                if line.startswith('Hashtype: '):
+                    hashtype, speeds = line.split(': ', 1)[1].strip(), []
+                match = self.speed_rx.match(line)
+                if match is not None and hashtype in BENCHMARK_MODES:
+                    speeds.append(float(match.group(2)) * SPEED_UNITS[match.group(3)])
+                    self.speeds[BENCHMARK_MODES[hashtype]] = sum(speeds) / len(speeds)
+
+    def expected(self, hash_type, instance_type, gpus):
+        """ Return the H/s ``gpus`` GPUs of ``instance_type`` should reach for ``hash_type``, if known """
+        if instance_type not in self.instance_types or not str(hash_type).isdigit():
+            return None
+        speed = self.speeds.get(int(hash_type))
+        return None if speed is None else speed * gpus
+
+
+class Telemetry(object):
+    """ Time series of GPU utilisation, clocks and memory and of hashcat's speed, sampled during an attack
+
+        Samples are appended to a CSV file as ``<epoch>,gpu,<index>,<utilisation %>,<SM MHz>,<memory MHz>,
+        <memory used MiB>,<temperature C>`` and ``<epoch>,speed,<H/s>`` lines. The speed is taken from the
+        status hashcat prints (with ``--status``) to its log.
+    """
+    gpu_query = 'index,utilization.gpu,clocks.sm,clocks.mem,memory.used,temperature.gpu'
+
+    @classmethod
+    def sample_commands(cls):
+        """ Return commands defining ``sample_telemetry <csv> <hashcat log>`` """
+        units = '; '.join('m["{}"]={:.0f}'.format(unit, factor) for unit, factor in sorted(SPEED_UNITS.items()))
+        return [
+            'sample_telemetry() {',
+            'NOW=$(date +%s)',
+            'nvidia-smi --query-gpu={} --format=csv,noheader,nounits 2>/dev/null | '
+            'sed "s/ //g; s/^/$NOW,gpu,/" >> "$1"'.format(cls.gpu_query),
+            # hashcat redraws its status with carriage returns, so split on those as well as newlines
+            'tail -n 200 "$2" 2>/dev/null | tr "\\r" "\\n" | awk -v now=$NOW \'BEGIN {{ {} }} '
+            '/^Speed\\.GPU\\.#[0-9]/ && ($3 in m) {{ speed[$1] = $2 * m[$3] }} '
+            'END {{ for (gpu in speed) total += speed[gpu]; if (total) printf "%d,speed,%.0f\\n", now, total }}\' '
+            '>> "$1"'.format(units),
+            '}']
+
+    @classmethod
+    def start_commands(cls, csv_fn, log_fn, interval):
+        """ Return commands sampling telemetry every ``interval`` seconds in the background """
+        return ['rm -f {} {}'.format(csv_fn, log_fn),
+                '(while :; do sample_telemetry {} {}; sleep {}; done) &'.format(csv_fn, log_fn, interval),
+                'TELEMETRY_PID=$!']
+
+    @classmethod
+    def stop_commands(cls, csv_fn, log_fn, url):
+        """ Return commands stopping the sampler, taking a final sample and uploading the series to ``url`` """
+        return ['kill $TELEMETRY_PID; wait $TELEMETRY_PID 2>/dev/null',
+                'sample_telemetry {} {}'.format(csv_fn, log_fn),
+                'test -f {} && aws s3 cp {} {} >/dev/null'.format(csv_fn, csv_fn, url)]
+
+    @classmethod
+    def summarize(cls, lines):
+        """ Return the mean utilisation, clocks and memory use per GPU and the median speed of a series """
+        gpus, speeds = defaultdict(list), []
+        for line in lines:
+            fields = line.strip().split(',')
+            try:
+                if fields[1] == 'gpu' and len(fields) == 8:
+                    gpus[fields[2]].append([float(value) for value in fields[3:]])
+                elif fields[1] == 'speed' and len(fields) == 3:
+                    speeds.append(float(fields[2]))
+            except (IndexError, ValueError):
+                continue  # e.g. [Not Supported] from nvidia-smi
+        summary = {'gpus': len(gpus), 'samples': max([len(samples) for samples in gpus.values()] or [0]),
+                   'speed': sorted(speeds)[len(speeds) // 2] if speeds else None}
+        for num, field in enumerate(('utilization', 'sm_clock', 'memory_clock', 'memory_used', 'temperature')):
+            values = [sample[num] for samples in gpus.values() for sample in samples]
+            summary[field] = sum(values) / len(values) if values else None
+        return summary
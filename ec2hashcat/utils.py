@@ -2,6 +2,7 @@
 from __future__ import print_function
 
 import json
+import os
 import urllib
 
 from tabulate import tabulate
@@ -17,3 +18,25 @@ def get_external_ip():
 def print_table(table, headers=None):
     """ Print a table via ``tabulate.tabulate`` with fmt=psql """
     print(tabulate(table, headers, tablefmt='psql'))
+
+
+def format_size(size):
+    """ Return a human readable representation of ``size`` bytes """
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(size) < 1024:
+            return '{:.1f} {}'.format(size, unit)
+        size /= 1024.0
+    return '{:.1f} TB'.format(size)
+
+
+def format_throughput(size, seconds):
+    """ Return a human readable description of transferring ``size`` bytes in ``seconds`` """
+    return '{} in {:.1f}s, {}/s'.format(format_size(size), seconds, format_size(size / max(seconds, 0.001)))
+
+
+def get_state_dir(*parts):
+    """ Return (creating it if required) a directory under ``~/.ec2hashcat`` """
+    path = os.path.join(os.path.expanduser('~/.ec2hashcat'), *parts)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    return path
@@ -0,0 +1,520 @@
+#!/usr/bin/env python
+""" Copyright 2015 Will Boyce """
+from __future__ import division, print_function
+
+# This module runs standalone on worker instances, so must only depend on the standard library and botocore
+# (which the aws cli brings with it).
+
+from collections import Counter, defaultdict
+import argparse
+import calendar
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+import urllib2
+
+import botocore.session
+from botocore.exceptions import BotoCoreError, ClientError
+
+
+PREFIX = 'jobs'
+METADATA_URL = 'http://169.254.169.254/latest/meta-data'
+
+_conditions = threading.local()
+
+
+def _add_conditions(request, **kwargs):
+    for header, value in getattr(_conditions, 'headers', {}).items():
+        request.headers[header] = value
+
+
+def chunk_id(line, rng, chunk):
+    return '{:03d}-{:02d}-{:04d}'.format(line, rng, chunk)
+
+
+def chunk_range(start, end, chunk, chunks):
+    """ Return the part of the ``start`` to ``end`` keyspace covered by ``chunk`` of ``chunks`` """
+    return start + (end - start) * chunk // chunks, start + (end - start) * (chunk + 1) // chunks
+
+
+def keyspace_id(line, rng):
+    return '{:03d}-{:02d}'.format(line, rng)
+
+
+def job_chunks(spec, keyspaces):
+    """ Yield ``(line, range index, chunk index, start, end)`` for every chunk of the job
+
+        ``start`` and ``end`` are ``None`` until the keyspace of an open ended range is known.
+    """
+    for line in spec['lines']:
+        for rng, (start, end) in enumerate(line['ranges']):
+            if end is None:
+                end = keyspaces.get(keyspace_id(line['line'], rng))
+            for chunk in range(spec['chunks']):
+                if end is None:
+                    yield line, rng, chunk, None, None
+                else:
+                    yield (line, rng, chunk) + chunk_range(start, max(start, end), chunk, spec['chunks'])
+
+
+class Lease(object):
+    """ Keep a claim alive while the ``with`` block holding it runs, renewing it every ``Worker.heartbeat``
+
+        Renewals replace the claim conditionally on its ETag. One which fails (e.g. a transient S3 error) is
+        retried at the next beat, as the claim only goes stale after several; one whose ETag no longer matches
+        means another worker has stolen the claim, which is then ``lost`` and ``on_lost`` is called. The worker
+        is marked busy while it holds the claim.
+    """
+
+    def __init__(self, worker, key, etag, on_lost=None):
+        self.worker = worker
+        self.key = key
+        self.etag = etag
+        self.on_lost = on_lost
+        self.lost = threading.Event()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._keep)
+        self.thread.daemon = True
+
+    def __enter__(self):
+        self.worker.mark_busy(True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.done.set()
+        self.thread.join()
+        self.worker.mark_busy(False)
+
+    def _keep(self):
+        while not self.done.wait(self.worker.heartbeat):
+            try:
+                etag = self.worker.put_if(self.key, self.worker.claim_body(), **{'If-Match': self.etag})
+            except (BotoCoreError, ClientError) as exc:
+                self.worker.log('Could not renew {}, retrying: {}'.format(self.key, exc))
+                continue
+            if etag is None:
+                self.worker.log('Lost {} to another worker'.format(self.key))
+                self.lost.set()
+                if self.on_lost is not None:
+                    self.on_lost()
+                return
+            self.etag = etag
+
+
+class Worker(object):
+    """ Claim chunks of queued jobs, run them and, once a job's last chunk is done, merge its results
+
+        A job lives under ``jobs/<job>/``: ``job.json`` is its spec, ``claims/<chunk>`` and ``done/<chunk>`` are
+        created conditionally (``If-None-Match: *``) so that only one worker wins each chunk, and claims are
+        kept alive by a heartbeat. Claims which stop heartbeating (e.g. spot interruptions) are stolen by
+        replacing them conditionally on their ETag (``If-Match``).
+    """
+    lease = 600  # seconds without a heartbeat before a claim may be stolen
+    heartbeat = 120
+    poll = 30
+    max_attempts = 3
+
+    def __init__(self, bucket, data_dir, session, idle_exit, busy_fn=None):
+        self.client = botocore.session.get_session().create_client('s3')
+        self.client.meta.events.register('before-sign.s3.PutObject', _add_conditions)
+        self.bucket = bucket
+        self.data_dir = data_dir
+        self.session = session
+        self.idle_exit = idle_exit
+        self.busy_fn = busy_fn
+        self.specs = {}
+        self.seq = 0
+        try:
+            self.instance_id = urllib2.urlopen('{}/instance-id'.format(METADATA_URL), timeout=5).read()
+        except IOError:  # not on EC2
+            self.instance_id = os.uname()[1]
+
+    def mark_busy(self, busy):
+        """ Write (or remove) ``busy_fn``, which tells the instance's idle check a claim is being worked on """
+        if self.busy_fn is None:
+            return
+        if busy:
+            with open(self.busy_fn, 'w') as busy_fh:
+                busy_fh.write('{}\n'.format(os.getpid()))
+        elif os.path.exists(self.busy_fn):
+            os.unlink(self.busy_fn)
+
+    def log(self, message):
+        print('[{}] {}'.format(time.strftime('%Y-%m-%d %H:%M:%S'), message))
+
+    def key(self, job, *parts):
+        return '/'.join((PREFIX, job) + parts)
+
+    def put_if(self, key, body, **headers):
+        """ Put an object only if ``headers`` (e.g. ``If-None-Match``) hold, returning its ETag or ``None`` """
+        _conditions.headers = headers
+        try:
+            return self.client.put_object(Bucket=self.bucket, Key=key, Body=body)['ETag']
+        except ClientError as exc:
+            if exc.response['ResponseMetadata'].get('HTTPStatusCode') in (409, 412):
+                return None
+            raise
+        finally:
+            _conditions.headers = {}
+
+    def download(self, key, filename):
+        body = self.client.get_object(Bucket=self.bucket, Key=key)['Body']
+        with open(filename, 'wb') as file_h:
+            for chunk in iter(lambda: body.read(1024 * 1024), ''):
+                file_h.write(chunk)
+
+    def fetch(self, key, filename):
+        """ Download ``key`` to ``filename``, returning whether it exists """
+        try:
+            self.download(key, filename)
+        except ClientError as exc:
+            if exc.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+                raise
+            return False
+        return True
+
+    def upload(self, filename, key, **metadata):
+        with open(filename, 'rb') as file_h:
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=file_h, Metadata=metadata)
+
+    def list_keys(self, prefix, delimiter=None):
+        paginator = self.client.get_paginator('list_objects_v2')
+        args = dict(Bucket=self.bucket, Prefix=prefix)
+        if delimiter is not None:
+            args['Delimiter'] = delimiter
+        for page in paginator.paginate(**args):
+            for obj in page.get('Contents', []):
+                yield obj
+            for common in page.get('CommonPrefixes', []):
+                yield {'Key': common['Prefix']}
+
+    def get_jobs(self):
+        return sorted(obj['Key'].split('/')[1] for obj in self.list_keys('{}/'.format(PREFIX), '/'))
+
+    def get_spec(self, job):
+        if job not in self.specs:
+            body = self.client.get_object(Bucket=self.bucket, Key=self.key(job, 'job.json'))['Body'].read()
+            self.specs[job] = json.loads(body)
+        return self.specs[job]
+
+    def get_state(self, job):
+        """ Return what is known of ``job`` from a single listing of its prefix """
+        state = {'claims': {}, 'done': set(), 'failed': Counter(), 'keyspaces': {}, 'status': False}
+        for obj in self.list_keys(self.key(job, '')):
+            parts = obj['Key'].split('/')[2:]
+            if parts[0] == 'claims':
+                state['claims'][parts[1]] = obj
+            elif parts[0] == 'done':
+                state['done'].add(parts[1])
+            elif parts[0] == 'failed':
+                state['failed'][parts[1]] += 1
+            elif parts[0] == 'keyspace':
+                state['keyspaces'][parts[1]] = int(parts[2])
+            elif parts[0] == 'status.json':
+                state['status'] = True
+        return state
+
+    def stale(self, claim):
+        return time.time() - calendar.timegm(claim['LastModified'].utctimetuple()) > self.lease
+
+    def claim_body(self):
+        return json.dumps({'instance': self.instance_id, 'session': self.session, 'heartbeat': int(time.time())})
+
+    def claim(self):
+        """ Claim the next runnable chunk of the oldest job with one, returning ``(job, chunk, etag)`` """
+        jobs = self.get_jobs()
+        self.cleanup(jobs)
+        for job in jobs:
+            state = self.get_state(job)
+            if state['status']:
+                continue
+            spec = self.get_spec(job)
+            for line, rng, chunk, start, end in job_chunks(spec, state['keyspaces']):
+                if start is None:
+                    if state['failed'][keyspace_id(line['line'], rng)] >= self.max_attempts:
+                        continue
+                    self.find_keyspace(job, spec, line, rng)
+                    return self.claim()
+                name = chunk_id(line['line'], rng, chunk)
+                if start == end or name in state['done'] or state['failed'][name] >= self.max_attempts:
+                    continue
+                claim = state['claims'].get(name)
+                if claim is None:
+                    etag = self.put_if(self.key(job, 'claims', name), self.claim_body(), **{'If-None-Match': '*'})
+                elif self.stale(claim):
+                    etag = self.put_if(self.key(job, 'claims', name), self.claim_body(), **{'If-Match': claim['ETag']})
+                    if etag is not None:
+                        self.log('Stole chunk {} of job {}'.format(name, job))
+                else:
+                    continue
+                if etag is not None:
+                    return job, (line, rng, chunk, start, end), etag
+        return None
+
+    def job_dir(self, job):
+        return os.path.join(self.data_dir, job)
+
+    def cleanup(self, jobs):
+        """ Remove the local files of jobs which are no longer queued """
+        if not os.path.isdir(self.data_dir):
+            return
+        for name in os.listdir(self.data_dir):
+            if name not in jobs and os.path.isdir(os.path.join(self.data_dir, name)):
+                shutil.rmtree(os.path.join(self.data_dir, name), ignore_errors=True)
+
+    def shell(self, job, command, **env):
+        """ Run ``command`` with ``$DATA`` set to the job's directory, returning its exit status and output
+
+            Commands run in the C locale, as the crack script's do, so that sorting and offsets are bytewise.
+        """
+        env = dict(os.environ, DATA=self.job_dir(job), LC_ALL='C', **env)
+        proc = subprocess.Popen(['bash', '-c', command], env=env, stdout=subprocess.PIPE)
+        output = proc.communicate()[0]
+        return proc.returncode, output
+
+    def prepare(self, job, spec):
+        """ Fetch the files of ``job`` unless this worker has already done so """
+        ready_fn = os.path.join(self.job_dir(job), '.ready')
+        if os.path.isfile(ready_fn):
+            return
+        if not os.path.isdir(self.job_dir(job)):
+            os.makedirs(self.job_dir(job))
+        for key in spec['files']:
+            self.log('s3://{}/{} -> {}'.format(self.bucket, key, self.job_dir(job)))
+            self.download(key, os.path.join(self.job_dir(job), os.path.basename(key)))
+        for name, contents in spec['inline'].items():
+            with open(os.path.join(self.job_dir(job), name), 'w') as inline_fh:
+                inline_fh.write(contents.decode('base64'))
+        for line in spec['lines']:
+            for command in line['prepare']:
+                self.shell(job, command)
+        open(ready_fn, 'w').close()
+
+    def record_failure(self, job, name):
+        self.client.put_object(Bucket=self.bucket, Body='',
+                               Key=self.key(job, 'failed', name, '{}-{}'.format(self.instance_id, int(time.time()))))
+
+    def find_keyspace(self, job, spec, line, rng):
+        """ Work out the keyspace of an open ended range, sharing it with other workers """
+        self.prepare(job, spec)
+        name = keyspace_id(line['line'], rng)
+        returncode, output = self.shell(job, line['keyspace'])
+        numbers = [token for token in output.split() if token.isdigit()]
+        if returncode != 0 or not numbers:
+            self.log('Could not work out the keyspace of line {} of job {}'.format(line['line'], job))
+            self.record_failure(job, name)
+            return
+        keyspace = int(numbers[-1])
+        self.log('Keyspace of line {} of job {} is {}'.format(line['line'], job, keyspace))
+        self.client.put_object(Bucket=self.bucket, Body='',
+                               Key=self.key(job, 'keyspace', name, str(keyspace)))
+
+    def run_chunk(self, job, chunk, etag):
+        line, rng, index, start, end = chunk
+        spec = self.get_spec(job)
+        name = chunk_id(line['line'], rng, index)
+        running = []
+        # the claim is kept alive from the start, as fetching the job's files may take longer than the lease
+        with Lease(self, self.key(job, 'claims', name), etag,
+                   on_lost=lambda: [proc.terminate() for proc in running]) as lease:
+            self.prepare(job, spec)
+            if lease.lost.is_set():
+                return
+            self.log('Running chunk {} ({}-{}) of job {}'.format(name, start, end, job))
+            out_fn = os.path.join(self.job_dir(job), '{}.out'.format(name))
+            command = '{} --skip={} --limit={} --outfile={} --outfile-format=7'.format(
+                line['hashcat'], start, end - start, out_fn)
+            env = dict(os.environ, DATA=self.job_dir(job))
+            started = time.time()
+            proc = subprocess.Popen(['bash', '-c', command], env=env)
+            running.append(proc)
+            if lease.lost.is_set():  # lost while hashcat was starting
+                proc.terminate()
+            proc.wait()
+        if lease.lost.is_set():
+            return
+        # hashcat exits with 0 once all hashes are cracked and 1 once the keyspace is exhausted
+        if proc.returncode not in (0, 1):
+            self.log('Chunk {} of job {} failed with exit status {}'.format(name, job, proc.returncode))
+            self.record_failure(job, name)
+            self.client.delete_object(Bucket=self.bucket, Key=self.key(job, 'claims', name))
+            return
+        cracked = 0
+        if os.path.isfile(out_fn) and os.path.getsize(out_fn):
+            with open(out_fn) as out_fh:
+                cracked = sum(1 for _ in out_fh)
+            result_key = self.key(job, 'results', '{}.txt'.format(name))
+            self.upload(out_fn, result_key)
+            # also publish the cracks where `ec2hashcat watch` looks for them
+            self.seq += 1
+            self.client.copy_object(Bucket=self.bucket, CopySource={'Bucket': self.bucket, 'Key': result_key},
+                                    Key='cracked/{}/{:010d}-{}-{:06d}.txt'.format(
+                                        spec['session'], int(time.time()), self.instance_id, self.seq))
+        if os.path.isfile(out_fn):
+            os.unlink(out_fn)
+        self.client.put_object(Bucket=self.bucket, Body='', Key=self.ledger_key(spec, line, rng, index, start, end))
+        self.client.put_object(Bucket=self.bucket, Key=self.key(job, 'done', name), Body=json.dumps({
+            'instance': self.instance_id, 'cracked': cracked, 'seconds': int(time.time() - started)}))
+        self.log('Finished chunk {} of job {}, {} cracked'.format(name, job, cracked))
+
+    def ledger_key(self, spec, line, rng, index, start, end, hashlist_digest=None):
+        """ Return the ledger key recording that a chunk has been run """
+        # the last chunk of an open ended range covers the rest of the keyspace
+        if line['ranges'][rng][1] is None and index == spec['chunks'] - 1:
+            end = ''
+        return 'ledger/{}/{}/{}-{}'.format(hashlist_digest or line['hashlist_digest'], line['attack_digest'],
+                                          start, end)
+
+    def finish(self, job):
+        """ Merge the results of ``job`` into its hashlists, dumps and wordlists once every chunk has run """
+        state = self.get_state(job)
+        if state['status']:
+            return
+        spec = self.get_spec(job)
+        chunks = []
+        for line, rng, index, start, end in job_chunks(spec, state['keyspaces']):
+            name = chunk_id(line['line'], rng, index)
+            if start is None:
+                if state['failed'][keyspace_id(line['line'], rng)] < self.max_attempts:
+                    return
+            elif start != end and name not in state['done'] and state['failed'][name] < self.max_attempts:
+                return
+            chunks.append((line, rng, index, start, end, name in state['done']))
+        claim = state['claims'].get('finish')
+        if claim is None:
+            etag = self.put_if(self.key(job, 'claims', 'finish'), self.claim_body(), **{'If-None-Match': '*'})
+        elif self.stale(claim):
+            etag = self.put_if(self.key(job, 'claims', 'finish'), self.claim_body(), **{'If-Match': claim['ETag']})
+        else:
+            return
+        if etag is None:
+            return
+        with Lease(self, self.key(job, 'claims', 'finish'), etag) as lease:
+            self.merge_job(job, spec, chunks, lease)
+
+    def merge_job(self, job, spec, chunks, lease):
+        self.log('Merging results of job {}'.format(job))
+        self.prepare(job, spec)
+        results = defaultdict(list)
+        for obj in self.list_keys(self.key(job, 'results', '')):
+            line_no = int(obj['Key'].rsplit('/', 1)[1].split('-', 1)[0])
+            body = self.client.get_object(Bucket=self.bucket, Key=obj['Key'])['Body'].read()
+            results[line_no].extend(body.splitlines())
+        targets = defaultdict(list)
+        for line in spec['lines']:
+            targets[line['target']].append(line)
+        for target, lines in sorted(targets.items()):
+            cracked = [result for line in lines for result in results[line['line']]]
+            done = [(line, rng, index, start, end) for line, rng, index, start, end, ok in chunks
+                    if ok and start != end and line['target'] == target]
+            if lease.lost.is_set():  # another worker has taken over merging the job
+                return
+            self.merge(job, target, lines, cracked, done)
+        if lease.lost.is_set():
+            return
+        failed = sum(1 for chunk in chunks if (chunk[3] is None or chunk[3] != chunk[4]) and not chunk[5])
+        self.client.put_object(Bucket=self.bucket, Key=self.key(job, 'status.json'), Body=json.dumps({
+            'state': 'failed' if failed else 'complete', 'finished': int(time.time()), 'failed_chunks': failed,
+            'cracked': sum(len(lines) for lines in results.values())}))
+        shutil.rmtree(self.job_dir(job), ignore_errors=True)
+        self.log('Job {} {}'.format(job, 'failed' if failed else 'complete'))
+
+    def merge(self, job, target, lines, cracked, done):
+        """ Remove ``cracked`` (dump lines) from ``target`` and merge them into its dump and wordlist """
+        spec = self.get_spec(job)
+        base = target.rsplit('.', 1)[0]
+        if any(line['update_hashlist'] for line in lines):
+            hashes = set()
+            for result in cracked:
+                # dump lines are hash[:salt]:plain:hex_plain and the plain may contain colons
+                head = result.rsplit(':', 1)[0]
+                pos = head.find(':')
+                while pos != -1:
+                    hashes.add(head[:pos])
+                    pos = head.find(':', pos + 1)
+            key = 'hashlists/{}'.format(target)
+            hashlist_fn = os.path.join(self.job_dir(job), '{}.merge'.format(target))
+            if self.fetch(key, '{}.orig'.format(hashlist_fn)):
+                total = remaining = 0
+                with open('{}.orig'.format(hashlist_fn)) as orig_fh, open(hashlist_fn, 'w') as hashlist_fh:
+                    for hash_ in orig_fh:
+                        total += 1
+                        if hash_.rstrip('\n') not in hashes:
+                            remaining += 1
+                            hashlist_fh.write(hash_)
+                if not remaining:
+                    self.log('All hashes in {} cracked, deleting it'.format(target))
+                    self.client.delete_object(Bucket=self.bucket, Key=key)
+                elif remaining < total:
+                    with open(hashlist_fn, 'rb') as hashlist_fh:
+                        etag = self.client.put_object(Bucket=self.bucket, Key=key, Body=hashlist_fh)['ETag']
+                    # the remaining hashes are a subset of the original, so completed ranges carry over
+                    for line, rng, index, start, end in done:
+                        self.client.put_object(Bucket=self.bucket, Body='',
+                                               Key=self.ledger_key(spec, line, rng, index, start, end,
+                                                                   etag.strip('"')))
+        if not cracked:
+            return
+        # merged as the crack script does, on disk, as dumps and wordlists may be much larger than memory
+        if any(line['dump_cracked'] for line in lines):
+            key = 'dumps/{}.dmp'.format(base)
+            dump_fn = os.path.join(self.job_dir(job), '{}.dmp'.format(base))
+            if not self.fetch(key, '{}1'.format(dump_fn)):
+                open('{}1'.format(dump_fn), 'w').close()
+            with open('{}2'.format(dump_fn), 'w') as dump_fh:
+                dump_fh.writelines('{}\n'.format(entry) for entry in cracked)
+            self.shell(job, 'sort -u "$DUMP"1 "$DUMP"2 > "$DUMP"', DUMP=dump_fn)
+            self.upload(dump_fn, key, **{'hash-type': lines[0].get('hash_type', '')})
+            for command in lines[0]['index']:
+                self.shell(job, command)
+        if any(line['make_dict'] for line in lines):
+            key = 'wordlists/{}.dic'.format(base)
+            dict_fn = os.path.join(self.job_dir(job), '{}.dic'.format(base))
+            if not self.fetch(key, '{}1'.format(dict_fn)):
+                open('{}1'.format(dict_fn), 'w').close()
+            with open('{}2'.format(dict_fn), 'w') as dict_fh:
+                for result in cracked:
+                    try:
+                        dict_fh.write('{}\n'.format(result.rsplit(':', 1)[1].decode('hex')))
+                    except TypeError:
+                        continue
+            # most frequently cracked first, keeping plains which contain spaces whole
+            self.shell(job, 'sort "$DIC"1 "$DIC"2 | uniq -c | sort -k1,1nr -k2 | sed "s/^ *[0-9]* //" > "$DIC"',
+                       DIC=dict_fn)
+            self.upload(dict_fn, key)
+
+    def run(self):
+        self.log('Worker {} polling s3://{}/{}/'.format(self.instance_id, self.bucket, PREFIX))
+        idle_since = time.time()
+        while True:
+            claimed = self.claim()
+            if claimed is None:
+                if time.time() - idle_since >= self.idle_exit:
+                    self.log('No work for {} seconds, exiting'.format(self.idle_exit))
+                    return
+                time.sleep(self.poll)
+                continue
+            self.run_chunk(*claimed)
+            self.finish(claimed[0])
+            idle_since = time.time()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run queued ec2hashcat jobs')
+    parser.add_argument('--bucket', required=True)
+    parser.add_argument('--data-dir', default='/tmp/jobs')
+    parser.add_argument('--session', default='worker')
+    parser.add_argument('--idle-exit', type=int, default=900,
+                        help='Exit after this many seconds without any work')
+    parser.add_argument('--busy-file', default=None,
+                        help='File holding the pid of the worker while it holds a claim')
+    args = parser.parse_args()
+    Worker(args.bucket, args.data_dir, args.session, args.idle_exit, args.busy_file).run()
+
+
+if __name__ == '__main__':
+    main()
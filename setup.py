@@ -16,7 +16,7 @@ setup(
     license='License :: OSI Approved :: Apache Software License',
     install_requires=[l.strip() for l in file('requirements.in').readlines()],
     packages=find_packages(),
-    package_data={'': ['README.rst', 'LICENCE', 'requirements.in']},
+    package_data={'': ['README.rst', 'LICENCE', 'requirements.in'], 'ec2hashcat': ['benchmarks.txt']},
     include_package_data=True,
     entry_points={'console_scripts': ['ec2hashcat = ec2hashcat.cli:main']},
     platforms=[
@@ -0,0 +1,72 @@
+""" Copyright 2015 Will Boyce """
+from __future__ import print_function
+
+from argparse import Namespace
+import unittest
+
+from ec2hashcat import exceptions
+from ec2hashcat.batch import BatchCompiler
+
+
+def setup_parser(parser, final=False):
+    parser.add_argument('-a', '--attack-mode', required=final)
+    parser.add_argument('-m', '--hash-type', required=final)
+    parser.add_argument('-r', '--rules', action='append')
+    parser.add_argument('target', nargs=1 if final else '?')
+    parser.add_argument('src', nargs='*')
+
+
+def compile_lines(*lines):
+    compiler = BatchCompiler(setup_parser, Namespace(yes=True))
+    return compiler, compiler.compile(lines)
+
+
+def attacks(batch):
+    return [(cfg.attack_mode, cfg.hash_type, cfg.target[0], cfg.src) for cfg in batch]
+
+
+class BatchCompilerTest(unittest.TestCase):
+    def test_plain_lines(self):
+        _, batch = compile_lines('# comment', '', 'crack -a0 -m0 h.md5 words.dic')
+        self.assertEqual(attacks(batch), [('0', '0', 'h.md5', ['words.dic'])])
+        self.assertEqual(batch[0].lineno, 3)
+        self.assertTrue(batch[0].yes)
+
+    def test_lists(self):
+        _, batch = compile_lines('HASHES = a.md5 b.md5', 'crack -a0 -m0 {HASHES} words.dic')
+        self.assertEqual(attacks(batch), [('0', '0', 'a.md5', ['words.dic']), ('0', '0', 'b.md5', ['words.dic'])])
+
+    def test_lists_may_use_alternatives(self):
+        _, batch = compile_lines('WORDS = {rock,you}.dic extra.dic', 'crack -a0 -m0 h.md5 {WORDS}')
+        self.assertEqual([cfg.src for cfg in batch], [['rock.dic'], ['you.dic'], ['extra.dic']])
+
+    def test_alternatives(self):
+        _, batch = compile_lines('crack -a0 -m{0,100} h.{md5,sha1} words.dic')
+        self.assertEqual(attacks(batch), [('0', '0', 'h.md5', ['words.dic']), ('0', '0', 'h.sha1', ['words.dic']),
+                                          ('0', '100', 'h.md5', ['words.dic']), ('0', '100', 'h.sha1', ['words.dic'])])
+
+    def test_several_templates_in_a_token(self):
+        _, batch = compile_lines('NAME = rock', 'crack -a0 -m0 h.md5 {NAME}-{1,2}.dic')
+        self.assertEqual([cfg.src for cfg in batch], [['rock-1.dic'], ['rock-2.dic']])
+
+    def test_unknown_names_are_left_alone(self):
+        _, batch = compile_lines('crack -a3 -m0 h.md5 ?d{OTHER}')
+        self.assertEqual(batch[0].src, ['?d{OTHER}'])
+
+    def test_duplicates_are_collapsed(self):
+        compiler, batch = compile_lines('crack -a0 -m0 h.md5 {a,a}.dic', 'crack -a0 -m0 h.md5 a.dic')
+        self.assertEqual(attacks(batch), [('0', '0', 'h.md5', ['a.dic'])])
+        self.assertEqual((compiler.lines, compiler.duplicates), (2, 2))
+
+    def test_errors_name_every_bad_line(self):
+        with self.assertRaises(exceptions.BatchFileError) as context:
+            compile_lines('crack -a0 -m0 h.md5 a.dic', 'hashcat -a0 -m0 h.md5', 'crack -a0 "h.md5', 'crack -a0 h.md5')
+        message = context.exception.message
+        self.assertNotIn('line 1:', message)
+        self.assertIn("line 2: expected a 'crack' command", message)
+        self.assertIn('line 3: No closing quotation', message)
+        self.assertIn('line 4:', message)
+
+
+if __name__ == '__main__':
+    unittest.main()
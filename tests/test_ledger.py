@@ -0,0 +1,71 @@
+""" Copyright 2015 Will Boyce """
+from __future__ import print_function
+
+import unittest
+
+from ec2hashcat.ledger import Ledger
+
+
+class StaticLedger(Ledger):
+    """ Ledger whose covered ranges are given rather than listed from S3 """
+
+    def __init__(self, ranges):
+        super(StaticLedger, self).__init__(None)
+        self.ranges = ranges
+
+    def get_ranges(self, hashlist_digest, attack_digest):
+        return self.merge_ranges(self.ranges)
+
+
+class MergeRangesTest(unittest.TestCase):
+    def test_disjoint_ranges_are_sorted(self):
+        self.assertEqual(Ledger.merge_ranges([(20, 30), (0, 10)]), [(0, 10), (20, 30)])
+
+    def test_adjacent_ranges_are_joined(self):
+        self.assertEqual(Ledger.merge_ranges([(0, 10), (10, 20)]), [(0, 20)])
+
+    def test_overlapping_ranges_are_joined(self):
+        self.assertEqual(Ledger.merge_ranges([(5, 15), (0, 10)]), [(0, 15)])
+        self.assertEqual(Ledger.merge_ranges([(0, 20), (5, 10)]), [(0, 20)])
+
+    def test_open_ended_range_covers_the_rest(self):
+        self.assertEqual(Ledger.merge_ranges([(0, 10), (5, None)]), [(0, None)])
+        self.assertEqual(Ledger.merge_ranges([(0, None), (20, 30)]), [(0, None)])
+        self.assertEqual(Ledger.merge_ranges([(5, 10), (5, None)]), [(5, None)])
+
+    def test_open_ended_range_after_a_gap(self):
+        self.assertEqual(Ledger.merge_ranges([(0, 10), (20, None)]), [(0, 10), (20, None)])
+
+
+class UncoveredTest(unittest.TestCase):
+    def test_nothing_covered(self):
+        ledger = StaticLedger([])
+        self.assertEqual(ledger.uncovered('h', 'a'), [(0, None)])
+        self.assertEqual(ledger.uncovered('h', 'a', 5, 8), [(5, 8)])
+
+    def test_gaps_between_covered_ranges(self):
+        ledger = StaticLedger([(10, 20), (30, None)])
+        self.assertEqual(ledger.uncovered('h', 'a'), [(0, 10), (20, 30)])
+
+    def test_request_starting_inside_a_covered_range(self):
+        ledger = StaticLedger([(10, 20), (30, 40)])
+        self.assertEqual(ledger.uncovered('h', 'a', 15, 35), [(20, 30)])
+        self.assertEqual(ledger.uncovered('h', 'a', 15), [(20, 30), (40, None)])
+
+    def test_request_inside_a_covered_range(self):
+        ledger = StaticLedger([(10, 20), (30, None)])
+        self.assertEqual(ledger.uncovered('h', 'a', 12, 18), [])
+        self.assertEqual(ledger.uncovered('h', 'a', 35, 40), [])
+
+    def test_request_ending_before_the_next_covered_range(self):
+        ledger = StaticLedger([(10, 20), (30, None)])
+        self.assertEqual(ledger.uncovered('h', 'a', 15, 25), [(20, 25)])
+        self.assertEqual(ledger.uncovered('h', 'a', 0, 5), [(0, 5)])
+
+    def test_exhausted(self):
+        ledger = StaticLedger([(0, 10), (10, None)])
+        self.assertEqual(ledger.uncovered('h', 'a'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
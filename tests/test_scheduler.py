@@ -0,0 +1,32 @@
+""" Copyright 2015 Will Boyce """
+from __future__ import print_function
+
+from argparse import Namespace
+import unittest
+
+from ec2hashcat.scheduler import Scheduler
+
+
+def attack(target, src, make_dict=False, attack_mode=0):
+    return Namespace(target=target, src=src, make_dict=make_dict, attack_mode=attack_mode, hash_type=0,
+                     rules=[], hashcat_args='')
+
+
+class ScheduleTest(unittest.TestCase):
+    def test_cheapest_first(self):
+        big, small = attack('a.hashes', ['big.dic']), attack('a.hashes', ['small.dic'])
+        scheduler = Scheduler(wordlist_sizes={'big.dic': 9 * 10 ** 9, 'small.dic': 9000})
+        self.assertEqual(scheduler.schedule([big, small]), [small, big])
+
+    def test_generated_wordlist_used_after_it_is_made(self):
+        # clients.dic is not in S3 yet, so it would otherwise be the cheapest attack
+        make = attack('clients.hashes', ['rockyou.txt'], make_dict=True)
+        other = attack('staff.hashes', ['small.dic'])
+        use = attack('staff.hashes', ['clients.dic'])
+        scheduler = Scheduler(wordlist_sizes={'rockyou.txt': 139921497, 'small.dic': 9000})
+        scheduled = scheduler.schedule([make, other, use])
+        self.assertEqual(scheduled, [other, make, use])
+
+
+if __name__ == '__main__':
+    unittest.main()
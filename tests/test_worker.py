@@ -0,0 +1,56 @@
+""" Copyright 2015 Will Boyce """
+from __future__ import print_function
+
+import unittest
+
+from ec2hashcat.worker import chunk_range, job_chunks, keyspace_id
+
+
+def spec(ranges, chunks=4):
+    return {'chunks': chunks, 'lines': [{'line': 1, 'ranges': ranges}]}
+
+
+class ChunkRangeTest(unittest.TestCase):
+    def test_chunks_cover_the_keyspace(self):
+        for start, end, chunks in ((0, 100, 4), (7, 1000003, 8), (0, 3, 8), (5, 6, 3)):
+            bounds = [chunk_range(start, end, chunk, chunks) for chunk in range(chunks)]
+            self.assertEqual(bounds[0][0], start)
+            self.assertEqual(bounds[-1][1], end)
+            for (_, prev_end), (next_start, _) in zip(bounds, bounds[1:]):
+                self.assertEqual(prev_end, next_start)
+            self.assertEqual(sum(chunk_end - chunk_start for chunk_start, chunk_end in bounds), end - start)
+
+    def test_empty_keyspace(self):
+        self.assertEqual([chunk_range(10, 10, chunk, 4) for chunk in range(4)], [(10, 10)] * 4)
+
+
+class JobChunksTest(unittest.TestCase):
+    def bounds(self, job_spec, keyspaces=None):
+        return [(rng, chunk, start, end) for _, rng, chunk, start, end in job_chunks(job_spec, keyspaces or {})]
+
+    def test_closed_range(self):
+        self.assertEqual(self.bounds(spec([(100, 200)])),
+                         [(0, 0, 100, 125), (0, 1, 125, 150), (0, 2, 150, 175), (0, 3, 175, 200)])
+
+    def test_start_equal_to_end(self):
+        self.assertEqual(self.bounds(spec([(50, 50)], chunks=2)), [(0, 0, 50, 50), (0, 1, 50, 50)])
+
+    def test_end_before_start(self):
+        self.assertEqual(self.bounds(spec([(50, 20)], chunks=2)), [(0, 0, 50, 50), (0, 1, 50, 50)])
+
+    def test_open_range_before_keyspace_is_known(self):
+        self.assertEqual(self.bounds(spec([(0, 40), (60, None)], chunks=2)),
+                         [(0, 0, 0, 20), (0, 1, 20, 40), (1, 0, None, None), (1, 1, None, None)])
+
+    def test_open_range_once_keyspace_is_known(self):
+        keyspaces = {keyspace_id(1, 1): 100}
+        self.assertEqual(self.bounds(spec([(0, 40), (60, None)], chunks=2), keyspaces),
+                         [(0, 0, 0, 20), (0, 1, 20, 40), (1, 0, 60, 80), (1, 1, 80, 100)])
+
+    def test_open_range_starting_beyond_the_keyspace(self):
+        keyspaces = {keyspace_id(1, 0): 30}
+        self.assertEqual(self.bounds(spec([(60, None)], chunks=2), keyspaces), [(0, 0, 60, 60), (0, 1, 60, 60)])
+
+
+if __name__ == '__main__':
+    unittest.main()